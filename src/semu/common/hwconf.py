@@ -5,11 +5,27 @@ PERIPHERALS = 16
 INT_VECT_SIZE = PERIPHERALS * WORD_SIZE
 SERIAL_MM_BASE = INT_VECT_BASE + INT_VECT_SIZE  # serial device mapped memory location
 SERIAL_MM_SIZE = 4
+
 ROM_BASE = SERIAL_MM_BASE + SERIAL_MM_SIZE
 
+# Performance counters mapped memory: control word, retired, cycles, interrupts per line
+# At the top of memory, ROMs keep their addresses
+PERF_LINES = 4      # Interrupt counters of lines 0..3
+PERF_MM_SIZE = (3 + PERF_LINES) * WORD_SIZE
+PERF_MM_BASE = MEMORY_SIZE // WORD_SIZE * WORD_SIZE - PERF_MM_SIZE
+PERF_CONTROL = PERF_MM_BASE
+PERF_RETIRED = PERF_MM_BASE + WORD_SIZE
+PERF_CYCLES = PERF_MM_BASE + 2 * WORD_SIZE     # Virtual time only, zero otherwise
+PERF_INTERRUPTS = PERF_MM_BASE + 3 * WORD_SIZE
+
+# Control word commands, signalled with out PERF_LINE
+PERF_SNAPSHOT = 1   # Copy the counters into the mapped words
+PERF_RESET = 2      # Count from zero, then snapshot
+
 LOOPBACK_LINE = 0
 SYSTIMER_LINE = 1
 SERIAL_LINE = 2
+PERF_LINE = 3
 
 SERIAL_DELAY = 0.01			# Serial is much slower than UDP, that's it
 
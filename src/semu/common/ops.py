@@ -36,3 +36,84 @@ BAND = 0x29  # R1 & R2 -> R3
 # Emulated
 CPT = 0xF0  # U1 -> external breakpoint
 AEQ = 0xF1  # if R1 .ne U2 -> exit with EXIT_ASSERT_FAIL
+
+# Operand layouts
+#   r - register index
+#   s - signed constant
+#   u - unsigned constant
+#   o - signed offset relative to the operand's own address
+OPERANDS = {
+    HLT: '',
+    NOP: '',
+    JMP: 'r',
+    LDC: 'sr',
+    MRM: 'rr',
+    MMR: 'rr',
+    OUT: 'r',
+    JGT: 'rr',
+    OPN: '',
+    CLS: '',
+    LDR: 'or',
+    LSP: 'r',
+    PSH: 'r',
+    POP: 'r',
+    INT: '',
+    CLL: 'r',
+    RET: '',
+    IRX: '',
+    SSP: 'r',
+    MRR: 'rr',
+    LLA: 'rr',
+
+    ADD: 'rrr',
+    SUB: 'rrr',
+    MUL: 'rrr',
+    DIV: 'rrr',
+    MOD: 'rrr',
+    RSH: 'rrr',
+    LSH: 'rrr',
+    BOR: 'rrr',
+    XOR: 'rrr',
+    BAND: 'rrr',
+
+    CPT: 'u',
+    AEQ: 'ru'
+}
+
+# Assembler spelling, for reports and listings
+MNEMONICS = {
+    HLT: 'hlt',
+    NOP: 'nop',
+    JMP: 'jmp',
+    LDC: 'ldc',
+    MRM: 'mrm',
+    MMR: 'mmr',
+    OUT: 'out',
+    JGT: 'jgt',
+    OPN: 'opn',
+    CLS: 'cls',
+    LDR: 'ldr',
+    LSP: 'lsp',
+    PSH: 'push',
+    POP: 'pop',
+    INT: 'int',
+    CLL: 'cll',
+    RET: 'ret',
+    IRX: 'irx',
+    SSP: 'ssp',
+    MRR: 'mrr',
+    LLA: 'lla',
+
+    ADD: 'add',
+    SUB: 'sub',
+    MUL: 'mul',
+    DIV: 'div',
+    MOD: 'mod',
+    RSH: 'rsh',
+    LSH: 'lsh',
+    BOR: 'or',  # xor shares the encoding
+    BAND: 'and',
+
+    CPT: '%check',
+    AEQ: '%assert'
+}
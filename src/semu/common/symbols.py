@@ -0,0 +1,101 @@
+''' Symbol map: assembler labels resolved to memory addresses '''
+
+import bisect
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Set
+
+from semu.common.hwconf import ROM_BASE
+
+
+CODE = 'code'
+DATA = 'data'
+
+
+class Symbol(NamedTuple):
+    address: int
+    size: int       # bytes up to the next symbol
+    kind: str       # CODE or DATA
+    namespace: str
+    name: str
+
+    def qname(self) -> str:
+        return f'{self.namespace}::{self.name}'
+
+
+class SymbolMap:
+    symbols: List[Symbol]   # Sorted by address
+    addresses: List[int]
+
+    def __init__(self, symbols: Iterable[Symbol]):
+        self.symbols = sorted(symbols, key=lambda s: s.address)
+        self.addresses = [s.address for s in self.symbols]
+
+    @classmethod
+    def from_labels(cls, labels: Dict[str, int], data_labels: Set[str], rom_size: int):
+        ''' Labels are qualified names with offsets from the start of ROM '''
+        offsets = sorted(set(labels.values()))
+        symbols = []
+
+        for (qname, offset) in labels.items():
+            # Labels sharing an address all span up to the next distinct one
+            following = bisect.bisect_right(offsets, offset)
+            end = offsets[following] if following < len(offsets) else rom_size
+            (namespace, name) = qname.split('::', 1)
+            kind = DATA if qname in data_labels else CODE
+            symbols.append(Symbol(ROM_BASE + offset, end - offset, kind, namespace, name))
+
+        return cls(symbols)
+
+    def lookup(self, addr: int) -> Symbol | None:
+        ''' The closest symbol at or below addr '''
+        i = bisect.bisect_right(self.addresses, addr) - 1
+
+        if i < 0:
+            return None
+
+        return self.symbols[i]
+
+    def find(self, qname: str) -> Symbol | None:
+        for symbol in self.symbols:
+            if symbol.qname() == qname:
+                return symbol
+
+        return None
+
+    def resolve(self, addr: int) -> str:
+        symbol = self.lookup(addr)
+
+        if symbol is None:
+            return f'0x{addr:X}'
+
+        offset = addr - symbol.address
+
+        if offset == 0:
+            return symbol.qname()
+
+        return f'{symbol.qname()}+0x{offset:X}'
+
+    def code(self) -> List[Symbol]:
+        return [s for s in self.symbols if s.kind == CODE]
+
+    def save(self, path: Path):
+        lines = [
+            f'0x{s.address:08X} {s.size:6} {s.kind} {s.namespace} {s.name}'
+            for s in self.symbols
+        ]
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(lines) + '\n')
+
+    @classmethod
+    def load(cls, path: Path):
+        symbols = []
+
+        for line in path.read_text().splitlines():
+            if not line.strip():
+                continue
+
+            (address, size, kind, namespace, name) = line.split()
+            symbols.append(Symbol(int(address, 16), int(size), kind, namespace, name))
+
+        return cls(symbols)
@@ -2,6 +2,7 @@ from typing import Sequence, Callable
 import logging as lg
 
 # from semu.common.hwconf import WORD_SIZE
+import semu.common.hwconf as hw
 from semu.pseudopython.flatten import flatten
 import semu.pseudopython.registers as regs
 import semu.pseudopython.pptypes as t
@@ -97,6 +98,33 @@ class BoolToInt(ex.PhyExpression):
         return self.source.emit()
 
 
+class PerfCounter(ex.PhyExpression):
+    address: int
+
+    def __init__(self, address: int, target: regs.Register):
+        super().__init__(t.Int32, target)
+        self.address = address
+
+    def json(self):
+        data = super().json()
+        data.update({'PerfCounter': self.address})
+        return data
+
+    def emit(self) -> Sequence[str]:
+        temp = regs.get_temp([self.target])
+
+        return [
+            '// Performance counters snapshot',
+            f'ldc {hw.PERF_SNAPSHOT} {self.target}',
+            f'ldc {hw.PERF_CONTROL} {temp}',
+            f'mrm {self.target} {temp}',
+            f'ldc {hw.PERF_LINE} {self.target}',
+            f'out {self.target}',
+            f'ldc {self.address} {temp}',
+            f'mmr {temp} {self.target}'
+        ]
+
+
 def create_checkpoint(args: ex.Expressions, target: regs.Register):
     lg.debug('Checkpoint')
 
@@ -250,6 +278,24 @@ def create_ref(args: ex.Expressions, target: regs.Register):
     return ex.Retarget(source, target)
 
 
+def create_perf_counter(args: ex.Expressions, target: regs.Register):
+    lg.debug('PerfCounter')
+
+    if len(args) != 1:
+        raise UserWarning(f"'perf_counter' expects 1 argument, got {len(args)}")
+
+    arg = args[0]
+
+    if not isinstance(arg, ex.ConstantExpression) or arg.pp_type != t.Int32:
+        raise UserWarning(f"'perf_counter' expects a constant int argument, got {arg}")
+
+    # Retired instructions, cycles, then interrupts per line
+    if not 0 <= arg.value < 2 + hw.PERF_LINES:
+        raise UserWarning(f"'perf_counter' has no counter {arg.value}")
+
+    return PerfCounter(hw.PERF_RETIRED + arg.value * hw.WORD_SIZE, target)
+
+
 def get(namespace: b.INamespace) -> Sequence[b.KnownName]:
     t.Unit.parent = namespace
     t.Int32.parent = namespace
@@ -270,5 +316,6 @@ def get(namespace: b.INamespace) -> Sequence[b.KnownName]:
         BuiltinInline(namespace, 'bool_to_int', t.Int32, create_bool2int),
         BuiltinInline(namespace, 'ref', t.AbstractPointer, create_ref),
         BuiltinInline(namespace, 'deref', t.AbstractPhysical, create_deref),
-        BuiltinInline(namespace, 'refset', t.Unit, create_refset)
+        BuiltinInline(namespace, 'refset', t.Unit, create_refset),
+        BuiltinInline(namespace, 'perf_counter', t.Int32, create_perf_counter)
     ]
@@ -0,0 +1,264 @@
+''' Ahead-of-time ROM translator with an on-disk cache of generated Python modules '''
+
+import os
+import sys
+import struct
+import hashlib
+import importlib.util
+import logging as lg
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List
+
+import click
+
+from semu.common.hwconf import ROM_BASE, WORD_SIZE, MEMORY_SIZE
+from semu.common.symbols import SymbolMap, DATA
+from semu.runtime.codecache import CodeCache
+from semu.runtime.memory import Memory
+from semu.runtime.blocks import BlockBuilder, build_block
+import semu.runtime.cpu as cpu
+
+
+# Bump on any change to the generated code
+TRANSLATOR_VERSION = 5
+
+NO_SYMBOLS = 'none'
+
+HEADER = """''' Ahead-of-time translation of a semu ROM, generated by semu.runtime.aot '''
+
+from semu.runtime.blocks import BLOCK_GLOBALS
+
+globals().update(BLOCK_GLOBALS)
+
+TRANSLATOR_VERSION = {version}
+ROM_HASH = '{rom_hash}'
+LAYOUT = '{layout}'
+SYMBOLS = '{symbols}'
+"""
+
+
+def default_cache_dir() -> Path:
+    if 'SEMU_CACHE' in os.environ:
+        return Path(os.environ['SEMU_CACHE'])
+
+    return Path.home() / '.cache' / 'semu'
+
+
+def rom_hash(rom: bytes) -> str:
+    return hashlib.sha256(rom).hexdigest()
+
+
+def layout() -> str:
+    ''' Hardware configuration the generated code depends on '''
+    return f'{ROM_BASE:X}-{WORD_SIZE}-{MEMORY_SIZE:X}'
+
+
+def symbols_hash(symbols: SymbolMap | None) -> str:
+    ''' Symbols add roots to the translation and name its blocks '''
+    if symbols is None:
+        return NO_SYMBOLS
+
+    lines = [f'{s.address:X} {s.size} {s.kind} {s.qname()}' for s in sorted(symbols.symbols)]
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+
+def cache_path(cache_dir: Path, rom: bytes, symbols: SymbolMap | None = None) -> Path:
+    inputs = f'{TRANSLATOR_VERSION}-{layout()}-{symbols_hash(symbols)}'
+    key = hashlib.sha256(rom + inputs.encode()).hexdigest()
+    return cache_dir / f'rom_{key[:32]}.py'
+
+
+def static_cpu(rom: bytes) -> cpu.CPU:
+    memory = Memory()
+    memory.write_block(ROM_BASE, rom)
+    return cpu.CPU(memory, {})
+
+
+def discover(rom: bytes, symbols: SymbolMap | None) -> Dict[int, BlockBuilder]:
+    ''' Finds blocks reachable from the start of ROM, ldr references and code labels '''
+    proc = static_cpu(rom)
+    rom_end = ROM_BASE + len(rom)
+    roots = [ROM_BASE]
+    data = set()
+
+    if symbols is not None:
+        roots.extend(s.address for s in symbols.code())
+        data = {s.address for s in symbols.symbols if s.kind == DATA}
+
+    blocks: Dict[int, BlockBuilder] = dict()
+
+    while roots:
+        addr = roots.pop()
+
+        if addr in blocks or addr in data or not ROM_BASE <= addr < rom_end:
+            continue
+
+        try:
+            builder = build_block(proc, addr)
+        except (KeyError, IndexError, struct.error):
+            continue    # Not code after all
+
+        blocks[addr] = builder
+        roots.extend(builder.targets)
+
+        if builder.fallthrough is not None:
+            roots.append(builder.fallthrough)
+
+    return blocks
+
+
+def translate(rom: bytes, symbols: SymbolMap | None = None) -> str:
+    blocks = discover(rom, symbols)
+    header = HEADER.format(
+        version=TRANSLATOR_VERSION, rom_hash=rom_hash(rom), layout=layout(),
+        symbols=symbols_hash(symbols)
+    )
+    lines: List[str] = [header]
+    table: List[str] = []
+
+    for addr in sorted(blocks):
+        builder = blocks[addr]
+        name = f'block_{addr:X}'
+        lines.append('')
+
+        if symbols is not None:
+            lines.append(f'# {symbols.resolve(addr)}')
+
+        lines.append(builder.source(name))
+        table.append(f'    0x{addr:X}: ({name}, {builder.end - addr}, {builder.count}),')
+
+    lines.append('')
+    lines.append('# Start address: (function, size in bytes, instructions)')
+    lines.append('BLOCKS = {')
+    lines.extend(table)
+    lines.append('}')
+    lg.info(f'Translated {len(blocks)} blocks')
+    return '\n'.join(lines) + '\n'
+
+
+# Loaded translations by path, every machine in the process runs the same functions
+LOADED: Dict[Path, ModuleType] = dict()
+
+
+def store(rom: bytes, symbols: SymbolMap | None = None, cache_dir: Path | None = None) -> Path:
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    path = cache_path(cache_dir, rom, symbols)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Concurrent runs may translate the same ROM, the last one wins
+    temp = path.with_suffix(f'.{os.getpid()}.tmp')
+    temp.write_text(translate(rom, symbols))
+    os.replace(temp, path)
+    LOADED.pop(path, None)
+    return path
+
+
+def load(
+    rom: bytes, cache_dir: Path | None = None, symbols: SymbolMap | None = None
+) -> ModuleType | None:
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    path = cache_path(cache_dir, rom, symbols)
+
+    if path in LOADED:
+        return LOADED[path]
+
+    if not path.exists():
+        return None
+
+    # Regular import machinery keeps the compiled .pyc next to the source
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    current = (TRANSLATOR_VERSION, rom_hash(rom), layout(), symbols_hash(symbols))
+    found = (
+        module.TRANSLATOR_VERSION, module.ROM_HASH, getattr(module, 'LAYOUT', None),
+        getattr(module, 'SYMBOLS', None)
+    )
+
+    if found != current:
+        lg.info(f'Stale translation {path}')
+        return None
+
+    LOADED[path] = module
+    return module
+
+
+def load_or_translate(
+    rom: bytes, cache_dir: Path | None = None, symbols: SymbolMap | None = None
+) -> ModuleType:
+    module = load(rom, cache_dir, symbols)
+
+    if module is None:
+        store(rom, symbols, cache_dir)
+        module = load(rom, cache_dir, symbols)
+        assert module is not None
+
+    return module
+
+
+class AotEngine:
+    ''' Runs translated blocks, interprets whatever was not translated or has been overwritten '''
+    blocks: CodeCache
+
+    def __init__(self, proc: cpu.CPU, module: ModuleType, rom: bytes):
+        self.cpu = proc
+        self.blocks = CodeCache()
+        proc.code.dependents.append(self.blocks)
+
+        for (start, (func, size, count)) in module.BLOCKS.items():
+            offset = start - ROM_BASE
+
+            if proc.memory.data[start:start + size] != rom[offset:offset + size]:
+                continue    # Overwritten before a snapshot was taken
+
+            # Decoded instructions make writes into the block visible
+            addr = start
+
+            while addr < start + size:
+                (_, _, length, _) = proc.decode(addr)
+                addr += length
+
+            self.blocks.add(start, size, (func, count))
+
+    def step(self) -> int:
+        ip = self.cpu.ip
+        block = self.blocks.entries.get(ip)
+
+        if block is None:
+            self.cpu.exec_next()
+            return 1
+
+        (func, _) = block
+        retired = func(self.cpu)
+
+        if self.cpu.ip == ip and self.cpu.skip_idle:
+            self.cpu.idle_at(ip)    # Looped back to itself
+
+        return retired
+
+
+@click.command()
+@click.option('-v', '--verbose', is_flag=True, help='Sets logging level to debug')
+@click.option('-m', '--map', 'symbol_map', type=Path, help='Symbol map from the assembler')
+@click.option('--cache-dir', type=Path, help='Translation cache location')
+@click.argument('rom_filename', type=Path)
+def aot(verbose: bool, symbol_map: Path | None, cache_dir: Path | None, rom_filename: Path):
+    lg.basicConfig(level=lg.DEBUG if verbose else lg.INFO)
+    lg.info('SEMU AOT')
+
+    rom = rom_filename.read_bytes()
+    symbols = SymbolMap.load(symbol_map) if symbol_map else None
+    path = store(rom, symbols, cache_dir)
+    lg.info(f'Translation written to {path}')
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    aot()
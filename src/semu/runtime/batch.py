@@ -0,0 +1,261 @@
+''' Batch runner: many ROMs across a process pool, one JSON report '''
+
+import io
+import sys
+import json
+import hashlib
+import time
+import contextlib
+import multiprocessing
+import logging as lg
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import click
+
+from semu.common.hwconf import SERIAL_LINE
+from semu.runtime.clock import VirtualClock
+from semu.runtime.peripheral import Serial
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+import semu.runtime.coverage as coverages
+
+
+TIMEOUT = 'timeout'     # Exit reason on top of the machine's stop reasons
+
+CHUNK = 100000  # Most instructions between timeout checks
+FIRST_CHUNK = 1000  # Until the rate is measured
+CHECK_PERIOD = 0.05     # seconds between timeout checks
+
+
+class Job(NamedTuple):
+    rom: Path
+    max_instructions: int | None = None
+    timeout: float | None = None    # seconds of wall time
+    snapshot: Path | None = None
+
+
+class Settings(NamedTuple):
+    engine: str = 'interp'
+    quantum: int = 1
+    virtual_time: bool = True
+    timer_period: int = 100000
+    nop_cycles: int = 1000
+    serial_cycles: int = 100
+    skip_idle: bool = False
+    cache_dir: Path | None = None
+    coverage_dir: Path | None = None    # Coverage of each ROM, merged across its jobs
+
+
+Report = Dict[str, Any]
+
+
+def read_manifest(path: Path, defaults: Job) -> List[Job]:
+    ''' JSON list of paths or job objects, or a text file with a path per line '''
+    base = path.parent
+
+    if path.suffix == '.json':
+        entries = json.loads(path.read_text())
+    else:
+        lines = [line.strip() for line in path.read_text().splitlines()]
+        entries = [line for line in lines if line and not line.startswith('#')]
+
+    jobs = []
+
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'rom': entry}
+
+        snapshot = entry.get('snapshot')
+
+        jobs.append(Job(
+            base / entry['rom'],
+            entry.get('max_instructions', defaults.max_instructions),
+            entry.get('timeout', defaults.timeout),
+            base / snapshot if snapshot else None
+        ))
+
+    return jobs
+
+
+def next_chunk(retired: int, elapsed: float, period: float) -> int:
+    ''' Instructions that run for the period at the rate just measured '''
+    if elapsed <= 0:
+        return CHUNK
+
+    return max(1, min(CHUNK, int(retired / elapsed * period)))
+
+
+def run_job(job: Job, settings: Settings) -> Report:
+    clock = None
+
+    if settings.virtual_time:
+        clock = VirtualClock(settings.timer_period, settings.nop_cycles, settings.serial_cycles)
+
+    stdout = io.StringIO()
+    report: Report = {'rom': str(job.rom)}
+    start = time.perf_counter()
+
+    try:
+        m = machine.Machine(
+            settings.engine, settings.quantum, clock, settings.skip_idle, settings.cache_dir,
+            coverage=settings.coverage_dir is not None
+        )
+
+        serial = m.cpu.pp[SERIAL_LINE]
+        assert isinstance(serial, Serial)
+        serial.captured = []
+
+        # Checkpoints are printed to stdout
+        with m, contextlib.redirect_stdout(stdout):
+            rom = job.rom.read_bytes()
+            m.load(rom, job.snapshot)
+            remaining = job.max_instructions
+            chunk = CHUNK if job.timeout is None else FIRST_CHUNK
+
+            while True:
+                began = time.perf_counter()
+                stop = m.run(max_instructions=chunk if remaining is None else min(chunk, remaining))
+                now = time.perf_counter()
+
+                if remaining is not None:
+                    remaining -= stop.retired
+
+                if stop.reason != machine.BUDGET or remaining == 0:
+                    reason = stop.reason
+                    break
+
+                if job.timeout is not None:
+                    left = job.timeout - (now - start)
+
+                    if left < 0:
+                        reason = TIMEOUT
+                        break
+
+                    # Sized so that the next check is due within the period
+                    chunk = next_chunk(stop.retired, now - began, min(left, CHECK_PERIOD))
+
+        report.update({
+            'reason': reason,
+            'retired': m.retired,
+            'ip': stop.ip,
+            'error': stop.error,
+            'serial': ''.join(serial.captured)
+        })
+
+        if m.coverage is not None:
+            # Merged by the parent, replaced with the file name there
+            report['coverage'] = (hashlib.sha256(rom).digest(), m.coverage.bitmap(rom))
+
+    except Exception as e:
+        report.update({'reason': machine.ERROR, 'retired': 0, 'error': repr(e)})
+
+    report['wall_time'] = time.perf_counter() - start
+    report['stdout'] = stdout.getvalue()
+    return report
+
+
+def merge_coverage(reports: List[Report], coverage_dir: Path):
+    ''' One file per distinct ROM, bitmaps of its jobs ORed together '''
+    merged: Dict[bytes, Tuple[Path, Path, bytes]] = {}
+
+    for report in reports:
+        if 'coverage' not in report:
+            continue
+
+        (digest, bitmap) = report['coverage']
+        rom = Path(report['rom'])
+        path = coverage_dir / f'{rom.stem}-{digest.hex()[:8]}.cov'
+        (_, _, previous) = merged.get(digest, (path, rom, b''))
+        merged[digest] = (path, rom, coverages.merge([previous, bitmap]))
+        report['coverage'] = str(path)
+
+    coverage_dir.mkdir(parents=True, exist_ok=True)
+
+    for (path, rom, bitmap) in merged.values():
+        coverages.save(path, rom.read_bytes(), bitmap)
+
+
+def run_batch(jobs: List[Job], settings: Settings, processes: int | None = None) -> Report:
+    start = time.perf_counter()
+
+    with multiprocessing.Pool(processes) as pool:
+        reports = pool.map(partial(run_job, settings=settings), jobs, chunksize=1)
+
+    reasons: Dict[str, int] = {}
+
+    for report in reports:
+        reasons[report['reason']] = reasons.get(report['reason'], 0) + 1
+
+    if settings.coverage_dir is not None:
+        merge_coverage(reports, settings.coverage_dir)
+
+    return {
+        'jobs': reports,
+        'summary': {
+            'total': len(reports),
+            'reasons': reasons,
+            'retired': sum(report['retired'] for report in reports),
+            'wall_time': time.perf_counter() - start
+        }
+    }
+
+
+@click.command()
+@click.option('-v', '--verbose', is_flag=True, help='Sets logging level to debug')
+@click.option('--manifest', type=Path, help='JSON or text list of jobs')
+@click.option('-o', '--report', 'report_path', type=Path, help='JSON report, stdout by default')
+@click.option('-j', '--jobs', 'processes', type=click.IntRange(min=1), help='Worker processes')
+@click.option('--max-instructions', type=click.IntRange(min=1), help='Default budget per job')
+@click.option('--timeout', type=click.FloatRange(min=0), help='Default wall time per job, seconds')
+@click.option(
+    '--engine', type=click.Choice(emulator.ENGINES), default='interp', help='Execution engine'
+)
+@click.option('--cache-dir', type=Path, help='Ahead-of-time translation cache location')
+@click.option('--quantum', type=click.IntRange(min=1), default=1, help='Instructions between polls')
+@click.option('--real-time', is_flag=True, help='Host time instead of virtual time')
+@click.option(
+    '--timer-period', type=click.IntRange(min=1), default=100000, help='Virtual timer period'
+)
+@click.option('--nop-cycles', type=click.IntRange(min=0), default=1000, help='Virtual cost of nop')
+@click.option('--serial-cycles', type=click.IntRange(min=0), default=100, help='Virtual serial')
+@click.option('--skip-idle', is_flag=True, help='Wait for the next event when the guest is idle')
+@click.option('--coverage-dir', type=Path, help='Write instruction coverage per ROM')
+@click.argument('roms', nargs=-1, type=Path)
+def batch(
+    verbose: bool, manifest: Path | None, report_path: Path | None, processes: int | None,
+    max_instructions: int | None, timeout: float | None,
+    engine: str, cache_dir: Path | None, quantum: int, real_time: bool,
+    timer_period: int, nop_cycles: int, serial_cycles: int, skip_idle: bool,
+    coverage_dir: Path | None, roms: List[Path]
+):
+    lg.basicConfig(level=lg.DEBUG if verbose else lg.INFO)
+    lg.info('SEMU BATCH')
+
+    defaults = Job(Path(), max_instructions, timeout)
+    jobs = [defaults._replace(rom=rom) for rom in roms]
+
+    if manifest is not None:
+        jobs.extend(read_manifest(manifest, defaults))
+
+    settings = Settings(
+        engine, quantum, not real_time, timer_period, nop_cycles, serial_cycles,
+        skip_idle, cache_dir, coverage_dir
+    )
+
+    report = run_batch(jobs, settings, processes)
+    text = json.dumps(report, indent=2)
+
+    if report_path is None:
+        print(text)
+    else:
+        report_path.write_text(text)
+
+    summary = report['summary']
+    lg.info(f'{summary["total"]} jobs in {summary["wall_time"]:.2f}s: {summary["reasons"]}')
+    sys.exit(0 if summary['reasons'].get(machine.HALT, 0) == len(jobs) else 1)
+
+
+if __name__ == '__main__':
+    batch()
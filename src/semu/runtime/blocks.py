@@ -0,0 +1,301 @@
+''' Basic-block translation engine: guest code compiled to Python functions '''
+
+import struct
+import logging as lg
+from typing import Callable, Dict, List, Tuple
+
+import semu.common.ops as ops
+from semu.common.hwconf import WORD_SIZE
+from semu.runtime.codecache import CodeCache, SharedStore
+from semu.runtime.memory import WORD, SIGNED
+import semu.runtime.cpu as cpu
+from semu.runtime.superops import Entry
+
+
+# Instructions ending a basic block
+TERMINATORS = {ops.JMP, ops.JGT, ops.CLL, ops.RET, ops.IRX, ops.INT, ops.HLT}
+
+# Executed by the CPU's own handler with the whole state written back
+DELEGATED = {ops.OUT, ops.NOP, ops.OPN, ops.CLS, ops.CPT, ops.AEQ, ops.INT, ops.IRX, ops.HLT}
+
+ARITHMETIC = {
+    ops.ADD: '+',
+    ops.SUB: '-',
+    ops.MUL: '*',
+    ops.DIV: '//',
+    ops.MOD: '%',
+    ops.RSH: '>>',
+    ops.LSH: '<<',
+    ops.BOR: '|',
+    ops.XOR: '^',
+    ops.BAND: '&'
+}
+
+MAX_BLOCK = 64  # instructions
+
+# Names visible to the generated code
+BLOCK_GLOBALS = {
+    'pack_s': SIGNED.pack_into,
+    'pack_u': WORD.pack_into,
+    'unpack_s': SIGNED.unpack_from,
+    'unpack_u': WORD.unpack_from,
+    'WORD_SIZE': WORD_SIZE
+}
+
+# Block function returns the number of retired instructions
+Block = Tuple[Callable[[cpu.CPU], int], int]
+
+# Compiled blocks by (start address, block bytes), shared by every engine
+TRANSLATED = SharedStore(1 << 16)
+
+HANDLER_NAMES: Dict[Callable, str] = {
+    handler: handler.__name__ for handler in cpu.CPU.HANDLERS.values()
+}
+
+
+class BlockBuilder:
+    ''' Generates Python source for a single basic block '''
+    lines: List[str]
+    regs: List[int]
+    targets: List[int]      # Statically known addresses the block may pass control to
+    fallthrough: int | None
+
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.lines = []
+        self.regs = []
+        self.targets = []
+        self.fallthrough = None
+        self.count = 0
+
+    def reg(self, index: int) -> str:
+        if index not in self.regs:
+            self.regs.append(index)
+
+        return f'r{index}'
+
+    def emit(self, line: str):
+        self.lines.append('    ' + line)
+
+    def flush(self, ip: int | str) -> List[str]:
+        writeback = [f'gp[{i}] = r{i}' for i in self.regs]
+        return writeback + ['cpu.sp = sp', 'cpu.fp = fp', f'cpu.ip = {ip}']
+
+    def exit(self, ip: int | str, indent: str = ''):
+        for line in self.flush(ip):
+            self.emit(indent + line)
+
+        self.emit(f'{indent}return {self.count}')
+
+    def instruction(self, op: int, operands: Tuple[int, ...], next_ip: int, handler: str):
+        self.count += 1
+        r = self.reg
+
+        if op in DELEGATED:
+            # The handler sees the architectural state, IP past the instruction
+            for line in self.flush(next_ip):
+                self.emit(line)
+
+            args = ', '.join(str(x) for x in operands)
+
+            if op == ops.OUT:
+                # Devices may read the counters, the block is counted when it returns
+                self.emit(f'cpu.uncounted = {self.count - 1}')
+                self.emit(f'cpu.{handler}({args})')
+                self.emit('cpu.uncounted = 0')
+            else:
+                self.emit(f'cpu.{handler}({args})')
+
+            if op in TERMINATORS:
+                self.emit(f'return {self.count}')
+
+        elif op == ops.LDC or op == ops.LDR:
+            (c, r2) = operands
+            self.emit(f'{r(r2)} = {c}')
+
+            if op == ops.LDR:
+                self.targets.append(c)
+
+        elif op == ops.MRR:
+            (r1, r2) = operands
+            self.emit(f'{r(r2)} = {r(r1)}')
+
+        elif op == ops.LLA:
+            (r1, r2) = operands
+            self.emit(f'{r(r2)} = fp + {r(r1)}')
+
+        elif op in ARITHMETIC:
+            (r1, r2, r3) = operands
+            self.emit(f'{r(r3)} = {r(r1)} {ARITHMETIC[op]} {r(r2)}')
+
+        elif op == ops.MMR:
+            (r1, r2) = operands
+            self.emit(f'({r(r2)},) = unpack_s(memory, {r(r1)})')
+
+        elif op == ops.MRM:
+            (r1, r2) = operands
+            self.emit(f'm = {r(r2)}')
+            self.emit(f'pack_s(memory, m, {r(r1)})')
+            self.smc_check(next_ip)
+
+        elif op == ops.PSH:
+            (r1,) = operands
+            self.emit(f'pack_u(memory, sp, {r(r1)})')
+            self.emit('m = sp')
+            self.emit('sp += WORD_SIZE')
+            self.smc_check(next_ip)
+
+        elif op == ops.POP:
+            (r1,) = operands
+            self.emit('sp -= WORD_SIZE')
+            self.emit(f'({r(r1)},) = unpack_u(memory, sp)')
+
+        elif op == ops.SSP:
+            (r1,) = operands
+            self.emit(f'{r(r1)} = sp')
+
+        elif op == ops.LSP:
+            (r1,) = operands
+            self.emit(f'sp = {r(r1)}')
+            self.emit('cpu.switches += 1')
+
+        elif op == ops.JMP:
+            (r1,) = operands
+            self.exit(r(r1))
+
+        elif op == ops.JGT:
+            (r1, r2) = operands
+            self.emit(f'if {r(r1)} > 0:')
+            self.exit(r(r2), indent='    ')
+            self.exit(next_ip)
+
+        elif op == ops.CLL:
+            (r1,) = operands
+            self.emit(f'pack_u(memory, sp, {next_ip})')
+            self.emit('pack_u(memory, sp + WORD_SIZE, fp)')
+            self.emit('invalidate(sp, 2 * WORD_SIZE)')
+            self.emit('sp += 2 * WORD_SIZE')
+            self.emit('fp = sp')
+            self.exit(r(r1))
+
+        elif op == ops.RET:
+            self.emit('sp -= WORD_SIZE')
+            self.emit('(fp,) = unpack_u(memory, sp)')
+            self.emit('sp -= WORD_SIZE')
+            self.emit('(ip,) = unpack_u(memory, sp)')
+            self.exit('ip')
+
+        else:
+            raise Exception(f'Cannot translate operation 0x{op:X}')
+
+    def smc_check(self, next_ip: int):
+        # A store into cached code ends the block, it may have been overwritten
+        self.emit('if invalidate(m):')
+        self.exit(next_ip, indent='    ')
+
+    def source(self, name: str) -> str:
+        if self.fallthrough is not None:
+            self.exit(self.fallthrough)
+
+        prologue = [
+            f'def {name}(cpu):',
+            '    gp = cpu.gp',
+            '    memory = cpu.memory.data',
+            '    invalidate = cpu.code.invalidate',
+            '    sp = cpu.sp',
+            '    fp = cpu.fp'
+        ]
+
+        prologue.extend(f'    r{i} = gp[{i}]' for i in self.regs)
+        return '\n'.join(prologue + self.lines) + '\n'
+
+
+def scan_block(proc: cpu.CPU, start: int) -> List[Entry]:
+    ''' Decodes guest code from start up to the end of its basic block '''
+    entries: List[Entry] = []
+    addr = start
+
+    while len(entries) < MAX_BLOCK:
+        try:
+            entry = proc.decoded(addr)
+        except (KeyError, struct.error):
+            if not entries:
+                raise
+
+            break   # Stop before anything undecodable, the next dispatch will fail there
+
+        entries.append(entry)
+        addr += entry[2]
+
+        if entry[3] in TERMINATORS:
+            break
+
+    return entries
+
+
+def emit_block(start: int, entries: List[Entry]) -> BlockBuilder:
+    ''' Generates the source of a block from its decoded instructions '''
+    builder = BlockBuilder(start)
+    addr = start
+
+    for (handler, operands, length, op) in entries:
+        next_ip = addr + length
+        builder.instruction(op, operands, next_ip, HANDLER_NAMES[handler])
+        addr = next_ip
+
+        if op in [ops.JGT, ops.CLL, ops.INT]:
+            builder.targets.append(next_ip)
+
+    if entries[-1][3] not in TERMINATORS:
+        builder.fallthrough = addr
+
+    builder.end = addr
+    return builder
+
+
+def build_block(proc: cpu.CPU, start: int) -> BlockBuilder:
+    ''' Decodes and generates a block at once, ahead-of-time translation needs its targets '''
+    return emit_block(start, scan_block(proc, start))
+
+
+class BlockEngine:
+    ''' Executes guest code one basic block per dispatch '''
+    blocks: CodeCache
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.blocks = CodeCache()
+        proc.code.dependents.append(self.blocks)
+
+    def translate(self, start: int) -> Block:
+        entries = scan_block(self.cpu, start)
+        end = start + sum(entry[2] for entry in entries)
+        key = (start, bytes(self.cpu.memory.data[start:end]))
+        block = TRANSLATED.get(key)
+
+        if block is None:
+            builder = emit_block(start, entries)
+            name = f'block_{start:X}'
+            source = builder.source(name)
+            lg.debug(f'Block 0x{start:X}..0x{end:X}:\n{source}')
+            namespace = dict(BLOCK_GLOBALS)
+            exec(compile(source, f'<{name}>', 'exec'), namespace)
+            block = TRANSLATED.put(key, (namespace[name], builder.count))
+
+        return self.blocks.add(start, end - start, block)
+
+    def step(self) -> int:
+        ip = self.cpu.ip
+        block = self.blocks.entries.get(ip)
+
+        if block is None:
+            block = self.translate(ip)
+
+        (func, _) = block
+        retired = func(self.cpu)
+
+        if self.cpu.ip == ip and self.cpu.skip_idle:
+            self.cpu.idle_at(ip)    # Looped back to itself
+
+        return retired
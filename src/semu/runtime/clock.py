@@ -0,0 +1,205 @@
+''' Time sources: host time, an asyncio event loop or virtual time counted in instructions '''
+
+import time
+import heapq
+import asyncio
+import itertools
+import threading as th
+from typing import Callable, List, Tuple
+
+import semu.common.hwconf as hw
+from semu.runtime.interrupts import Interrupts
+
+
+NOP_DELAY = 0.1         # seconds
+SIGNAL_DELAY = 0.01     # lets a peripheral thread pick up the signal
+TIMER_PERIOD = 1.0
+
+Event = th.Event | asyncio.Event
+
+
+class RealClock:
+    ''' Host time, devices run on their own threads '''
+    threaded = True
+
+    def advance(self, cycles: int):
+        pass
+
+    def start_timer(self, callback: Callable[[], None]) -> th.Timer:
+        timer = th.Timer(TIMER_PERIOD, callback)
+        timer.start()
+        return timer
+
+    def event(self) -> Event:
+        return th.Event()
+
+    def nop(self):
+        time.sleep(NOP_DELAY)
+
+    def signal(self):
+        time.sleep(SIGNAL_DELAY)
+
+    def serial(self):
+        time.sleep(hw.SERIAL_DELAY)
+
+    def idle(self, interrupts: Interrupts) -> bool:
+        ''' Sleeps until an interrupt is requested '''
+        interrupts.wait(NOP_DELAY)
+        return True
+
+
+class VirtualClock:
+    ''' One cycle per retired instruction, devices run synchronously on the CPU thread '''
+    threaded = False
+    now: int    # cycles
+    events: List[Tuple[int, int, Callable[[], None]]]
+
+    def __init__(
+        self, timer_period: int = 100000, nop_cycles: int = 1000, serial_cycles: int = 100
+    ):
+        self.timer_period = timer_period
+        self.nop_cycles = nop_cycles
+        self.serial_cycles = serial_cycles
+        self.now = 0
+        self.events = []
+        self.order = itertools.count()  # same deadline, first scheduled fires first
+
+    def schedule(self, delay: int, callback: Callable[[], None]):
+        self.schedule_at(self.now + delay, callback)
+
+    def schedule_at(self, deadline: int, callback: Callable[[], None]):
+        heapq.heappush(self.events, (deadline, next(self.order), callback))
+
+    def next_event(self) -> int | None:
+        return self.events[0][0] if self.events else None
+
+    def event(self) -> Event:
+        return th.Event()
+
+    def advance(self, cycles: int):
+        self.now += cycles
+        events = self.events
+
+        while events and events[0][0] <= self.now:
+            (_, _, callback) = heapq.heappop(events)
+            callback()
+
+    def nop(self):
+        self.advance(self.nop_cycles)
+
+    def signal(self):
+        pass
+
+    def serial(self):
+        self.advance(self.serial_cycles)
+
+    def idle(self, interrupts: Interrupts) -> bool:
+        ''' Skips to the next event, False if there is nothing to wait for '''
+        deadline = self.next_event()
+
+        if deadline is None:
+            return False
+
+        if not interrupts.mask:
+            self.advance(deadline - self.now)
+
+        return True
+
+
+class LoopTimer:
+    ''' A call_later that waits for the event loop if the machine was loaded outside of it '''
+    handle: asyncio.TimerHandle | None
+
+    def __init__(self, delay: float, callback: Callable[[], None]):
+        self.delay = delay
+        self.callback = callback
+        self.handle = None
+        self.cancelled = False
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if not self.cancelled:
+            self.handle = loop.call_later(self.delay, self.callback)
+
+    def cancel(self):
+        self.cancelled = True
+
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+class AsyncClock:
+    ''' Host time kept by the running event loop, delays are paid when the CPU yields '''
+    threaded = False
+    debt: float     # seconds the guest owes to the host
+    idling: bool    # The guest waits for an interrupt
+    deferred: List[LoopTimer]   # Started before any loop was running
+
+    def __init__(self, timer_period: float = TIMER_PERIOD):
+        self.timer_period = timer_period
+        self.debt = 0.0
+        self.idling = False
+        self.wakeup = asyncio.Event()   # Bound to a loop on first use
+        self.deferred = []
+
+    def advance(self, cycles: int):
+        pass
+
+    def start_timer(self, callback: Callable[[], None]) -> LoopTimer:
+        def fire():
+            callback()
+            self.wakeup.set()
+
+        timer = LoopTimer(self.timer_period, fire)
+
+        try:
+            timer.start(asyncio.get_running_loop())
+        except RuntimeError:
+            self.deferred.append(timer)
+
+        return timer
+
+    def attach(self):
+        ''' Starts the deferred timers, on the loop running the machine '''
+        loop = asyncio.get_running_loop()
+
+        for timer in self.deferred:
+            timer.start(loop)
+
+        self.deferred.clear()
+
+    def event(self) -> Event:
+        return asyncio.Event()
+
+    def nop(self):
+        self.debt += NOP_DELAY
+
+    def signal(self):
+        pass
+
+    def serial(self):
+        self.debt += hw.SERIAL_DELAY
+
+    def idle(self, interrupts: Interrupts) -> bool:
+        self.idling = True
+        return True
+
+    async def settle(self, interrupts: Interrupts):
+        ''' Sleeps off the debt, or until the next timer event when idle '''
+        (debt, self.debt) = (self.debt, 0.0)
+
+        if self.idling and not interrupts.mask:
+            self.idling = False
+            self.wakeup.clear()
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(debt, NOP_DELAY))
+            except asyncio.TimeoutError:
+                pass
+
+            return
+
+        self.idling = False
+        await asyncio.sleep(debt)
+
+
+Clock = RealClock | VirtualClock | AsyncClock
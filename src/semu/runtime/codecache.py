@@ -0,0 +1,104 @@
+''' Cache of decoded guest code, kept coherent with memory writes '''
+
+from typing import Any, Dict, Hashable, List, Protocol, Set
+
+from semu.common.hwconf import WORD_SIZE
+
+
+class Dependent(Protocol):
+    ''' Anything derived from cached code, told when that code changes '''
+
+    def invalidate(self, addr: int, size: int = WORD_SIZE) -> bool:
+        ...
+
+    def clear(self):
+        ...
+
+
+class CodeCache:
+    ''' Entries keyed by their start address, each covering a range of guest code '''
+    entries: Dict[int, Any]
+    spans: Dict[int, int]           # start address -> size in bytes
+    words: Dict[int, Set[int]]      # word index -> start addresses of entries covering it
+    dependents: List[Dependent]     # Built on top of this one's entries
+
+    def __init__(self):
+        self.entries = dict()
+        self.spans = dict()
+        self.words = dict()
+        self.dependents = list()
+
+    def add(self, addr: int, size: int, entry: Any):
+        self.entries[addr] = entry
+        self.spans[addr] = size
+
+        for w in range(addr // WORD_SIZE, (addr + size - 1) // WORD_SIZE + 1):
+            self.words.setdefault(w, set()).add(addr)
+
+        return entry
+
+    def drop(self, addr: int):
+        self.entries.pop(addr, None)
+        size = self.spans.pop(addr, 0)
+
+        for w in range(addr // WORD_SIZE, (addr + size - 1) // WORD_SIZE + 1):
+            starts = self.words.get(w)
+
+            if starts is not None:
+                starts.discard(addr)
+
+                if not starts:
+                    del self.words[w]
+
+    def invalidate(self, addr: int, size: int = WORD_SIZE) -> bool:
+        ''' Drops every entry overlapping [addr, addr + size), returns True if there were any '''
+        words = self.words
+        first = addr // WORD_SIZE
+        last = (addr + size - 1) // WORD_SIZE
+
+        if first == last:
+            if first not in words:
+                return False
+
+            hit = [first]
+        else:
+            hit = [w for w in range(first, last + 1) if w in words]
+
+            if not hit:
+                return False
+
+        for w in hit:
+            for start in list(words.get(w, ())):
+                self.drop(start)
+
+        for dependent in self.dependents:
+            dependent.invalidate(addr, size)
+
+        return True
+
+    def clear(self):
+        self.entries.clear()
+        self.spans.clear()
+        self.words.clear()
+
+        for dependent in self.dependents:
+            dependent.clear()
+
+
+class SharedStore:
+    ''' Immutable translations shared by every machine in the process, keyed by content '''
+    items: Dict[Hashable, Any]
+
+    def __init__(self, limit: int):
+        self.items = dict()
+        self.limit = limit  # Self-modifying guests keep producing new content
+
+    def get(self, key: Hashable) -> Any:
+        return self.items.get(key)
+
+    def put(self, key: Hashable, item: Any) -> Any:
+        if len(self.items) >= self.limit:
+            self.items.clear()
+
+        self.items[key] = item
+        return item
@@ -0,0 +1,160 @@
+''' Instruction coverage: one bit per executed ROM word, merged across runs with OR '''
+
+import struct
+import hashlib
+import logging as lg
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+import click
+
+import semu.common.ops as ops
+from semu.common.hwconf import ROM_BASE, WORD_SIZE
+from semu.common.symbols import SymbolMap
+import semu.runtime.cpu as cpu
+from semu.runtime.memory import Memory
+from semu.runtime.superops import Entry
+
+
+MAGIC = b'SEMUCOVR'
+VERSION = 1
+HEADER = struct.Struct('>8sII32s')     # magic, version, ROM words, ROM SHA-256
+
+
+class Coverage:
+    ''' Marks every address an instruction starts at, one byte per address while running '''
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.hits = bytearray(len(proc.memory.data))
+
+    def hook(self, ip: int, entry: Entry):
+        self.hits[ip] = 1
+
+    def bitmap(self, rom: bytes) -> bytes:
+        ''' Bit i (most significant first) is set when the ROM word i started an instruction '''
+        words = self.hits[ROM_BASE:ROM_BASE + len(rom):WORD_SIZE]
+        return pack(words)
+
+
+def pack(flags: bytes | bytearray) -> bytes:
+    bits = bytearray((len(flags) + 7) // 8)
+
+    for (i, flag) in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 0x80 >> (i & 7)
+
+    return bytes(bits)
+
+
+def covered(bitmap: bytes, word: int) -> bool:
+    i = word >> 3
+    return i < len(bitmap) and bool(bitmap[i] & (0x80 >> (word & 7)))
+
+
+def merge(bitmaps: Iterable[bytes]) -> bytes:
+    result = bytearray()
+
+    for bitmap in bitmaps:
+        if len(bitmap) > len(result):
+            result.extend(bytes(len(bitmap) - len(result)))
+
+        for (i, bits) in enumerate(bitmap):
+            result[i] |= bits
+
+    return bytes(result)
+
+
+def save(path: Path, rom: bytes, bitmap: bytes):
+    header = HEADER.pack(MAGIC, VERSION, len(rom) // WORD_SIZE, hashlib.sha256(rom).digest())
+    path.write_bytes(header + bitmap)
+
+
+def load(path: Path) -> Tuple[bytes, bytes]:
+    ''' Returns the ROM digest and the bitmap '''
+    data = path.read_bytes()
+    (magic, version, _, digest) = HEADER.unpack_from(data)
+
+    if magic != MAGIC or version != VERSION:
+        raise Exception(f'Not a coverage file {path}')
+
+    return (digest, data[HEADER.size:])
+
+
+def instructions(memory: Memory, start: int, end: int) -> List[int]:
+    ''' Instruction addresses from a linear sweep, undecodable words are skipped '''
+    result = []
+    addr = start
+
+    while addr < end:
+        op = memory.read_word(addr)
+
+        if op not in ops.OPERANDS:
+            addr += WORD_SIZE
+            continue
+
+        result.append(addr)
+        addr += WORD_SIZE * (1 + len(ops.OPERANDS[op]))
+
+    return result
+
+
+def report(rom: bytes, bitmap: bytes, symbols: SymbolMap) -> str:
+    memory = Memory()
+    memory.write_block(ROM_BASE, rom)
+    lines = []
+    (total, hit) = (0, 0)
+
+    # Code ahead of the first label has no name of its own
+    first = symbols.addresses[0] if symbols.addresses else ROM_BASE + len(rom)
+    regions = [(ROM_BASE, first, f'0x{ROM_BASE:X}')]
+    regions.extend([(s.address, s.address + s.size, s.qname()) for s in symbols.code()])
+
+    for (start, end, name) in regions:
+        addrs = instructions(memory, start, end)
+
+        if not addrs:
+            continue
+
+        n = sum(covered(bitmap, (addr - ROM_BASE) // WORD_SIZE) for addr in addrs)
+        lines.append(f'{n:6}/{len(addrs):<6} {100 * n / len(addrs):6.1f}%  {name}')
+        total += len(addrs)
+        hit += n
+
+    percent = 100 * hit / total if total else 0.0
+    lines.append(f'{hit:6}/{total:<6} {percent:6.1f}%  total')
+    return '\n'.join(lines) + '\n'
+
+
+@click.command()
+@click.option('-m', '--map', 'symbol_map', type=Path, required=True, help='Symbol map')
+@click.option('-o', '--output', type=Path, help='Write the merged coverage')
+@click.argument('rom_filename', type=Path)
+@click.argument('coverage_files', nargs=-1, type=Path)
+def coverage(
+    symbol_map: Path, output: Path | None, rom_filename: Path, coverage_files: List[Path]
+):
+    ''' Merges coverage files of a ROM and reports it per label '''
+    lg.basicConfig(level=lg.INFO)
+    rom = rom_filename.read_bytes()
+    digest = hashlib.sha256(rom).digest()
+    bitmaps = []
+
+    for path in coverage_files:
+        (other, bitmap) = load(path)
+
+        if other != digest:
+            raise click.BadParameter(f'{path} was collected from another ROM')
+
+        bitmaps.append(bitmap)
+
+    merged = merge(bitmaps)
+
+    if output is not None:
+        save(output, rom, merged)
+
+    print(report(rom, merged, SymbolMap.load(symbol_map)), end='')
+
+
+if __name__ == '__main__':
+    coverage()
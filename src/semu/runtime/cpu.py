@@ -1,13 +1,21 @@
-import struct
-import time
 import logging as lg
-from typing import Callable
+from typing import Callable, Dict, List, Set
 
 
 import semu.common.ops as ops
 from semu.runtime.peripheral import Peripherals
+from semu.runtime.interrupts import Interrupts
+from semu.runtime.memory import Memory, WORD, SIGNED
+from semu.runtime.codecache import CodeCache, SharedStore
+from semu.runtime.clock import Clock, RealClock
+import semu.runtime.superops as superops
+from semu.runtime.idle import IdleDetector
 
-from semu.common.hwconf import ROM_BASE, INT_VECT_BASE, WORD_SIZE
+from semu.common.hwconf import ROM_BASE, INT_VECT_BASE, WORD_SIZE, PERIPHERALS
+
+
+# Decoded instructions by (address, instruction bytes), the same for every CPU
+DECODED = SharedStore(1 << 20)
 
 
 class Halt(Exception):
@@ -25,10 +33,34 @@ class CPU():
     fp: int  # Frame pointer
     gp: list[int]  # General purpose registers
 
-    def __init__(self, memory: bytearray, pp: Peripherals):
+    def __init__(
+        self, memory: Memory, pp: Peripherals,
+        interrupts: Interrupts | None = None, quantum: int = 1, clock: Clock | None = None,
+        skip_idle: bool = False
+    ):
         self.memory = memory    # Ref. to memory
         self.pp = pp            # Ref. to Peripherals
 
+        # Pending lines are polled every quantum instructions
+        self.interrupts = interrupts if interrupts is not None else Interrupts()
+        self.quantum = quantum
+        self.countdown = quantum
+        self.retired = 0        # Instructions, counted by tick() and the fused loop
+        self.delivered = [0] * PERIPHERALS  # Interrupts per line
+        self.switches = 0       # Stacks loaded by lsp, context switches
+        self.uncounted = 0      # Retired ahead of a running handler, not counted yet
+        self.frames: Set[int] = set()   # FP of interrupt frames not yet left with irx
+
+        # Instruments, called with the address and entry before each interpreted instruction
+        self.hooks: List[Callable[[int, superops.Entry], None]] = []
+
+        # Virtual time advances at polls by the instructions retired since the last one
+        self.clock = clock if clock is not None else RealClock()
+
+        # Idle guest waits for the next event instead of spinning
+        self.skip_idle = skip_idle
+        self.idle_detector = IdleDetector(self)
+
         self.ip = ROM_BASE      # Execution start from the beginning of ROM
         self.sp = 0             # Set when lsp is called
         self.ii = 0x01          # Interrupt inhibit
@@ -36,6 +68,15 @@ class CPU():
 
         self.gp = [0] * 8
 
+        # Decoded instructions: address -> (handler, operands, length, opcode)
+        self.code = memory.code
+
+        # Same for the fused loop, superinstructions included
+        self.predecoded = CodeCache()
+        self.code.dependents.append(self.predecoded)
+        self.code.dependents.append(self.idle_detector)
+        self.loop = self.fused_loop()
+
     # - Helpers - $
 
     def debug_dump(self):
@@ -50,109 +91,154 @@ class CPU():
         state.extend([f'{chr(a + i)}:{self.gp[i]}' for i in range(len(self.gp))])
         lg.debug(' '.join(state))
 
-    def next_fmt(self, fmt: str):
-        addr = self.ip
-        buf = self.memory[addr:addr + WORD_SIZE]
-        (op,) = struct.unpack(fmt, buf)
-        self.ip += WORD_SIZE
-        return op
+    def fetch_operand(self, kind: str, addr: int) -> int:
+        if kind == 'r' or kind == 'u':
+            return self.memory.read_word(addr)
+
+        value = self.memory.read_signed(addr)
+
+        if kind == 'o':
+            value += addr   # Relative to the operand itself
+
+        return value
+
+    def decode(self, addr: int, cache: bool = True):
+        ''' Lookahead that may turn out to be data is not cached, in neither store '''
+        op = self.memory.read_word(addr)
+        handler = self.HANDLERS[op]
+        kinds = ops.OPERANDS[op]
+        length = WORD_SIZE * (1 + len(kinds))
+        key = (addr, bytes(self.memory.data[addr:addr + length]))
+        entry = DECODED.get(key)
+
+        if entry is None:
+            operands = []
+            p = addr + WORD_SIZE
+
+            for kind in kinds:
+                operands.append(self.fetch_operand(kind, p))
+                p += WORD_SIZE
+
+            entry = (handler, tuple(operands), length, op)
+
+            if cache:
+                DECODED.put(key, entry)
+
+        return self.code.add(addr, length, entry) if cache else entry
 
-    def next_unsigned(self) -> int:
-        return self.next_fmt(">I")
+    def decoded(self, addr: int):
+        entry = self.code.entries.get(addr)
+        return entry if entry is not None else self.decode(addr)
 
-    def next_signed(self) -> int:
-        return self.next_fmt(">i")
+    def peek(self, addr: int):
+        entry = self.code.entries.get(addr)
+        return entry if entry is not None else self.decode(addr, cache=False)
 
-    def next(self):
-        return self.next_unsigned()
+    def predecode(self, addr: int):
+        entry = self.decoded(addr)
+        fused = superops.fuse(self.peek, addr, entry)
 
-    def set_next_gp(self, val: int):
-        self.gp[self.next()] = val
+        if fused is not None:
+            # Cached once matched, writes to any of its instructions reach the fused entry
+            p = addr + entry[2]
 
-    def get_next_gp(self):
-        return self.gp[self.next()]
+            while p < addr + fused[2]:
+                p += self.decoded(p)[2]
 
-    def arithm_pair(self, op: Callable[[int, int], int]):
-        a = self.get_next_gp()
-        b = self.get_next_gp()
-        self.set_next_gp(op(a, b))
+            entry = fused
+
+        return self.predecoded.add(addr, entry[2], entry)
+
+    def arithm_pair(self, op: Callable[[int, int], int], r1: int, r2: int, r3: int):
+        a = self.gp[r1]
+        b = self.gp[r2]
+        self.gp[r3] = op(a, b)
 
     def do_push(self, val: int):
         m = self.sp
-        self.memory[m:m + WORD_SIZE] = struct.pack(">I", val)
+        self.memory.write_word(m, val)
         self.sp += WORD_SIZE
 
     def do_pop(self) -> int:
         self.sp -= WORD_SIZE
         m = self.sp
-        (v,) = struct.unpack(">I", self.memory[m:m + WORD_SIZE])
-        return v
+        return self.memory.read_word(m)
 
     # - Operations - #
 
+    # Operands come predecoded, IP already points to the next instruction
+
     def nop(self):
-        time.sleep(0.1)
+        if self.skip_idle and self.ii == 0 and self.clock.idle(self.interrupts):
+            return
+
+        self.clock.nop()
 
     def hlt(self):
         raise Halt()
 
-    def jmp(self):
-        addr = self.get_next_gp()
+    def jmp(self, r1: int):
+        addr = self.gp[r1]
+        backward = addr < self.ip
         self.ip = addr
 
-    def ldc(self):
-        a = self.next_signed()
-        self.set_next_gp(a)
+        if self.skip_idle and backward:
+            self.idle_at(addr)
 
-    def mrm(self):
-        v = self.get_next_gp()
-        m = self.get_next_gp()
-        self.memory[m:m + WORD_SIZE] = struct.pack(">i", v)
+    def ldc(self, a: int, r2: int):
+        self.gp[r2] = a
 
-    def mmr(self):
-        a = self.get_next_gp()
-        (v,) = struct.unpack(">i", self.memory[a:a + WORD_SIZE])
-        self.set_next_gp(v)
+    def mrm(self, r1: int, r2: int):
+        v = self.gp[r1]
+        m = self.gp[r2]
+        self.memory.write_signed(m, v)
 
-    def out(self):
-        line = self.get_next_gp()
+    def mmr(self, r1: int, r2: int):
+        a = self.gp[r1]
+        self.gp[r2] = self.memory.read_signed(a)
+
+    def out(self, r1: int):
+        line = self.gp[r1]
         self.pp[line].signal()
 
-    def jgt(self):
-        val = self.get_next_gp()
-        addr = self.get_next_gp()
+    def jgt(self, r1: int, r2: int):
+        val = self.gp[r1]
+        addr = self.gp[r2]
 
         if val > 0:
+            backward = addr < self.ip
             self.ip = addr
 
+            if self.skip_idle and backward:
+                self.idle_at(addr)
+
     def opn(self):
         self.ii = 0
 
     def cls(self):
         self.ii = 1
 
-    def ldr(self):
-        a = self.ip
-        offset = self.next_signed()
-        self.set_next_gp(a + offset)
+    def ldr(self, addr: int, r2: int):
+        self.gp[r2] = addr
 
-    def lsp(self):
-        self.sp = self.get_next_gp()
+    def lsp(self, r1: int):
+        self.sp = self.gp[r1]
+        self.switches += 1
 
-    def psh(self):
-        val = self.get_next_gp()
+    def psh(self, r1: int):
+        val = self.gp[r1]
         self.do_push(val)
 
-    def pop(self):
+    def pop(self, r1: int):
         v = self.do_pop()
-        self.set_next_gp(v)
+        self.gp[r1] = v
 
-    def cll(self):
-        ret_addr = self.ip + WORD_SIZE
+    def cll(self, r1: int):
+        ret_addr = self.ip
         self.do_push(ret_addr)
         self.do_push(self.fp)
         self.fp = self.sp
-        self.jmp()
+        self.ip = self.gp[r1]
 
     def ret(self):
         self.fp = self.do_pop()
@@ -160,6 +246,7 @@ class CPU():
         self.ip = addr
 
     def irx(self):
+        self.frames.discard(self.sp)    # The scheduler may return to another thread's frame
         self.fp = self.do_pop()
         for i in range(7, -1, -1):
             self.gp[i] = self.do_pop()
@@ -169,70 +256,68 @@ class CPU():
 
         self.opn()
 
-    def ssp(self):
-        self.set_next_gp(self.sp)
+    def ssp(self, r1: int):
+        self.gp[r1] = self.sp
 
-    def mrr(self):
-        val = self.get_next_gp()
-        self.set_next_gp(val)
+    def mrr(self, r1: int, r2: int):
+        val = self.gp[r1]
+        self.gp[r2] = val
 
-    def lla(self):
-        offset = self.get_next_gp()
-        self.set_next_gp(self.fp + offset)
+    def lla(self, r1: int, r2: int):
+        offset = self.gp[r1]
+        self.gp[r2] = self.fp + offset
 
     def intzero(self):
         self.interrupt(0x00)
 
     # - Arithmetic - $
 
-    def add(self):
-        self.arithm_pair(lambda a, b: a + b)
+    def add(self, *regs: int):
+        self.arithm_pair(lambda a, b: a + b, *regs)
 
-    def sub(self):
-        self.arithm_pair(lambda a, b: a - b)
+    def sub(self, *regs: int):
+        self.arithm_pair(lambda a, b: a - b, *regs)
 
-    def mul(self):
-        self.arithm_pair(lambda a, b: a * b)
+    def mul(self, *regs: int):
+        self.arithm_pair(lambda a, b: a * b, *regs)
 
-    def div(self):
-        self.arithm_pair(lambda a, b: a // b)
+    def div(self, *regs: int):
+        self.arithm_pair(lambda a, b: a // b, *regs)
 
-    def mod(self):
-        self.arithm_pair(lambda a, b: a % b)
+    def mod(self, *regs: int):
+        self.arithm_pair(lambda a, b: a % b, *regs)
 
-    def rsh(self):
-        self.arithm_pair(lambda a, b: a >> b)
+    def rsh(self, *regs: int):
+        self.arithm_pair(lambda a, b: a >> b, *regs)
 
-    def lsh(self):
-        self.arithm_pair(lambda a, b: a << b)
+    def lsh(self, *regs: int):
+        self.arithm_pair(lambda a, b: a << b, *regs)
 
-    def bor(self):
-        self.arithm_pair(lambda a, b: a | b)
+    def bor(self, *regs: int):
+        self.arithm_pair(lambda a, b: a | b, *regs)
 
-    def xor(self):
-        self.arithm_pair(lambda a, b: a ^ b)
+    def xor(self, *regs: int):
+        self.arithm_pair(lambda a, b: a ^ b, *regs)
 
-    def band(self):
-        self.arithm_pair(lambda a, b: a & b)
+    def band(self, *regs: int):
+        self.arithm_pair(lambda a, b: a & b, *regs)
 
-    def cpt(self):
-        val = self.next_unsigned()
+    def cpt(self, val: int):
         message = f'CHECKPOINT {val}'
         lg.debug(message)
         self.debug_dump()
         # Write this to stdout so a test engine can control execution
         print(message)
 
-    def aeq(self):
-        a = self.get_next_gp()
-        b = self.next_unsigned()
+    def aeq(self, r1: int, b: int):
+        a = self.gp[r1]
 
         lg.info(f'ASSERTION {a} <> {b} ({a == b})')
 
         if a != b:
             raise Assert()
 
-    HANDLERS = {
+    HANDLERS: Dict[int, Callable[..., None]] = {
         ops.NOP: nop,
         ops.HLT: hlt,
         ops.JMP: jmp,
@@ -277,6 +362,7 @@ class CPU():
             return
 
         # lg.debug("INT {0}".format(line))
+        self.delivered[line] += 1
 
         # Inhibit interrupts
         self.cls()
@@ -291,18 +377,354 @@ class CPU():
 
         # Set handler's frame
         self.fp = self.sp
+        self.frames.add(self.fp)
 
         # Find and a call a handler
         h_addr_inx = INT_VECT_BASE + line * WORD_SIZE         # Interrupt handler address location
 
-        (handler_addr,) = struct.unpack(
-            '>I',
-            self.memory[h_addr_inx:h_addr_inx + WORD_SIZE]
-        )
+        handler_addr = self.memory.read_word(h_addr_inx)
 
         self.ip = handler_addr
 
+    def idle_at(self, start: int):
+        if self.ii == 0 and self.idle_detector.spins(start):
+            self.clock.idle(self.interrupts)
+
+    def poll(self):
+        if self.interrupts.mask:
+            line = self.interrupts.take()
+
+            if line is not None:
+                self.interrupt(line)
+
+    def tick(self, retired: int):
+        self.retired += retired
+        self.countdown -= retired
+
+        if self.countdown <= 0:
+            self.clock.advance(self.quantum - self.countdown)
+            self.countdown = self.quantum
+            self.poll()
+
     def exec_next(self):
-        op = self.next()
-        handler = self.HANDLERS[op]
-        handler(self)
+        ip = self.ip
+        entry = self.code.entries.get(ip)
+
+        if entry is None:
+            entry = self.decode(ip)
+
+        (handler, operands, length, _) = entry
+
+        for hook in self.hooks:
+            hook(ip, entry)
+
+        self.ip = ip + length
+        handler(self, *operands)
+
+    def fused_loop(self) -> Callable[[int], int]:
+        ''' Builds the fused loop once, its handlers share the state it keeps in locals
+
+            State is written back when the loop leaves and around interrupts
+        '''
+        proc = self
+        code = self.code
+        entries = self.predecoded.entries
+        words = code.words
+        predecode = self.predecode
+        decoded = self.decoded
+        interrupts = self.interrupts
+        quantum = self.quantum
+        advance = self.clock.advance
+        frames = self.frames
+        pp = self.pp
+        gp = self.gp
+
+        pack_u = WORD.pack_into
+        unpack_u = WORD.unpack_from
+        pack_s = SIGNED.pack_into
+        unpack_s = SIGNED.unpack_from
+
+        # Set on entry, a restored snapshot replaces the memory
+        memory = self.memory.data
+        skip_idle = self.skip_idle
+
+        ip = sp = fp = steps = 0
+
+        def store():
+            proc.ip = ip
+            proc.sp = sp
+            proc.fp = fp
+
+        def reload():
+            nonlocal ip, sp, fp
+            ip = proc.ip
+            sp = proc.sp
+            fp = proc.fp
+
+        def written(m: int, size: int = WORD_SIZE):
+            if m // WORD_SIZE in words or (m + size - 1) // WORD_SIZE in words:
+                code.invalidate(m, size)
+
+        # Handlers take the operands tuple, IP already points to the next instruction
+
+        def ldc(o):
+            gp[o[1]] = o[0]
+
+        def mrr(o):
+            gp[o[1]] = gp[o[0]]
+
+        def add(o):
+            gp[o[2]] = gp[o[0]] + gp[o[1]]
+
+        def sub(o):
+            gp[o[2]] = gp[o[0]] - gp[o[1]]
+
+        def mul(o):
+            gp[o[2]] = gp[o[0]] * gp[o[1]]
+
+        def div(o):
+            gp[o[2]] = gp[o[0]] // gp[o[1]]
+
+        def mod(o):
+            gp[o[2]] = gp[o[0]] % gp[o[1]]
+
+        def rsh(o):
+            gp[o[2]] = gp[o[0]] >> gp[o[1]]
+
+        def lsh(o):
+            gp[o[2]] = gp[o[0]] << gp[o[1]]
+
+        def bor(o):
+            gp[o[2]] = gp[o[0]] | gp[o[1]]
+
+        def xor(o):
+            gp[o[2]] = gp[o[0]] ^ gp[o[1]]
+
+        def band(o):
+            gp[o[2]] = gp[o[0]] & gp[o[1]]
+
+        def mmr(o):
+            gp[o[1]] = unpack_s(memory, gp[o[0]])[0]
+
+        def mrm(o):
+            m = gp[o[1]]
+            pack_s(memory, m, gp[o[0]])
+            written(m)
+
+        def lla(o):
+            gp[o[1]] = fp + gp[o[0]]
+
+        def ssp(o):
+            gp[o[0]] = sp
+
+        def lsp(o):
+            nonlocal sp
+            sp = gp[o[0]]
+            proc.switches += 1
+
+        def psh(o):
+            nonlocal sp
+            pack_u(memory, sp, gp[o[0]])
+            written(sp)
+            sp += WORD_SIZE
+
+        def pop(o):
+            nonlocal sp
+            sp -= WORD_SIZE
+            gp[o[0]] = unpack_u(memory, sp)[0]
+
+        def idle(addr: int):
+            store()     # The detector replays the loop on the written back state
+            proc.idle_at(addr)
+
+        def jmp(o):
+            nonlocal ip
+            addr = gp[o[0]]
+            backward = addr < ip
+            ip = addr
+
+            if skip_idle and backward:
+                idle(addr)
+
+        def jgt(o):
+            nonlocal ip
+
+            if gp[o[0]] > 0:
+                addr = gp[o[1]]
+                backward = addr < ip
+                ip = addr
+
+                if skip_idle and backward:
+                    idle(addr)
+
+        def enter(target: int):
+            nonlocal ip, sp, fp
+            pack_u(memory, sp, ip)
+            pack_u(memory, sp + WORD_SIZE, fp)
+            written(sp, 2 * WORD_SIZE)
+            sp += 2 * WORD_SIZE
+            fp = sp
+            ip = target
+
+        def cll(o):
+            enter(gp[o[0]])
+
+        def ret(o):
+            nonlocal ip, sp, fp
+            sp -= WORD_SIZE
+            fp = unpack_u(memory, sp)[0]
+            sp -= WORD_SIZE
+            ip = unpack_u(memory, sp)[0]
+
+        def irx(o):
+            nonlocal ip, sp, fp
+            frames.discard(sp)
+            sp -= WORD_SIZE
+            fp = unpack_u(memory, sp)[0]
+
+            for i in range(7, -1, -1):
+                sp -= WORD_SIZE
+                gp[i] = unpack_u(memory, sp)[0]
+
+            sp -= WORD_SIZE
+            ip = unpack_u(memory, sp)[0]
+            proc.ii = 0
+
+        def intzero(o):
+            store()
+            proc.interrupt(0x00)
+            reload()
+
+        def out(o):
+            proc.uncounted = steps - 1  # Devices may read the counters
+            pp[gp[o[0]]].signal()
+            proc.uncounted = 0
+
+        def nop(o):
+            proc.nop()
+
+        def hlt(o):
+            raise Halt()
+
+        def opn(o):
+            proc.ii = 0
+
+        def cls(o):
+            proc.ii = 1
+
+        def cpt(o):
+            store()     # Dumped with the message
+            proc.cpt(*o)
+
+        def aeq(o):
+            proc.aeq(*o)
+
+        # Superinstructions
+
+        def lload(o):
+            (off, x, r) = o
+            gp[x] = fp + off
+            gp[r] = unpack_s(memory, gp[x])[0]
+
+        def lstore(o):
+            (off, x, r) = o
+            m = gp[x] = fp + off
+            pack_s(memory, m, gp[r])
+            written(m)
+
+        def ptr(o):
+            (s, x, off, y, t) = o
+            gp[x] = gp[s]
+            gp[y] = off
+            gp[t] = gp[x] + gp[y]
+
+        def call(o):
+            (target, x) = o
+            gp[x] = target
+            enter(target)
+
+        handlers = {
+            ops.NOP: nop, ops.HLT: hlt, ops.JMP: jmp, ops.LDC: ldc, ops.MRM: mrm,
+            ops.MMR: mmr, ops.OUT: out, ops.JGT: jgt, ops.OPN: opn, ops.CLS: cls,
+            ops.LDR: ldc, ops.LSP: lsp, ops.PSH: psh, ops.POP: pop, ops.INT: intzero,
+            ops.CLL: cll, ops.RET: ret, ops.IRX: irx, ops.SSP: ssp, ops.MRR: mrr,
+            ops.LLA: lla,
+
+            ops.ADD: add, ops.SUB: sub, ops.MUL: mul, ops.DIV: div, ops.MOD: mod,
+            ops.RSH: rsh, ops.LSH: lsh, ops.BOR: bor, ops.XOR: xor, ops.BAND: band,
+
+            ops.CPT: cpt, ops.AEQ: aeq,
+
+            superops.LLOAD: lload, superops.LSTORE: lstore, superops.PTR: ptr,
+            superops.CALL: call
+        }
+
+        # Indexed by opcode
+        dispatch: List[Callable | None] = [None] * (max(handlers) + 1)
+
+        for (op, handler) in handlers.items():
+            dispatch[op] = handler
+
+        sizes = superops.SIZES
+        fused = superops.FIRST
+
+        def run(max_steps: int) -> int:
+            nonlocal memory, skip_idle, ip, sp, fp, steps
+            memory = proc.memory.data
+            skip_idle = proc.skip_idle
+
+            ip = proc.ip
+            sp = proc.sp
+            fp = proc.fp
+            countdown = proc.countdown
+            steps = 0
+
+            try:
+                while steps < max_steps:
+                    entry = entries.get(ip)
+
+                    if entry is None:
+                        entry = predecode(ip)
+
+                    (_, operands, length, op) = entry
+
+                    if op >= fused:
+                        extra = sizes[op] - 1
+
+                        # A poll or the step limit falls between its instructions, split it
+                        if extra >= countdown or steps + extra >= max_steps:
+                            (_, operands, length, op) = decoded(ip)
+                        else:
+                            steps += extra
+                            countdown -= extra
+
+                    ip += length
+                    steps += 1
+                    dispatch[op](operands)
+                    countdown -= 1
+
+                    if countdown <= 0:
+                        advance(quantum - countdown)
+                        countdown = quantum
+
+                        if interrupts.mask:
+                            store()
+                            proc.poll()
+                            reload()
+
+            finally:
+                store()
+                proc.countdown = countdown
+                proc.retired += steps   # The instruction raising an exception included
+
+            return steps
+
+        return run
+
+    def run(self, max_steps: int) -> int:
+        ''' Fused interpreter loop, returns the number of retired instructions
+
+            Superinstructions are split so that no more than max_steps retire and interrupts
+            are polled after the same instructions as single-stepping
+        '''
+        return self.loop(max_steps)
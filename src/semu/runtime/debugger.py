@@ -0,0 +1,147 @@
+''' Breakpoints and memory watchpoints, checked by a separate single-step loop '''
+
+from typing import Callable, List, NamedTuple, Set, Tuple
+
+import semu.common.ops as ops
+from semu.common.hwconf import WORD_SIZE, LOOPBACK_LINE
+import semu.runtime.cpu as cpu
+
+
+# Hit reasons
+BREAK = 'break'
+WATCH = 'watch'
+
+FRAME_SIZE = 10 * WORD_SIZE     # Interrupt frame: ip, 8 registers, fp
+
+
+class Watchpoint(NamedTuple):
+    start: int
+    end: int    # exclusive
+    read: bool
+    write: bool
+
+
+class Hit(NamedTuple):
+    reason: str
+    ip: int
+    address: int | None = None  # Memory accessed by the instruction at IP
+    write: bool = False
+
+    def describe(self) -> str:
+        if self.reason == BREAK:
+            return f'Breakpoint at 0x{self.ip:X}'
+
+        access = 'write' if self.write else 'read'
+        return f'Watchpoint {access} of 0x{self.address:X} at 0x{self.ip:X}'
+
+
+class Break(Exception):
+    def __init__(self, hit: Hit, proc: cpu.CPU):
+        super().__init__(hit.describe())
+        self.hit = hit
+        self.proc = proc
+
+
+class Debugger:
+    ''' Checks the instruction at IP before it runs, engines are not used while anything is set
+
+        Interrupt frames pushed between instructions are seen at the first handler instruction
+    '''
+    breakpoints: Set[int]
+    watchpoints: List[Watchpoint]
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.breakpoints = set()
+        self.watchpoints = list()
+        self.entered = self.polled()
+
+    def active(self) -> bool:
+        return bool(self.breakpoints or self.watchpoints)
+
+    def watch(self, start: int, size: int = WORD_SIZE, read: bool = False, write: bool = True):
+        self.watchpoints.append(Watchpoint(start, start + size, read, write))
+        self.entered = self.polled()
+
+    def unwatch(self, start: int):
+        self.watchpoints = [w for w in self.watchpoints if w.start != start]
+
+    def polled(self) -> int:
+        ''' Interrupts entered between instructions, the loopback line is entered by int '''
+        delivered = self.cpu.delivered
+        return sum(delivered) - delivered[LOOPBACK_LINE]
+
+    def access(self) -> Tuple[int, int, bool] | None:
+        ''' Memory the instruction at IP is about to read or write: address, size, write '''
+        proc = self.cpu
+        entry = proc.decoded(proc.ip)
+        (_, operands, _, op) = entry
+
+        if op == ops.MMR:
+            return (proc.gp[operands[0]], WORD_SIZE, False)
+
+        if op == ops.MRM:
+            return (proc.gp[operands[1]], WORD_SIZE, True)
+
+        if op == ops.PSH:
+            return (proc.sp, WORD_SIZE, True)
+
+        if op == ops.POP:
+            return (proc.sp - WORD_SIZE, WORD_SIZE, False)
+
+        if op == ops.CLL:
+            return (proc.sp, 2 * WORD_SIZE, True)
+
+        if op == ops.RET:
+            return (proc.sp - 2 * WORD_SIZE, 2 * WORD_SIZE, False)
+
+        if op == ops.INT and proc.ii == 0:
+            return (proc.sp, FRAME_SIZE, True)
+
+        if op == ops.IRX:
+            return (proc.sp - FRAME_SIZE, FRAME_SIZE, False)
+
+        return None
+
+    def check(self) -> Hit | None:
+        proc = self.cpu
+        ip = proc.ip
+        polled = self.polled()
+        (entered, self.entered) = (polled != self.entered, polled)
+
+        if ip in self.breakpoints:
+            return Hit(BREAK, ip)
+
+        if not self.watchpoints:
+            return None
+
+        accesses = [self.access()]
+
+        if entered:
+            accesses.insert(0, (proc.fp - FRAME_SIZE, FRAME_SIZE, True))
+
+        for access in accesses:
+            if access is None:
+                continue
+
+            (address, size, write) = access
+
+            for w in self.watchpoints:
+                if address < w.end and address + size > w.start and (w.write if write else w.read):
+                    # First word of the access within the watched range
+                    address += max(0, w.start - address) // WORD_SIZE * WORD_SIZE
+                    return Hit(WATCH, ip, address, write)
+
+        return None
+
+    def wrap(self, step: Callable[[], int]) -> Callable[[], int]:
+        ''' Single-instruction step that raises Break instead of running a checked instruction '''
+        def checked() -> int:
+            hit = self.check()
+
+            if hit is not None:
+                raise Break(hit, self.cpu)
+
+            return step()
+
+        return checked
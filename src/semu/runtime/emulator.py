@@ -2,19 +2,43 @@ import sys
 from pathlib import Path
 import logging as lg
 import traceback
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
 
 import click
 
-from semu.common.hwconf import MEMORY_SIZE, SYSTIMER_LINE, SERIAL_LINE, ROM_BASE
-from semu.runtime.peripheral import Peripherals, SysTimer, Serial
+from semu.common.hwconf import (
+    SYSTIMER_LINE, SERIAL_LINE, PERF_LINE, ROM_BASE, WORD_SIZE, PERF_MM_BASE
+)
+from semu.runtime.peripheral import Peripheral, Peripherals, SysTimer, Serial, PerfCounters
+from semu.runtime.interrupts import Interrupts
+from semu.runtime.memory import Memory
+from semu.runtime.clock import Clock, RealClock, VirtualClock
 import semu.runtime.cpu as cpu
+from semu.runtime.blocks import BlockEngine
+import semu.runtime.aot as aot
+import semu.runtime.snapshot as snapshots
+from semu.runtime.profiler import Profile, Sampler
+from semu.runtime.trace import Tracer, CAPACITY
+from semu.runtime.debugger import Debugger, Break, Watchpoint
+import semu.runtime.coverage as coverages
+from semu.runtime.heatmap import Heatmap
+from semu.runtime.syscalls import Syscalls
+from semu.runtime.stacks import Stacks
+from semu.runtime.metrics import Exporter, INTERVAL
+from semu.common.symbols import SymbolMap
 
 
 EXIT_HALT = 0
 EXIT_ASSERT_FAIL = 2
 EXIT_KEYBOARD = 3
+EXIT_BREAK = 4
 EXIT_EXEC_ERROR = 100
 
+ENGINES = ['interp', 'fused', 'blocks', 'aot']
+
+FUSED_STEPS = 10000   # Instructions per fused loop call
+
 
 def start_pp(pp: Peripherals):
     for p in pp.values():
@@ -27,51 +51,398 @@ def stop_pp(pp: Peripherals):
         p.join()
 
 
-def init_memory(memory: bytearray, rom: bytes):
-    rb = ROM_BASE
-    mem_len = len(memory)
-    memory[rb:rb + mem_len] = rom
+def init_memory(memory: Memory, rom: bytes):
+    if ROM_BASE + len(rom) > PERF_MM_BASE:
+        raise Exception(f'ROM of {len(rom)} bytes overlaps the counters at 0x{PERF_MM_BASE:X}')
+
+    memory.write_block(ROM_BASE, rom)
+
+
+def interp_step(proc: cpu.CPU):
+    proc.exec_next()
+    return 1
+
+
+def create_engine(
+    engine: str, proc: cpu.CPU, rom: bytes, cache_dir: Path | None = None,
+    fused_steps: int = FUSED_STEPS, symbols: SymbolMap | None = None
+):
+    ''' Returns a step function, each call reports the number of retired instructions '''
+    if engine == 'interp':
+        return lambda: interp_step(proc)
+
+    if engine == 'fused':
+        return lambda: proc.run(fused_steps)
+
+    if engine == 'blocks':
+        return BlockEngine(proc).step
+
+    if engine == 'aot':
+        module = aot.load_or_translate(rom, cache_dir, symbols)
+        return aot.AotEngine(proc, module, rom).step
 
+    raise Exception(f'Unknown engine {engine}')
 
-def process_int_queue(pp: Peripherals, proc: cpu.CPU):
-    for line, peripheral in pp.items():
-        if peripheral.has_signal():
-            proc.interrupt(line)
-            break
 
+def boot(
+    memory: Memory, quantum: int = 1, clock: Clock | None = None, skip_idle: bool = False
+) -> cpu.CPU:
+    interrupts = Interrupts()
 
-def execute(rom: bytes):
-    memory = bytearray(MEMORY_SIZE)
+    if clock is None:
+        clock = RealClock()
+
+    counters = PerfCounters(memory, clock)
 
     # PERIPHERALS: Line -> Device
-    pp = {
+    pp: Dict[int, Peripheral | PerfCounters] = {
         # 0 : loopback interrupt
-        SYSTIMER_LINE: SysTimer(memory),
-        SERIAL_LINE: Serial(memory)
+        SYSTIMER_LINE: SysTimer(memory, interrupts, clock),
+        SERIAL_LINE: Serial(memory, interrupts, clock),
+        PERF_LINE: counters
     }
 
+    proc = cpu.CPU(memory, pp, interrupts, quantum, clock, skip_idle)
+    counters.cpu = proc
+    return proc
+
+
+@dataclass
+class Instruments:
+    ''' What observes a run, results are written at exit and metrics every interval
+
+        Profiling, tracing, coverage and the memory heatmap are exclusive. These, kernel service
+        and stack tracking and debugging interpret every instruction whatever the engine
+    '''
+    symbols: SymbolMap | None = None    # Names in reports
+    profile: Path | None = None
+    flamegraph: Path | None = None      # Sampled call stacks
+    sample_period: int = 1000
+    trace: Path | None = None
+    trace_size: int = CAPACITY
+    trace_stream: bool = False
+    coverage: Path | None = None
+    heatmap: Path | None = None
+    syscalls: Path | None = None
+    stacks: Path | None = None
+    metrics: Path | None = None         # Prometheus text
+    metrics_json: Path | None = None
+    metrics_interval: float = INTERVAL
+    breakpoints: List[int] = field(default_factory=list)
+    watchpoints: List[Watchpoint] = field(default_factory=list)
+
+    def conflict(self) -> str | None:
+        ''' Describes options that can not be used together '''
+        if [self.profile, self.trace, self.coverage, self.heatmap].count(None) < 3:
+            return 'Profiling, tracing, coverage and the heatmap are exclusive'
+
+        return None
+
+
+def execute(
+    rom: bytes, engine: str = 'interp', cache_dir: Path | None = None, quantum: int = 1,
+    clock: Clock | None = None, skip_idle: bool = False, snapshot: Path | None = None,
+    instruments: Instruments | None = None
+):
+    ''' Runs the ROM from the start or resumes the snapshot taken from it '''
+    options = instruments if instruments is not None else Instruments()
+    conflict = options.conflict()
+
+    if conflict is not None:
+        raise Exception(conflict)
+
+    if snapshot is None:
+        memory = Memory()
+    else:
+        (state, memory) = snapshots.load(snapshot)
+
+    proc = boot(memory, quantum, clock, skip_idle)
+    symbols = options.symbols
+
+    profiler = None
+    sampler = None
+    tracer = None
+    covering = None
+    counting = None
+    calls = None
+    marks = None
+    exporter = None
+    debugger = Debugger(proc)
+    debugger.breakpoints.update(options.breakpoints)
+    debugger.watchpoints.extend(options.watchpoints)
+
     try:
-        proc = cpu.CPU(memory, pp)
-        init_memory(memory, rom)
-        start_pp(pp)
+        if snapshot is None:
+            init_memory(memory, rom)
+        else:
+            snapshots.restore(proc, state)
+
+        if options.profile is not None:
+            profiler = Profile(proc)
+            proc.hooks.append(profiler.hook)
+        elif options.trace is not None:
+            tracer = Tracer(proc, options.trace, options.trace_size, options.trace_stream)
+            proc.hooks.append(tracer.hook)
+        elif options.coverage is not None:
+            covering = coverages.Coverage(proc)
+            proc.hooks.append(covering.hook)
+        elif options.heatmap is not None:
+            counting = Heatmap(proc)
+            proc.hooks.append(counting.hook)
+
+        # Hooks are only called by the interpreter
+        single = bool(proc.hooks) or debugger.active()
+        single = single or options.syscalls is not None or options.stacks is not None
+
+        if single:
+            step = create_engine('interp', proc, rom)
+        else:
+            # The fused loop runs no longer than a sample period then
+            steps = FUSED_STEPS
+            steps = steps if options.flamegraph is None else min(steps, options.sample_period)
+            step = create_engine(engine, proc, rom, cache_dir, steps, symbols)
+
+        if options.syscalls is not None:
+            calls = Syscalls(proc)
+            step = calls.wrap(step)
+
+        if options.stacks is not None:
+            marks = Stacks(proc)
+            step = marks.wrap(step)
+
+        if debugger.active():
+            step = debugger.wrap(step)
+
+        if options.flamegraph is not None:
+            sampler = Sampler(proc, options.sample_period)
+            step = sampler.wrap(step)
+
+        start_pp(proc.pp)
+
+        if options.metrics is not None or options.metrics_json is not None:
+            exporter = Exporter(
+                proc, options.metrics, options.metrics_json, options.metrics_interval
+            )
+            exporter.start()
+
+        if engine == 'fused' and not single:
+            # Polls interrupts itself
+            while True:
+                step()
 
         while True:
+            # Blocks are only interrupted at their boundaries
+            proc.tick(step())
+
+    finally:
+        stop_pp(proc.pp)
+
+        if exporter is not None:
+            exporter.stop()
+
+        if tracer is not None:
+            tracer.close()
+            lg.info(f'Trace written to {options.trace}')
+
+        if covering is not None:
+            assert options.coverage is not None
+            coverages.save(options.coverage, rom, covering.bitmap(rom))
+            lg.info(f'Coverage written to {options.coverage}')
+
+        if counting is not None:
+            assert options.heatmap is not None
+            counting.save(options.heatmap)
+            summary = counting.summary(symbols, len(rom))
+            options.heatmap.with_suffix('.txt').write_text(summary)
+            lg.info(f'Memory heatmap written to {options.heatmap}')
+
+        if calls is not None:
+            assert options.syscalls is not None
+            options.syscalls.write_text(calls.report())
+            lg.info(f'Kernel service latencies written to {options.syscalls}')
+
+        if marks is not None:
+            assert options.stacks is not None
+            options.stacks.write_text(marks.report(symbols))
+            lg.info(f'Stack high-water marks written to {options.stacks}')
+
+        if profiler is not None:
+            assert options.profile is not None
+            options.profile.write_text(profiler.report(symbols))
+            lg.info(f'Profile written to {options.profile}')
+
+        if sampler is not None:
+            assert options.flamegraph is not None
+            sampler.write(options.flamegraph, symbols)
+            lg.info(f'Folded stacks written to {options.flamegraph}')
+
+
+def take_snapshot(
+    rom: bytes, address: int, path: Path, quantum: int = 1, clock: Clock | None = None
+):
+    ''' Runs the ROM up to the address and saves the machine there '''
+    memory = Memory()
+    proc = boot(memory, quantum, clock)
+
+    try:
+        init_memory(memory, rom)
+        start_pp(proc.pp)
+
+        while proc.ip != address:
             proc.exec_next()
-            process_int_queue(pp, proc)
+            proc.tick(1)
+
+        snapshots.save(path, proc)
 
     finally:
-        stop_pp(pp)
+        stop_pp(proc.pp)
+
+
+def parse_address(address: str, symbol_map: Path | None) -> int:
+    ''' A number or a qualified label from the symbol map '''
+    if '::' not in address:
+        return int(address, 0)
+
+    if symbol_map is None:
+        raise click.BadParameter('Labels require a symbol map')
+
+    symbol = SymbolMap.load(symbol_map).find(address)
+
+    if symbol is None:
+        raise click.BadParameter(f'Unknown label {address}')
+
+    return symbol.address
+
+
+def parse_watchpoint(spec: str, symbol_map: Path | None, read: bool) -> Watchpoint:
+    ''' ADDRESS[:SIZE] in bytes, a word by default '''
+    (address, separator, size) = spec.rpartition(':')
+
+    if not separator or address.endswith(':'):
+        (address, size) = (spec, '')  # A label without a size
+
+    start = parse_address(address, symbol_map)
+    return Watchpoint(start, start + (int(size, 0) if size else WORD_SIZE), read, not read)
+
+
+# Passed to execute as Instruments
+INSTRUMENT_OPTIONS = [
+    click.option('--profile', type=Path, help='Count instructions and write a report at exit'),
+    click.option('--flamegraph', type=Path, help='Sample call stacks into a folded stacks file'),
+    click.option(
+        '--sample-period', type=click.IntRange(min=1), default=1000,
+        help='Instructions between call stack samples'
+    ),
+    click.option('--trace', type=Path, help='Record every instruction into a binary trace'),
+    click.option(
+        '--trace-size', type=click.IntRange(min=1), default=CAPACITY,
+        help='Trace buffer in records, the last ones are kept unless streaming'
+    ),
+    click.option(
+        '--trace-stream', is_flag=True, help='Write the whole trace in buffer-sized chunks'
+    ),
+    click.option('--coverage', type=Path, help='Record executed instructions into a bitmap'),
+    click.option(
+        '--heatmap', type=Path,
+        help='Count memory accesses per word into an .npz, with a .txt summary next to it'
+    ),
+    click.option(
+        '--syscalls', type=Path, help='Count kernel services and their latencies into a report'
+    ),
+    click.option('--stacks', type=Path, help='Track stack high-water marks into a report'),
+    click.option('--metrics', type=Path, help='Keep Prometheus metrics in a text file'),
+    click.option('--metrics-json', type=Path, help='Append metrics to a JSON lines file'),
+    click.option(
+        '--metrics-interval', type=click.FloatRange(min=0.1), default=INTERVAL,
+        help='Seconds between metrics updates'
+    )
+]
+
+
+def instrument_options(command: Callable[..., Any]) -> Callable[..., Any]:
+    for option in reversed(INSTRUMENT_OPTIONS):
+        command = option(command)
+
+    return command
 
 
 @click.command()
+@click.option('--engine', type=click.Choice(ENGINES), default='interp', help='Execution engine')
+@click.option('--cache-dir', type=Path, help='Ahead-of-time translation cache location')
+@click.option(
+    '--quantum', type=click.IntRange(min=1), default=1,
+    help='Instructions between polls for pending interrupts'
+)
+@click.option('--virtual-time', is_flag=True, help='Time devices by retired instructions')
+@click.option(
+    '--timer-period', type=click.IntRange(min=1), default=100000,
+    help='Instructions between system timer ticks in virtual time'
+)
+@click.option('--nop-cycles', type=click.IntRange(min=0), default=1000, help='Virtual cost of nop')
+@click.option(
+    '--serial-cycles', type=click.IntRange(min=0), default=100,
+    help='Virtual cost of a serial transfer'
+)
+@click.option('--skip-idle', is_flag=True, help='Wait for the next event when the guest is idle')
+@click.option('--snapshot', type=Path, help='Resume from a snapshot of the same ROM')
+@click.option('--save-snapshot', type=Path, help='Save a snapshot instead of running to the end')
+@click.option('--at', 'save_at', help='Snapshot address or label, e.g. app::Start')
+@click.option('-m', '--map', 'symbol_map', type=Path, help='Symbol map from the assembler')
+@instrument_options
+@click.option('--break', 'breaks', multiple=True, help='Stop at an address or label')
+@click.option('--watch', multiple=True, help='Stop before a write to ADDRESS[:SIZE]')
+@click.option('--watch-read', multiple=True, help='Stop before a read from ADDRESS[:SIZE]')
 @click.argument('rom_filename', type=Path)
-def run(rom_filename: Path):
+def run(
+    engine: str, cache_dir: Path | None, quantum: int,
+    virtual_time: bool, timer_period: int, nop_cycles: int, serial_cycles: int,
+    skip_idle: bool, snapshot: Path | None, save_snapshot: Path | None, save_at: str | None,
+    symbol_map: Path | None, breaks: Tuple[str], watch: Tuple[str], watch_read: Tuple[str],
+    rom_filename: Path, **options: Any
+):
     lg.basicConfig(level=lg.DEBUG)
     lg.info("SEMU")
 
+    if save_snapshot is not None and save_at is None:
+        raise click.UsageError('--save-snapshot requires --at')
+
+    if save_at is not None and save_snapshot is None:
+        raise click.UsageError('--at requires --save-snapshot')
+
+    if save_snapshot is not None and snapshot is not None:
+        raise click.UsageError('--save-snapshot runs from the start, not from --snapshot')
+
+    instruments = Instruments(**options)
+    conflict = instruments.conflict()
+
+    if conflict is not None:
+        raise click.UsageError(conflict)
+
+    clock = None
+
+    if virtual_time:
+        clock = VirtualClock(timer_period, nop_cycles, serial_cycles)
+
     try:
         rom = rom_filename.read_bytes()
-        sys.exit(execute(rom))
+
+        if save_snapshot is not None:
+            assert save_at is not None
+            take_snapshot(rom, parse_address(save_at, symbol_map), save_snapshot, quantum, clock)
+            lg.info(f'Snapshot saved to {save_snapshot}')
+            sys.exit(EXIT_HALT)
+
+        instruments.symbols = SymbolMap.load(symbol_map) if symbol_map is not None else None
+        instruments.breakpoints = [parse_address(address, symbol_map) for address in breaks]
+        instruments.watchpoints = [
+            parse_watchpoint(spec, symbol_map, read)
+            for (specs, read) in [(watch, False), (watch_read, True)]
+            for spec in specs
+        ]
+
+        sys.exit(execute(
+            rom, engine, cache_dir, quantum, clock, skip_idle, snapshot, instruments
+        ))
 
     except cpu.Halt:
         lg.info('Execution halted gracefully')
@@ -81,6 +452,14 @@ def run(rom_filename: Path):
         lg.info('Execution halted on false assertion')
         sys.exit(EXIT_ASSERT_FAIL)
 
+    except Break as e:
+        lg.info(f'Execution stopped: {e}')
+        e.proc.debug_dump()
+        sys.exit(EXIT_BREAK)
+
+    except click.ClickException:
+        raise   # Bad labels in addresses
+
     except KeyboardInterrupt:
         lg.info('Execution halted by the user')
         return sys.exit(EXIT_KEYBOARD)
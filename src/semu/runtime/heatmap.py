@@ -0,0 +1,181 @@
+''' Memory heatmap: reads, writes and instruction fetches per guest word
+
+    Accesses are buffered as (address, words) spans and counted in batches with NumPy
+'''
+
+from pathlib import Path
+from typing import List, Tuple
+
+import semu.common.ops as ops
+from semu.common.hwconf import INT_VECT_BASE, SERIAL_MM_BASE, SERIAL_MM_SIZE, ROM_BASE, WORD_SIZE
+from semu.common.hwconf import PERF_MM_BASE, PERF_MM_SIZE
+from semu.common.symbols import SymbolMap
+import semu.runtime.cpu as cpu
+from semu.runtime.superops import Entry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   # type: ignore
+
+
+BATCH = 1 << 16     # Instructions between counting buffered accesses
+FRAME = 10          # Words an interrupt pushes: ip, a..h, fp
+
+# Sections
+VECTORS = 'vectors'
+MMIO = 'mmio'
+ROM = 'rom'
+FREE = 'free'
+
+
+class Spans:
+    ''' Buffered accesses of one kind, counted into a word array on flush '''
+
+    def __init__(self, words: int):
+        self.counts = np.zeros(words, dtype=np.uint64)
+        self.starts: List[int] = []
+        self.sizes: List[int] = []  # in words
+
+    def add(self, addr: int, size: int):
+        self.starts.append(addr)
+        self.sizes.append(size)
+
+    def flush(self):
+        if not self.starts:
+            return
+
+        starts = np.asarray(self.starts, dtype=np.int64) // WORD_SIZE
+        sizes = np.asarray(self.sizes, dtype=np.int64)
+
+        # Every word of a span: its start plus the offset within it
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        words = np.repeat(starts, sizes) + offsets
+        words = words[(words >= 0) & (words < len(self.counts))]
+        self.counts += np.bincount(words, minlength=len(self.counts)).astype(np.uint64)
+
+        self.starts.clear()
+        self.sizes.clear()
+
+
+class Heatmap:
+    ''' Stack traffic is taken from SP moves, including interrupt frames pushed between steps
+
+        An instruction's own pushes and pops are only seen at the next one, or when saving
+    '''
+
+    def __init__(self, proc: cpu.CPU, batch: int = BATCH):
+        if np is None:
+            raise Exception('The memory heatmap requires numpy')
+
+        self.cpu = proc
+        self.batch = batch
+        self.words = (len(proc.memory.data) + WORD_SIZE - 1) // WORD_SIZE
+        self.reads = Spans(self.words)
+        self.writes = Spans(self.words)
+        self.fetches = Spans(self.words)
+        self.sp = proc.sp   # Once the last instruction ran, before any interrupt
+        self.delivered = sum(proc.delivered)
+
+    def hook(self, ip: int, entry: Entry):
+        proc = self.cpu
+        self.settle()
+
+        (_, operands, length, op) = entry
+        self.fetches.add(ip, length // WORD_SIZE)
+
+        if op == ops.MMR:
+            self.reads.add(proc.gp[operands[0]], 1)
+        elif op == ops.MRM:
+            self.writes.add(proc.gp[operands[1]], 1)
+
+        # Loading SP switches stacks, nothing is accessed
+        self.sp = proc.gp[operands[0]] if op == ops.LSP else proc.sp
+
+        if len(self.fetches.starts) >= self.batch:
+            self.flush()
+
+    def settle(self):
+        ''' Counts SP moves since the last instruction, its own then the interrupt frames '''
+        proc = self.cpu
+        sp = proc.sp
+        delivered = sum(proc.delivered)
+
+        if delivered > self.delivered:
+            frames = (delivered - self.delivered) * FRAME
+            sp -= frames * WORD_SIZE
+            self.writes.add(sp, frames)
+
+        if sp > self.sp:
+            self.writes.add(self.sp, (sp - self.sp) // WORD_SIZE)
+        elif sp < self.sp:
+            self.reads.add(sp, (self.sp - sp) // WORD_SIZE)
+
+        self.sp = proc.sp
+        self.delivered = delivered
+
+    def flush(self):
+        for spans in [self.reads, self.writes, self.fetches]:
+            spans.flush()
+
+    def save(self, path: Path):
+        ''' Compressed arrays indexed by address / WORD_SIZE '''
+        self.settle()
+        self.flush()
+
+        np.savez_compressed(
+            path, reads=self.reads.counts, writes=self.writes.counts,
+            fetches=self.fetches.counts
+        )
+
+    def regions(self, symbols: SymbolMap | None, rom_size: int) -> List[Tuple[int, int, str, str]]:
+        ''' (start, end, section, name) covering the whole memory '''
+        rom_end = ROM_BASE + rom_size
+        result = [
+            (INT_VECT_BASE, SERIAL_MM_BASE, VECTORS, 'interrupt vectors'),
+            (SERIAL_MM_BASE, SERIAL_MM_BASE + SERIAL_MM_SIZE, MMIO, 'serial')
+        ]
+
+        if symbols is None or not symbols.symbols:
+            result.append((ROM_BASE, rom_end, ROM, 'rom'))
+        else:
+            first = symbols.addresses[0]
+
+            if first > ROM_BASE:
+                result.append((ROM_BASE, first, ROM, f'0x{ROM_BASE:X}'))
+
+            result.extend([
+                (s.address, s.address + s.size, s.kind, s.qname()) for s in symbols.symbols
+            ])
+
+        perf_end = PERF_MM_BASE + PERF_MM_SIZE
+        result.append((rom_end, PERF_MM_BASE, FREE, 'free'))
+        result.append((PERF_MM_BASE, perf_end, MMIO, 'perf'))
+        result.append((perf_end, self.words * WORD_SIZE, FREE, 'free'))
+        return result
+
+    def summary(self, symbols: SymbolMap | None = None, rom_size: int = 0) -> str:
+        ''' Accesses per region, touched counts the words accessed at all '''
+        self.settle()
+        self.flush()
+        counts = [self.reads.counts, self.writes.counts, self.fetches.counts]
+        lines = [f'{"reads":>12} {"writes":>12} {"fetches":>12} {"touched":>13}  section  name']
+
+        for (start, end, section, name) in self.regions(symbols, rom_size):
+            (first, last) = (start // WORD_SIZE, (end + WORD_SIZE - 1) // WORD_SIZE)
+
+            if first >= last:
+                continue
+
+            (reads, writes, fetches) = [c[first:last] for c in counts]
+            touched = int(np.count_nonzero(reads + writes + fetches))
+
+            if not touched:
+                continue
+
+            lines.append(
+                f'{int(reads.sum()):12} {int(writes.sum()):12} {int(fetches.sum()):12} '
+                f'{touched:6}/{last - first:<6}  {section:7}  {name}'
+            )
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,91 @@
+''' Idle detection: guest loops that spin until an interrupt arrives '''
+
+import struct
+import operator
+from typing import Set
+
+import semu.common.ops as ops
+from semu.common.hwconf import WORD_SIZE
+
+
+SPIN_LIMIT = 16     # instructions per loop iteration
+
+# Neither writes memory nor leaves the loop otherwise
+ARITHMETIC = {
+    ops.ADD: operator.add,
+    ops.SUB: operator.sub,
+    ops.MUL: operator.mul,
+    ops.DIV: operator.floordiv,
+    ops.MOD: operator.mod,
+    ops.RSH: operator.rshift,
+    ops.LSH: operator.lshift,
+    ops.BOR: operator.or_,
+    ops.XOR: operator.xor,
+    ops.BAND: operator.and_
+}
+
+
+class IdleDetector:
+    busy: Set[int]  # Loops seen doing work, not probed again
+
+    def __init__(self, proc):
+        self.cpu = proc
+        self.busy = set()
+
+    # A code cache dependent: rewritten code may spin where the old one did work
+
+    def invalidate(self, addr: int, size: int = WORD_SIZE) -> bool:
+        found = bool(self.busy)
+        self.busy.clear()
+        return found
+
+    def clear(self):
+        self.busy.clear()
+
+    def spins(self, start: int) -> bool:
+        ''' Whether one more iteration from start would leave the whole state unchanged '''
+        proc = self.cpu
+
+        if start in self.busy:
+            return False
+
+        gp = list(proc.gp)
+        ip = start
+
+        try:
+            for _ in range(SPIN_LIMIT):
+                (_, operands, length, op) = proc.decoded(ip)
+                ip += length
+
+                if op == ops.LDC or op == ops.LDR:
+                    gp[operands[1]] = operands[0]
+                elif op == ops.MRR:
+                    gp[operands[1]] = gp[operands[0]]
+                elif op == ops.LLA:
+                    gp[operands[1]] = proc.fp + gp[operands[0]]
+                elif op == ops.SSP:
+                    gp[operands[0]] = proc.sp
+                elif op == ops.MMR:
+                    gp[operands[1]] = proc.memory.read_signed(gp[operands[0]])
+                elif op in ARITHMETIC:
+                    (r1, r2, r3) = operands
+                    gp[r3] = ARITHMETIC[op](gp[r1], gp[r2])
+                elif op == ops.JMP:
+                    ip = gp[operands[0]]
+                elif op == ops.JGT:
+                    if gp[operands[0]] > 0:
+                        ip = gp[operands[1]]
+                elif op != ops.NOP:
+                    break   # Side effects
+
+                if ip == start:
+                    if gp == proc.gp:
+                        return True
+
+                    break   # Makes progress
+
+        except (KeyError, IndexError, struct.error, ZeroDivisionError, ValueError):
+            pass
+
+        self.busy.add(start)
+        return False
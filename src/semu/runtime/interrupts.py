@@ -0,0 +1,37 @@
+''' Pending interrupt lines shared by peripherals and the CPU '''
+
+import threading as th
+
+
+class Interrupts:
+    ''' One bit per line, lower lines are delivered first '''
+    mask: int   # Tested without locking, a stale read only delays delivery
+
+    def __init__(self):
+        self.mask = 0
+        self.lock = th.Lock()
+        self.requested = th.Event()     # Wakes up an idle CPU
+
+    def request(self, line: int):
+        with self.lock:
+            self.mask |= 1 << line
+            self.requested.set()
+
+    def wait(self, timeout: float):
+        self.requested.wait(timeout)
+
+    def take(self) -> int | None:
+        ''' Clears and returns the lowest pending line '''
+        with self.lock:
+            mask = self.mask
+
+            if not mask:
+                return None
+
+            lowest = mask & -mask
+            self.mask = mask ^ lowest
+
+            if not self.mask:
+                self.requested.clear()
+
+        return lowest.bit_length() - 1
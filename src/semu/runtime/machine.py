@@ -0,0 +1,330 @@
+''' Embeddable machine: run, stop, inspect and resume without exceptions '''
+
+import asyncio
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+
+from semu.runtime.memory import Memory
+from semu.runtime.clock import Clock, AsyncClock
+from semu.runtime.blocks import BlockEngine
+import semu.runtime.cpu as cpu
+import semu.runtime.aot as aot
+import semu.runtime.emulator as emulator
+import semu.runtime.snapshot as snapshots
+from semu.runtime.profiler import Profile
+from semu.runtime.trace import Tracer
+from semu.runtime.coverage import Coverage
+from semu.runtime.heatmap import Heatmap
+from semu.runtime.syscalls import Syscalls
+from semu.runtime.stacks import Region, Stacks
+import semu.runtime.debugger as debugger
+
+
+# Stop reasons
+HALT = 'halt'
+ASSERT = 'assert'
+ERROR = 'error'
+BUDGET = 'budget'   # max_instructions retired
+UNTIL = 'until'     # until_ip reached
+BREAK = debugger.BREAK  # IP is at the instruction, it has not run yet
+WATCH = debugger.WATCH  # Same, address is the memory it accesses
+
+REGISTERS = ['ip', 'sp', 'fp', 'ii']
+GP_NAMES = 'abcdefgh'
+
+FUSED = -1  # The fused loop counts its instructions itself
+
+
+class Stop(NamedTuple):
+    reason: str
+    retired: int            # by this call
+    ip: int
+    error: str | None = None
+    address: int | None = None  # Watched memory
+
+    def final(self) -> bool:
+        return self.reason in [HALT, ASSERT, ERROR]
+
+
+class Machine:
+    ''' Owns the CPU, memory and peripherals of a single guest '''
+    blocks: BlockEngine | aot.AotEngine | None
+    stopped: Stop | None    # Set once the guest can not continue
+    profile: Profile | None     # Counts every instruction, the engine is not used then
+    trace: Tracer | None        # Same, the trace is written on close
+    coverage: Coverage | None   # Same
+    heatmap: Heatmap | None     # Same
+    syscalls: Syscalls | None   # Single-steps, on top of any of the above
+    stacks: Stacks | None       # Same
+    instrumented: Callable[[], int] | None
+
+    def __init__(
+        self, engine: str = 'interp', quantum: int = 1, clock: Clock | None = None,
+        skip_idle: bool = False, cache_dir: Path | None = None, profile: bool = False,
+        trace: Path | None = None, coverage: bool = False, heatmap: bool = False,
+        syscalls: bool = False, stacks: bool = False
+    ):
+        if engine not in emulator.ENGINES:
+            raise Exception(f'Unknown engine {engine}')
+
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.memory = Memory()
+        self.cpu = emulator.boot(self.memory, quantum, clock, skip_idle)
+        self.blocks = None
+        self.loaded = False
+        self.stopped = None
+        self.debugger = debugger.Debugger(self.cpu)
+        self.profile = Profile(self.cpu) if profile else None
+        self.trace = Tracer(self.cpu, trace) if trace is not None else None
+        self.coverage = Coverage(self.cpu) if coverage else None
+        self.heatmap = Heatmap(self.cpu) if heatmap else None
+        instruments: List[Profile | Tracer | Coverage | Heatmap] = [
+            i for i in [self.profile, self.trace, self.coverage, self.heatmap] if i is not None
+        ]
+
+        if len(instruments) > 1:
+            raise Exception('Profiling, tracing, coverage and the heatmap are exclusive')
+
+        # Hooks are only called by the interpreter
+        self.cpu.hooks.extend([i.hook for i in instruments])
+        self.instrumented = (lambda: emulator.interp_step(self.cpu)) if instruments else None
+        self.syscalls = Syscalls(self.cpu) if syscalls else None
+        self.stacks = Stacks(self.cpu) if stacks else None
+        wrappers = [w for w in [self.syscalls, self.stacks] if w is not None]
+
+        if wrappers:
+            step = self.instrumented or (lambda: emulator.interp_step(self.cpu))
+
+            for wrapper in wrappers:
+                step = wrapper.wrap(step)
+
+            self.instrumented = step
+
+    def load(self, rom: bytes, snapshot: Path | None = None):
+        ''' Loads the ROM, or resumes the snapshot taken from it, and starts peripherals '''
+        if self.loaded:
+            raise Exception('Already loaded, create another machine')
+
+        if snapshot is None:
+            emulator.init_memory(self.memory, rom)
+        else:
+            (state, memory) = snapshots.load(snapshot)
+            self.memory.data = memory.data
+            self.memory.code.clear()
+            snapshots.restore(self.cpu, state)
+
+            if self.heatmap is not None:
+                self.heatmap.sp = self.cpu.sp   # Not pushed by the guest
+
+            if self.stacks is not None:
+                self.stacks.low = self.stacks.high = self.cpu.sp
+
+        if self.engine == 'blocks':
+            self.blocks = BlockEngine(self.cpu)
+        elif self.engine == 'aot':
+            module = aot.load_or_translate(rom, self.cache_dir)
+            self.blocks = aot.AotEngine(self.cpu, module, rom)
+
+        emulator.start_pp(self.cpu.pp)
+        self.loaded = True
+
+    def close(self):
+        emulator.stop_pp(self.cpu.pp)
+
+        if self.trace is not None:
+            self.trace.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # - State - #
+
+    @property
+    def retired(self) -> int:
+        return self.cpu.retired
+
+    def read_word(self, addr: int) -> int:
+        return self.memory.read_word(addr)
+
+    def write_word(self, addr: int, value: int):
+        self.memory.write_word(addr, value)
+
+    def get_register(self, name: str) -> int:
+        if name in GP_NAMES:
+            return self.cpu.gp[GP_NAMES.index(name)]
+
+        if name not in REGISTERS:
+            raise KeyError(f'Unknown register {name}')
+
+        return getattr(self.cpu, name)
+
+    def set_register(self, name: str, value: int):
+        if name in GP_NAMES:
+            self.cpu.gp[GP_NAMES.index(name)] = value
+        elif name in REGISTERS:
+            setattr(self.cpu, name, value)
+        else:
+            raise KeyError(f'Unknown register {name}')
+
+    def registers(self) -> Dict[str, int]:
+        names = REGISTERS + list(GP_NAMES)
+        return {name: self.get_register(name) for name in names}
+
+    def stack_marks(self) -> List[Region]:
+        ''' SP ranges per stack so far, the machine must be created with stacks '''
+        if self.stacks is None:
+            raise Exception('Stacks are not tracked')
+
+        return self.stacks.marks()
+
+    # - Debugging - #
+
+    def add_breakpoint(self, addr: int):
+        self.debugger.breakpoints.add(addr)
+
+    def remove_breakpoint(self, addr: int):
+        self.debugger.breakpoints.discard(addr)
+
+    def add_watchpoint(self, addr: int, size: int = 4, read: bool = False, write: bool = True):
+        self.debugger.watch(addr, size, read, write)
+
+    def remove_watchpoint(self, addr: int):
+        self.debugger.unwatch(addr)
+
+    # - Execution - #
+
+    def step(self, n: int = 1) -> Stop:
+        return self.run(max_instructions=n)
+
+    def run(self, max_instructions: int | None = None, until_ip: int | None = None) -> Stop:
+        ''' Runs until the budget is spent or until_ip is reached after at least one instruction
+
+            Breakpoints and watchpoints are not checked before the first instruction either,
+            so running again resumes past the last hit
+        '''
+        if not self.loaded:
+            raise Exception('Nothing is loaded')
+
+        if self.stopped is not None:
+            return self.stopped._replace(retired=0)
+
+        proc = self.cpu
+        start = proc.retired
+        current = None  # How the instruction that may stop the guest is counted
+        debugging = self.debugger.active()
+
+        try:
+            while True:
+                done = proc.retired - start
+
+                if max_instructions is not None and done >= max_instructions:
+                    return Stop(BUDGET, done, proc.ip)
+
+                if until_ip is not None and done > 0 and proc.ip == until_ip:
+                    return Stop(UNTIL, done, proc.ip)
+
+                if debugging and done > 0:
+                    hit = self.debugger.check()
+
+                    if hit is not None:
+                        return Stop(hit.reason, done, proc.ip, address=hit.address)
+
+                budget = None if max_instructions is None else max_instructions - done
+
+                if self.instrumented is not None:
+                    current = None
+                    proc.tick(self.instrumented())
+
+                elif debugging:
+                    current = None
+                    proc.exec_next()
+                    proc.tick(1)
+
+                elif self.engine == 'fused' and until_ip is None:
+                    current = FUSED
+                    limit = emulator.FUSED_STEPS if budget is None else budget
+                    proc.run(min(limit, emulator.FUSED_STEPS))
+
+                elif self.blocks is not None and self.block_fits(budget, until_ip):
+                    current = proc.ip
+                    proc.tick(self.blocks.step())
+
+                else:
+                    current = None
+                    proc.exec_next()
+                    proc.tick(1)
+
+        except cpu.Halt:
+            self.stopped = Stop(HALT, self.faulted(start, current), proc.ip)
+        except cpu.Assert:
+            self.stopped = Stop(ASSERT, self.faulted(start, current), proc.ip)
+        except Exception as e:
+            self.stopped = Stop(ERROR, proc.retired - start, proc.ip, repr(e))
+
+        return self.stopped
+
+    def block_fits(self, budget: int | None, until_ip: int | None) -> bool:
+        ''' The block at IP retires within the budget and does not run past until_ip '''
+        ip = self.cpu.ip
+        engine = self.blocks
+        assert engine is not None
+        block = engine.blocks.entries.get(ip)
+
+        if block is None:
+            if not isinstance(engine, BlockEngine):
+                return False    # Not translated ahead of time
+
+            block = engine.translate(ip)
+
+        (_, count) = block
+        size = engine.blocks.spans[ip]
+
+        if budget is not None and count > budget:
+            return False
+
+        return until_ip is None or not ip < until_ip < ip + size
+
+    def faulted(self, start: int, current: int | None) -> int:
+        ''' Retires instructions up to and including the one that stopped the guest '''
+        proc = self.cpu
+
+        if current is None:
+            proc.retired += 1
+        elif current != FUSED:
+            # Blocks are straight-line code, halting leaves IP past the instruction
+            addr = current
+
+            while addr < proc.ip:
+                proc.retired += 1
+                (_, _, length, _) = proc.decoded(addr)
+                addr += length
+
+        return proc.retired - start
+
+
+async def run_async(
+    machine: Machine, quantum: int = 10000, max_instructions: int | None = None
+) -> Stop:
+    ''' Runs the machine, yielding to the event loop every quantum instructions '''
+    clock = machine.cpu.clock
+    retired = 0
+
+    if isinstance(clock, AsyncClock):
+        clock.attach()
+
+    while True:
+        chunk = quantum if max_instructions is None else min(quantum, max_instructions - retired)
+        stop = machine.run(max_instructions=chunk)
+        retired += stop.retired
+
+        if stop.reason != BUDGET or retired == max_instructions:
+            return stop._replace(retired=retired)
+
+        if isinstance(clock, AsyncClock):
+            await clock.settle(machine.cpu.interrupts)
+        else:
+            await asyncio.sleep(0)
@@ -0,0 +1,68 @@
+''' Guest memory: big-endian words over a flat byte array '''
+
+import struct
+import mmap
+from typing import Sequence, Tuple
+
+from semu.common.hwconf import MEMORY_SIZE, WORD_SIZE
+from semu.runtime.codecache import CodeCache
+
+
+WORD = struct.Struct('>I')
+SIGNED = struct.Struct('>i')
+
+
+class Memory:
+    data: bytearray | mmap.mmap
+    code: CodeCache     # Decoded guest code, dropped on writes into it
+
+    def __init__(self, size: int = MEMORY_SIZE, data: bytearray | mmap.mmap | None = None):
+        self.data = data if data is not None else bytearray(size)
+        self.code = CodeCache()
+
+    def __len__(self):
+        return len(self.data)
+
+    # - Words - #
+
+    def read_word(self, addr: int) -> int:
+        return WORD.unpack_from(self.data, addr)[0]
+
+    def read_signed(self, addr: int) -> int:
+        return SIGNED.unpack_from(self.data, addr)[0]
+
+    def write_word(self, addr: int, value: int):
+        WORD.pack_into(self.data, addr, value)
+        self.written(addr)
+
+    def write_signed(self, addr: int, value: int):
+        SIGNED.pack_into(self.data, addr, value)
+        self.written(addr)
+
+    def written(self, addr: int):
+        words = self.code.words
+
+        if addr // WORD_SIZE in words or (addr + WORD_SIZE - 1) // WORD_SIZE in words:
+            self.code.invalidate(addr)
+
+    # - Ranges - #
+
+    def check_range(self, addr: int, size: int):
+        if addr < 0 or addr + size > len(self.data):
+            raise IndexError(f'Memory range 0x{addr:X}+{size} is out of bounds')
+
+    def read_block(self, addr: int, size: int) -> bytes:
+        self.check_range(addr, size)
+        return bytes(self.data[addr:addr + size])
+
+    def write_block(self, addr: int, buf: bytes):
+        self.check_range(addr, len(buf))
+        self.data[addr:addr + len(buf)] = buf
+        self.code.invalidate(addr, len(buf))
+
+    def read_words(self, addr: int, count: int) -> Tuple[int, ...]:
+        return struct.unpack_from(f'>{count}I', self.data, addr)
+
+    def write_words(self, addr: int, values: Sequence[int]):
+        struct.pack_into(f'>{len(values)}I', self.data, addr, *values)
+        self.code.invalidate(addr, len(values) * WORD_SIZE)
@@ -0,0 +1,110 @@
+''' Periodic metrics: Prometheus text file and JSON lines, formatted off the CPU thread '''
+
+import os
+import json
+import time
+import logging as lg
+import threading as th
+from pathlib import Path
+from typing import List, NamedTuple
+
+from semu.common.hwconf import SERIAL_LINE
+import semu.runtime.cpu as cpu
+
+
+INTERVAL = 10.0     # seconds
+
+PREFIX = 'semu_'
+
+
+class Sample(NamedTuple):
+    timestamp: float    # Unix time
+    elapsed: float      # Monotonic seconds since the previous sample
+    retired: int
+    ips: float
+    delivered: List[int]    # Interrupts per line
+    serial: int         # Serial transfers
+    switches: int
+    ip: int
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, text: str, values: List[str]):
+            lines.append(f'# HELP {PREFIX}{name} {text}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+            lines.extend([f'{PREFIX}{name}{value}' for value in values])
+
+        interrupts = [f'{{line="{line}"}} {n}' for (line, n) in enumerate(self.delivered) if n]
+
+        metric('instructions_retired_total', 'counter', 'Instructions', [f' {self.retired}'])
+        metric('instructions_per_second', 'gauge', 'Since the last sample', [f' {self.ips:.1f}'])
+        metric('interrupts_total', 'counter', 'Interrupts delivered per line', interrupts)
+        metric('serial_transfers_total', 'counter', 'Serial words sent', [f' {self.serial}'])
+        metric('context_switches_total', 'counter', 'Loads by lsp', [f' {self.switches}'])
+        metric('ip', 'gauge', 'Instruction pointer when sampled', [f' {self.ip}'])
+        return '\n'.join(lines) + '\n'
+
+    def json(self) -> str:
+        return json.dumps(self._asdict())
+
+
+class Exporter(th.Thread):
+    ''' Reads the CPU counters every interval, the CPU thread only increments them '''
+
+    def __init__(
+        self, proc: cpu.CPU, prometheus: Path | None = None, jsonl: Path | None = None,
+        interval: float = INTERVAL
+    ):
+        super().__init__(name='metrics', daemon=True)
+        self.cpu = proc
+        self.prometheus = prometheus
+        self.jsonl = jsonl
+        self.interval = interval
+        self.stop_event = th.Event()
+        self.retired = proc.retired
+        self.last = time.monotonic()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        ''' Writes the final sample '''
+        self.stop_event.set()
+
+        if self.is_alive():
+            self.join()
+
+        self.dump()
+
+    def sample(self) -> Sample:
+        proc = self.cpu
+        now = time.monotonic()
+        retired = proc.retired
+        elapsed = now - self.last
+        ips = (retired - self.retired) / elapsed if elapsed > 0 else 0.0
+        (self.retired, self.last) = (retired, now)
+        serial = getattr(proc.pp.get(SERIAL_LINE), 'transfers', 0)
+
+        return Sample(
+            time.time(), elapsed, retired, ips, list(proc.delivered), serial, proc.switches,
+            proc.ip
+        )
+
+    def dump(self):
+        sample = self.sample()
+
+        try:
+            if self.prometheus is not None:
+                # Scrapers must not see a partly written file
+                temp = self.prometheus.with_name(self.prometheus.name + '.tmp')
+                temp.write_text(sample.prometheus())
+                os.replace(temp, self.prometheus)
+
+            if self.jsonl is not None:
+                with self.jsonl.open('a') as f:
+                    f.write(sample.json() + '\n')
+
+        except OSError as e:
+            lg.warning(f'Metrics are not written: {e}')
@@ -1,34 +1,55 @@
 import logging as lg
 import threading as th
-import time
 import socket
-from typing import Mapping
+import struct
+from typing import Any, Dict, List, Mapping
 
 import semu.common.hwconf as hw
+from semu.runtime.memory import Memory
+from semu.runtime.interrupts import Interrupts
+from semu.runtime.clock import Clock, Event, LoopTimer, VirtualClock
 
 
 class Peripheral(th.Thread):
-    def __init__(self, memory: bytearray):
+    ''' Runs on its own thread, or synchronously on the CPU thread if the clock is not threaded '''
+
+    def __init__(self, memory: Memory, interrupts: Interrupts, line: int, clock: Clock):
         super().__init__()
         self.memory = memory
-        self.in_event = th.Event()
-        self.out_event = th.Event()
-        self.stop_event = th.Event()
+        self.interrupts = interrupts
+        self.line = line
+        self.clock = clock
+        self.out_event: Event = clock.event()
+        self.stop_event: Event = clock.event()
+
+    def start(self):
+        if self.clock.threaded:
+            super().start()
+
+        self.on_start()
 
     def stop(self):
+        if not self.clock.threaded:
+            self.on_stop()
+            return
+
         self.stop_event.set()
         self.out_event.set()
 
+    def join(self, timeout: float | None = None):
+        if self.is_alive():
+            super().join(timeout)
+
     def signal(self):
+        if not self.clock.threaded:
+            self.process_in_signal()
+            return
+
         self.out_event.set()
-        time.sleep(0.01)
+        self.clock.signal()
 
-    def has_signal(self):
-        if self.in_event.is_set():
-            self.in_event.clear()
-            return True
-        else:
-            return False
+    def request_interrupt(self):
+        self.interrupts.request(self.line)
 
     def run(self):
         while True:
@@ -46,47 +67,135 @@ class Peripheral(th.Thread):
     def process_in_signal(self):
         pass
 
+    # Device state for snapshots, loaded before the start
+    def save_state(self) -> Dict[str, Any]:
+        return {}
+
+    def load_state(self, state: Dict[str, Any]):
+        pass
+
+    def on_start(self):
+        pass
+
     def on_stop(self):
         pass
 
 
 class SysTimer(Peripheral):
-    def __init__(self, memory: bytearray):
-        super().__init__(memory)
+    def __init__(self, memory: Memory, interrupts: Interrupts, clock: Clock):
+        super().__init__(memory, interrupts, hw.SYSTIMER_LINE, clock)
         self.gen_signal = False      # Starts disactivated
+        self.timer: th.Timer | LoopTimer | None = None  # Host time clocks
+        self.deadline: int | None = None    # Next tick in virtual time
 
-    def start(self):
-        super().start()
-        self.restart_timer()
+    def save_state(self) -> Dict[str, Any]:
+        return {'gen_signal': self.gen_signal, 'deadline': self.deadline}
+
+    def load_state(self, state: Dict[str, Any]):
+        self.gen_signal = state['gen_signal']
+        self.deadline = state['deadline']
+
+    def on_start(self):
+        self.restart_timer(self.deadline)
 
-    def restart_timer(self):
-        self.timer = th.Timer(1.0, self.on_timer)
-        self.timer.start()
+    def restart_timer(self, deadline: int | None = None):
+        clock = self.clock
+
+        if isinstance(clock, VirtualClock):
+            tick = clock.now + clock.timer_period if deadline is None else deadline
+            self.deadline = tick
+            clock.schedule_at(tick, self.on_timer)
+            return
+
+        self.timer = clock.start_timer(self.on_timer)
 
     def on_timer(self):
         self.restart_timer()
 
         if self.gen_signal:
             lg.debug('System timer')
-            self.in_event.set()
+            self.request_interrupt()
 
     def process_in_signal(self):
         self.gen_signal = not self.gen_signal
 
     def on_stop(self):
-        self.timer.cancel()
+        if self.timer is not None:
+            self.timer.cancel()
 
 
 class Serial(Peripheral):
-    def __init__(self, memory: bytearray):
-        super().__init__(memory)
+    captured: List[str] | None  # Characters sent, when capturing
+    transfers: int              # Words sent, a character each
+
+    def __init__(self, memory: Memory, interrupts: Interrupts, clock: Clock):
+        super().__init__(memory, interrupts, hw.SERIAL_LINE, clock)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.captured = None
+        self.transfers = 0
 
     def process_in_signal(self):
-        addr = hw.SERIAL_MM_BASE
-        buf = self.memory[addr:addr + 4]
+        buf = self.memory.read_block(hw.SERIAL_MM_BASE, hw.SERIAL_MM_SIZE)
         self.sock.sendto(buf, (hw.CTL_SER_UDP_IP, hw.CTL_SER_UDP_PORT))
-        time.sleep(hw.SERIAL_DELAY)
+        self.transfers += 1
+
+        if self.captured is not None:
+            (word,) = struct.unpack('>I', buf)
+            self.captured.append(chr(word) if word <= 0x10FFFF else '\ufffd')
+
+        self.clock.serial()
+
+
+class PerfCounters:
+    ''' Copies CPU counters into its mapped words when the guest signals it
+
+        A plain device without a thread: it runs on the CPU thread whatever the clock, so the
+        counters do not move between out and the reads after it. Cycles only exist with a virtual
+        clock and are zero otherwise. Virtual time advances at polls, so under the fused loop
+        cycles lag retired instructions by up to the quantum, and by up to a block under blocks
+    '''
+    cpu: Any    # Set once the CPU is created, it owns the devices
+    base: List[int]     # Counters at the last reset
+
+    def __init__(self, memory: Memory, clock: Clock):
+        self.memory = memory
+        self.line = hw.PERF_LINE
+        self.clock = clock
+        self.cpu = None
+        self.base = [0] * (2 + hw.PERF_LINES)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def join(self, timeout: float | None = None):
+        pass
+
+    def save_state(self) -> Dict[str, Any]:
+        return {'base': self.base}
+
+    def load_state(self, state: Dict[str, Any]):
+        self.base = list(state['base'])
+
+    def counters(self) -> List[int]:
+        proc = self.cpu
+        cycles = self.clock.now if isinstance(self.clock, VirtualClock) else 0
+        return [proc.retired + proc.uncounted, cycles] + proc.delivered[:hw.PERF_LINES]
+
+    def signal(self):
+        command = self.memory.read_word(hw.PERF_CONTROL)
+        counters = self.counters()
+
+        if command == hw.PERF_RESET:
+            self.base = counters
+
+        if command in [hw.PERF_SNAPSHOT, hw.PERF_RESET]:
+            for (i, (n, base)) in enumerate(zip(counters, self.base)):
+                self.memory.write_word(hw.PERF_RETIRED + i * hw.WORD_SIZE, (n - base) & 0xFFFFFFFF)
+
+        self.memory.write_word(hw.PERF_CONTROL, 0)  # Done
 
 
-Peripherals = Mapping[int, Peripheral]
+Peripherals = Mapping[int, Peripheral | PerfCounters]
@@ -0,0 +1,185 @@
+''' Guest instruction profiler: retired instructions per opcode and per address '''
+
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import semu.common.ops as ops
+from semu.common.hwconf import WORD_SIZE
+from semu.common.symbols import SymbolMap
+import semu.runtime.cpu as cpu
+from semu.runtime.clock import VirtualClock
+from semu.runtime.superops import Entry
+
+
+OPCODES = 256
+TOP = 20    # Rows per report section
+
+MAX_DEPTH = 64
+
+# Frame layouts below FP
+CALL_RETURN = 2 * WORD_SIZE         # cll: return address, fp
+INTERRUPT_RETURN = 10 * WORD_SIZE   # interrupt: ip, a..h, fp
+CALL_SIZE = 2 * WORD_SIZE           # cll and its register
+
+
+class Profile:
+    ''' Counters live in arrays allocated up front, a step only increments two of them '''
+    by_ip: array
+    by_opcode: array
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.by_ip = array('Q', bytes(8 * len(proc.memory.data)))
+        self.by_opcode = array('Q', bytes(8 * OPCODES))
+        self.delivered = list(proc.delivered)   # Interrupts before profiling started
+        self.start = proc.retired
+
+    def hook(self, ip: int, entry: Entry):
+        ''' Counts the instruction about to run '''
+        self.by_ip[ip] += 1
+        self.by_opcode[entry[3]] += 1
+
+    def interrupts(self) -> List[int]:
+        return [n - before for (n, before) in zip(self.cpu.delivered, self.delivered)]
+
+    def hot_addresses(self) -> List[Tuple[int, int]]:
+        ''' (address, count), hottest first '''
+        counts = [(addr, n) for (addr, n) in enumerate(self.by_ip) if n]
+        return sorted(counts, key=lambda c: c[1], reverse=True)
+
+    def by_label(self, symbols: SymbolMap) -> List[Tuple[str, int]]:
+        totals: Dict[str, int] = {}
+
+        for (addr, n) in self.hot_addresses():
+            symbol = symbols.lookup(addr)
+            name = symbol.qname() if symbol is not None else '?'
+            totals[name] = totals.get(name, 0) + n
+
+        return sorted(totals.items(), key=lambda t: t[1], reverse=True)
+
+    def report(self, symbols: SymbolMap | None = None, top: int = TOP) -> str:
+        retired = sum(self.by_opcode)
+        lines = [f'Retired: {retired}']
+
+        clock = self.cpu.clock
+
+        if isinstance(clock, VirtualClock):
+            lines.append(f'Cycles: {clock.now}')
+
+        def share(n: int) -> str:
+            return f'{n:12} {100 * n / retired:6.2f}%' if retired else f'{n:12}'
+
+        interrupts = self.interrupts()
+        lines.append('')
+        lines.append('Interrupts per line:')
+        lines.extend([f'  {line:2} {n:12}' for (line, n) in enumerate(interrupts) if n])
+
+        opcodes = [(op, n) for (op, n) in enumerate(self.by_opcode) if n]
+        lines.append('')
+        lines.append('Opcodes:')
+
+        for (op, n) in sorted(opcodes, key=lambda c: c[1], reverse=True):
+            lines.append(f'  {ops.MNEMONICS.get(op, hex(op)):8} {share(n)}')
+
+        if symbols is not None:
+            lines.append('')
+            lines.append('Labels:')
+            lines.extend([f'  {share(n)} {name}' for (name, n) in self.by_label(symbols)[:top]])
+
+        lines.append('')
+        lines.append('Addresses:')
+
+        for (addr, n) in self.hot_addresses()[:top]:
+            entry = self.cpu.code.entries.get(addr)
+            mnemonic = ops.MNEMONICS.get(entry[3], '?') if entry is not None else '?'
+            where = symbols.resolve(addr) if symbols is not None else ''
+            lines.append(f'  0x{addr:08X} {mnemonic:8} {share(n)} {where}'.rstrip())
+
+        return '\n'.join(lines) + '\n'
+
+
+class Sampler:
+    ''' Walks the guest frame pointer chain every period instructions '''
+    stacks: Dict[Tuple[int, ...], int]  # Code addresses, innermost first -> samples
+
+    def __init__(self, proc: cpu.CPU, period: int = 1000):
+        self.cpu = proc
+        self.period = period
+        self.countdown = period
+        self.stacks = dict()
+
+    def wrap(self, step: Callable[[], int]) -> Callable[[], int]:
+        def sampled() -> int:
+            retired = step()
+            self.countdown -= retired
+
+            if self.countdown <= 0:
+                self.countdown += self.period
+                self.sample()
+
+            return retired
+
+        return sampled
+
+    def walk(self) -> Tuple[int, ...]:
+        proc = self.cpu
+        memory = proc.memory
+        frames = [proc.ip]
+        fp = proc.fp
+        limit = len(memory) - WORD_SIZE     # Last address a word can be read from
+
+        # Global code has no frame
+        while fp and len(frames) < MAX_DEPTH:
+            interrupted = fp in proc.frames
+            below = INTERRUPT_RETURN if interrupted else CALL_RETURN
+
+            # Garbage in fp, outside of any frame
+            if fp < below or fp - WORD_SIZE > limit:
+                break
+
+            caller = memory.read_word(fp - WORD_SIZE)
+            addr = memory.read_word(fp - below)
+
+            if not interrupted:
+                # Thread entry frames are laid out by the kernel, nothing called them
+                if not CALL_SIZE <= addr <= limit + CALL_SIZE:
+                    break
+
+                if memory.read_word(addr - CALL_SIZE) != ops.CLL:
+                    break
+
+                # Return addresses may point past the caller's last instruction
+                addr -= CALL_SIZE
+
+            frames.append(addr)
+
+            # Stacks grow up
+            if caller >= fp:
+                break
+
+            fp = caller
+
+        return tuple(frames)
+
+    def sample(self):
+        stack = self.walk()
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def folded(self, symbols: SymbolMap | None = None) -> List[str]:
+        ''' Stack collapse format, outermost frame first: "a;b;c count" '''
+        def name(addr: int) -> str:
+            symbol = symbols.lookup(addr) if symbols is not None else None
+            return symbol.qname() if symbol is not None else f'0x{addr:X}'
+
+        totals: Dict[str, int] = {}
+
+        for (stack, n) in self.stacks.items():
+            names = [name(addr) for addr in stack]
+            line = ';'.join(reversed(names))
+            totals[line] = totals.get(line, 0) + n
+
+        return [f'{line} {n}' for (line, n) in sorted(totals.items())]
+
+    def write(self, path: Path, symbols: SymbolMap | None = None):
+        path.write_text(''.join(f'{line}\n' for line in self.folded(symbols)))
@@ -0,0 +1,102 @@
+''' Machine snapshots: registers and device state followed by a page-aligned memory image '''
+
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from semu.common.hwconf import PERIPHERALS
+from semu.runtime.memory import Memory
+from semu.runtime.clock import VirtualClock
+import semu.runtime.cpu as cpu
+
+
+MAGIC = b'SEMUSNAP'
+VERSION = 3
+
+# Magic, version, state length; JSON state follows
+HEADER = struct.Struct('>8sII')
+
+# Memory image starts at an offset mmap accepts
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+
+State = Dict[str, Any]
+
+
+def capture(proc: cpu.CPU) -> State:
+    state: State = {
+        'ip': proc.ip,
+        'sp': proc.sp,
+        'fp': proc.fp,
+        'ii': proc.ii,
+        'gp': list(proc.gp),
+        'countdown': proc.countdown,
+        'retired': proc.retired,
+        'delivered': list(proc.delivered),
+        'switches': proc.switches,
+        'frames': sorted(proc.frames),
+        'busy_loops': sorted(proc.idle_detector.busy),
+        'interrupts': proc.interrupts.mask,
+        'peripherals': {str(line): p.save_state() for (line, p) in proc.pp.items()},
+        'memory_size': len(proc.memory)
+    }
+
+    if isinstance(proc.clock, VirtualClock):
+        state['clock'] = proc.clock.now
+
+    return state
+
+
+def save(path: Path, proc: cpu.CPU):
+    state = json.dumps(capture(proc)).encode()
+    header = HEADER.pack(MAGIC, VERSION, len(state)) + state
+    padding = -len(header) % ALIGNMENT
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'wb') as f:
+        f.write(header + bytes(padding))
+        f.write(proc.memory.data)
+
+
+def load(path: Path) -> Tuple[State, Memory]:
+    ''' Memory maps the image copy-on-write, the file itself is never modified '''
+    with open(path, 'rb') as f:
+        (magic, version, length) = HEADER.unpack(f.read(HEADER.size))
+
+        if magic != MAGIC or version != VERSION:
+            raise Exception(f'{path} is not a snapshot of version {VERSION}')
+
+        state = json.loads(f.read(length))
+        offset = HEADER.size + length
+        offset += -offset % ALIGNMENT
+        size = state['memory_size']
+        data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY, offset=offset)
+
+    return (state, Memory(size, data))
+
+
+def restore(proc: cpu.CPU, state: State):
+    ''' Restores everything but memory, before peripherals are started '''
+    proc.ip = state['ip']
+    proc.sp = state['sp']
+    proc.fp = state['fp']
+    proc.ii = state['ii']
+    proc.gp[:] = state['gp']
+    proc.countdown = state['countdown']
+    proc.retired = state['retired']
+    proc.delivered[:] = state['delivered']
+    proc.switches = state['switches']
+    proc.frames.clear()
+    proc.frames.update(state['frames'])
+    proc.idle_detector.busy = set(state['busy_loops'])
+
+    for line in range(PERIPHERALS):
+        if state['interrupts'] >> line & 1:
+            proc.interrupts.request(line)
+
+    if isinstance(proc.clock, VirtualClock) and 'clock' in state:
+        proc.clock.now = state['clock']
+
+    for (line, p) in proc.pp.items():
+        p.load_state(state['peripherals'][str(line)])
@@ -0,0 +1,93 @@
+''' Stack high-water marks: SP ranges between lsp context switches, merged per stack region '''
+
+from typing import Callable, List, NamedTuple
+
+import semu.common.ops as ops
+from semu.common.symbols import DATA, SymbolMap
+import semu.runtime.cpu as cpu
+
+
+class Region(NamedTuple):
+    low: int    # Lowest SP seen, stacks grow up from there
+    high: int   # Highest SP seen, the stack is used below it
+
+    def used(self) -> int:
+        return self.high - self.low
+
+
+class Stacks:
+    ''' Each lsp switches to another stack, SP ranges of distinct threads do not overlap
+
+        Interrupt frames pushed between instructions are seen by the next one
+    '''
+    regions: List[Region]   # Sorted and disjoint
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.low = proc.sp  # Since the last lsp
+        self.high = proc.sp
+        self.regions = list()
+
+    def wrap(self, step: Callable[[], int]) -> Callable[[], int]:
+        ''' The step must retire one instruction at a time '''
+        def tracked() -> int:
+            proc = self.cpu
+            sp = proc.sp
+
+            if sp < self.low:
+                self.low = sp
+            elif sp > self.high:
+                self.high = sp
+
+            (_, _, _, op) = proc.decoded(proc.ip)
+
+            if op != ops.LSP:
+                return step()
+
+            self.close()
+            retired = step()
+            self.low = self.high = proc.sp
+            return retired
+
+        return tracked
+
+    def close(self):
+        ''' Merges SP range since the last switch into the regions it overlaps '''
+        if self.low == self.high:
+            return  # The stack was not used
+
+        merged = Region(self.low, self.high)
+        rest = []
+
+        for region in self.regions:
+            if region.low <= merged.high and merged.low <= region.high:
+                merged = Region(min(region.low, merged.low), max(region.high, merged.high))
+            else:
+                rest.append(region)
+
+        rest.append(merged)
+        self.regions = sorted(rest)
+
+    def marks(self) -> List[Region]:
+        ''' Regions including the running stack, merging it again later changes nothing '''
+        sp = self.cpu.sp
+        (self.low, self.high) = (min(self.low, sp), max(self.high, sp))
+        self.close()
+        return list(self.regions)
+
+    def report(self, symbols: SymbolMap | None = None) -> str:
+        lines = []
+
+        for region in self.marks():
+            symbol = symbols.lookup(region.low) if symbols is not None else None
+
+            if symbol is None or symbol.kind != DATA:
+                lines.append(f'{region.used():8} bytes  0x{region.low:X}..0x{region.high:X}')
+                continue
+
+            used = region.high - symbol.address
+            lines.append(
+                f'{used:8}/{symbol.size:<8} {100 * used / symbol.size:6.1f}%  {symbol.qname()}'
+            )
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,87 @@
+''' Superinstructions: macro-generated idioms executed as a single operation '''
+
+import struct
+from typing import Callable, Tuple
+
+import semu.common.ops as ops
+
+
+# Pseudo-opcodes, outside of the instruction set range
+LLOAD = 0x100   # ldc off x; lla x x; mmr x r
+LSTORE = 0x101  # ldc off x; lla x x; mrm r x
+PTR = 0x102     # mrr s x; ldc off y; add x y t
+CALL = 0x103    # ldr &f x; cll x
+
+FIRST = LLOAD
+
+# Instructions retired by each
+SIZES = {LLOAD: 3, LSTORE: 3, PTR: 3, CALL: 2}
+
+# (handler, operands, length, opcode), see CPU.decode
+Entry = Tuple[Callable, Tuple[int, ...], int, int]
+
+
+# Reference implementations replay the original instructions
+
+def lload(cpu, off: int, x: int, r: int):
+    cpu.ldc(off, x)
+    cpu.lla(x, x)
+    cpu.mmr(x, r)
+
+
+def lstore(cpu, off: int, x: int, r: int):
+    cpu.ldc(off, x)
+    cpu.lla(x, x)
+    cpu.mrm(r, x)
+
+
+def ptr(cpu, s: int, x: int, off: int, y: int, t: int):
+    cpu.mrr(s, x)
+    cpu.ldc(off, y)
+    cpu.add(x, y, t)
+
+
+def call(cpu, target: int, x: int):
+    cpu.ldr(target, x)
+    cpu.cll(x)
+
+
+def fuse(decode: Callable[[int], Entry], addr: int, first: Entry) -> Entry | None:
+    ''' Matches the sequence starting with an already decoded instruction
+
+        decode only peeks at what follows, the caller caches the instructions of a match
+    '''
+    (_, a, length, op) = first
+
+    if op not in [ops.LDC, ops.MRR, ops.LDR]:
+        return None
+
+    try:
+        (_, b, length2, op2) = decode(addr + length)
+
+        if op == ops.LDR and op2 == ops.CLL and b[0] == a[1]:
+            return (call, a, length + length2, CALL)
+
+        (_, c, length3, op3) = decode(addr + length + length2)
+    except (KeyError, IndexError, struct.error):
+        return None     # Whatever follows is not code
+
+    total = length + length2 + length3
+
+    if op == ops.LDC and op2 == ops.LLA and b == (a[1], a[1]):
+        x = a[1]
+
+        if op3 == ops.MMR and c[0] == x:
+            return (lload, (a[0], x, c[1]), total, LLOAD)
+
+        if op3 == ops.MRM and c[1] == x:
+            return (lstore, (a[0], x, c[0]), total, LSTORE)
+
+    if op == ops.MRR and op2 == ops.LDC and op3 == ops.ADD:
+        x = a[1]
+        y = b[1]
+
+        if x != y and c[:2] == (x, y):
+            return (ptr, (a[0], x, b[0], y, c[2]), total, PTR)
+
+    return None
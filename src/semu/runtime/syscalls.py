@@ -0,0 +1,106 @@
+''' Kernel service tracer: loopback interrupts matched with the irx leaving the kernel '''
+
+from typing import Callable, Dict, List, Tuple
+
+import semu.common.ops as ops
+from semu.common.hwconf import LOOPBACK_LINE
+import semu.runtime.cpu as cpu
+
+
+SERVICE = 7     # h holds the service number
+
+# LOOPBACK_* constants of the kernel
+SERVICES = ['Suspend', 'WriteSerial', 'CreateThread', 'LockMutex', 'UnlockMutex']
+
+BAR = 40    # Widest histogram bar
+
+
+def service_name(service: int) -> str:
+    return SERVICES[service] if 0 <= service < len(SERVICES) else f'service {service}'
+
+
+class Service:
+    ''' Latencies in retired instructions, from int up to and including irx '''
+    histogram: Dict[int, int]   # bit length of the latency -> calls
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.low: int | None = None
+        self.high = 0
+        self.histogram = {}
+
+    def add(self, latency: int):
+        self.calls += 1
+        self.total += latency
+        self.low = latency if self.low is None else min(self.low, latency)
+        self.high = max(self.high, latency)
+        bucket = latency.bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+
+class Syscalls:
+    ''' Interrupts are inhibited in the kernel, so the next irx after a loopback leaves it
+
+        Suspend leaves through the scheduler, its latency includes the thread switch
+    '''
+    services: Dict[int, Service]
+
+    def __init__(self, proc: cpu.CPU):
+        self.cpu = proc
+        self.retired = 0
+        self.pending: Tuple[int, int] | None = None     # service, retired before int
+        self.services = dict()
+
+    def wrap(self, step: Callable[[], int]) -> Callable[[], int]:
+        ''' The step must retire one instruction at a time '''
+        def traced() -> int:
+            proc = self.cpu
+            (_, _, _, op) = proc.decoded(proc.ip)
+
+            if op == ops.INT:
+                service = proc.gp[SERVICE]
+                delivered = proc.delivered[LOOPBACK_LINE]
+                retired = step()
+
+                # Ignored while interrupts are inhibited
+                if proc.delivered[LOOPBACK_LINE] != delivered:
+                    self.pending = (service, self.retired)
+
+            elif op == ops.IRX and self.pending is not None:
+                retired = step()
+                (service, start) = self.pending
+                self.pending = None
+                self.services.setdefault(service, Service()).add(self.retired + retired - start)
+
+            else:
+                retired = step()
+
+            self.retired += retired
+            return retired
+
+        return traced
+
+    def report(self) -> str:
+        lines = []
+
+        for (service, stats) in sorted(self.services.items()):
+            mean = stats.total / stats.calls
+            lines.append(
+                f'{service_name(service)}: {stats.calls} calls, '
+                f'latency min {stats.low} mean {mean:.1f} max {stats.high}'
+            )
+
+            widest = max(stats.histogram.values())
+
+            for (bucket, n) in sorted(stats.histogram.items()):
+                (low, high) = (1 << (bucket - 1), (1 << bucket) - 1) if bucket else (0, 0)
+                bar = '#' * max(1, BAR * n // widest)
+                lines.append(f'  {low:8}..{high:<8} {n:10} {bar}')
+
+            lines.append('')
+
+        return '\n'.join(lines)
+
+    def counts(self) -> List[Tuple[str, int]]:
+        return [(service_name(s), stats.calls) for (s, stats) in sorted(self.services.items())]
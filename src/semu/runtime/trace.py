@@ -0,0 +1,151 @@
+''' Execution trace: fixed-size binary records in a ring buffer or streamed to a file '''
+
+import struct
+import logging as lg
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+
+import click
+
+import semu.common.ops as ops
+from semu.common.symbols import SymbolMap
+import semu.runtime.cpu as cpu
+from semu.runtime.superops import Entry
+
+
+MAGIC = b'SEMUTRAC'
+VERSION = 1
+HEADER = struct.Struct('>8sI')
+
+# ip, opcode, three operands as decoded (zero when unused), sp before the instruction
+RECORD = struct.Struct('<6I')
+WORD_MASK = 0xFFFFFFFF
+
+CAPACITY = 1 << 20  # records, the last million instructions
+
+REGISTERS = 'abcdefgh'
+
+
+class Record(NamedTuple):
+    ip: int
+    op: int
+    operands: tuple
+    sp: int
+
+
+class Tracer:
+    ''' Records every instruction before it runs, the buffer is allocated once '''
+
+    def __init__(self, proc: cpu.CPU, path: Path, capacity: int = CAPACITY, stream: bool = False):
+        self.cpu = proc
+        self.path = path
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.position = 0   # Next record
+        self.wrapped = False
+        self.stream = stream
+        self.file: BinaryIO | None = None
+
+        if stream:
+            # Full buffers are written out instead of being overwritten
+            self.file = path.open('wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+
+    def hook(self, ip: int, entry: Entry):
+        (_, operands, _, op) = entry
+        padded = operands + (0, 0, 0)
+
+        RECORD.pack_into(
+            self.buffer, self.position * RECORD.size, ip, op,
+            padded[0] & WORD_MASK, padded[1] & WORD_MASK, padded[2] & WORD_MASK, self.cpu.sp
+        )
+
+        self.position += 1
+
+        if self.position == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.write(memoryview(self.buffer)[:self.position * RECORD.size])
+        else:
+            self.wrapped = True
+
+        self.position = 0
+
+    def close(self):
+        ''' Streams the rest, or saves the ring oldest record first '''
+        end = self.position * RECORD.size
+
+        if self.stream:
+            if self.file is not None:
+                self.file.write(memoryview(self.buffer)[:end])
+                self.file.close()
+                self.file = None
+
+            return
+
+        with self.path.open('wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION))
+
+            if self.wrapped:
+                f.write(memoryview(self.buffer)[end:])
+
+            f.write(memoryview(self.buffer)[:end])
+
+
+def read(path: Path) -> Iterator[Record]:
+    with path.open('rb') as f:
+        (magic, version) = HEADER.unpack(f.read(HEADER.size))
+
+        if magic != MAGIC or version != VERSION:
+            raise Exception(f'Not a trace file {path}')
+
+        while chunk := f.read(RECORD.size * 4096):
+            for (ip, op, a, b, c, sp) in RECORD.iter_unpack(chunk):
+                kinds = ops.OPERANDS.get(op, '')
+                yield Record(ip, op, (a, b, c)[:len(kinds)], sp)
+
+
+def format_operand(kind: str, word: int) -> str:
+    if kind == 'r':
+        return REGISTERS[word] if word < len(REGISTERS) else f'?{word}'
+
+    if kind == 'o':
+        return f'&0x{word:X}'  # Decoded as an absolute address
+
+    if kind == 's' and word & 0x80000000:
+        return str(word - (1 << 32))
+
+    return str(word)
+
+
+def format_record(record: Record, symbols: SymbolMap | None = None) -> str:
+    kinds = ops.OPERANDS.get(record.op, '')
+    mnemonic = ops.MNEMONICS.get(record.op, f'0x{record.op:X}')
+    operands = [format_operand(kind, word) for (kind, word) in zip(kinds, record.operands)]
+    instruction = ' '.join([mnemonic] + operands)
+    where = symbols.resolve(record.ip) if symbols is not None else ''
+    return f'0x{record.ip:08X}  {instruction:24}  sp=0x{record.sp:08X}  {where}'.rstrip()
+
+
+@click.command()
+@click.option('-m', '--map', 'symbol_map', type=Path, help='Symbol map from the assembler')
+@click.option('--last', type=click.IntRange(min=1), help='Only the last records')
+@click.argument('trace_path', type=Path)
+def decode(symbol_map: Path | None, last: int | None, trace_path: Path):
+    ''' Prints a trace written by semu.runtime.emulator run --trace '''
+    lg.basicConfig(level=lg.INFO)
+    symbols = SymbolMap.load(symbol_map) if symbol_map is not None else None
+    records: Iterable[Record] = read(trace_path)
+
+    if last is not None:
+        records = deque(records, maxlen=last)
+
+    for record in records:
+        print(format_record(record, symbols))
+
+
+if __name__ == '__main__':
+    decode()
@@ -1,9 +1,11 @@
 import logging as lg
-from typing import cast
+from typing import List, NamedTuple, Tuple, cast
 import struct
 
 import semu.sasm.mfpp as mfpp
 import semu.sasm.mgrammar as mgrammar
+from semu.sasm.fpp import SourceLine
+from semu.common.symbols import SymbolMap
 
 
 class CompilationItem:
@@ -22,7 +24,13 @@ class CompilationItem:
         return self
 
 
-def compile_items(compile_items: list[CompilationItem]) -> bytes:
+class Program(NamedTuple):
+    binary: bytes
+    symbols: SymbolMap
+    lines: List[SourceLine]     # In ROM order
+
+
+def assemble(compile_items: list[CompilationItem]) -> Program:
     # First pass
     first_pass = mfpp.MacroFPP()
 
@@ -52,4 +60,15 @@ def compile_items(compile_items: list[CompilationItem]) -> bytes:
         bytestr += cast(bytes, new_bytes)
 
     # Dumping results
-    return bytes(bytestr)
+    symbols = SymbolMap.from_labels(first_pass.label_dict, first_pass.data_labels, len(bytestr))
+    return Program(bytes(bytestr), symbols, first_pass.lines)
+
+
+def compile_program(compile_items: list[CompilationItem]) -> Tuple[bytes, SymbolMap]:
+    program = assemble(compile_items)
+    return (program.binary, program.symbols)
+
+
+def compile_items(compile_items: list[CompilationItem]) -> bytes:
+    (binary, _) = compile_program(compile_items)
+    return binary
@@ -1,23 +1,34 @@
 import struct
 import logging as lg
-from typing import List, Tuple, Dict, Any
+from typing import List, NamedTuple, Tuple, Dict, Set, Any
 
 from semu.common.hwconf import WORD_SIZE
 
 Tokens = List[Any]
 
 
+class SourceLine(NamedTuple):
+    offset: int     # from the start of ROM
+    namespace: str
+    lineno: int
+    text: str
+
+
 class FPP:
     ''' First pass processor '''
     cmd_list: List[Tuple[str, bytes | Tuple[int, str]]]
     label_dict: Dict[str, int]
+    data_labels: Set[str]
     namespace: str
+    lines: List[SourceLine]
 
     def __init__(self):
         self.cmd_list = list()
         self.offset = 0
         self.namespace = '<global>'
         self.label_dict = dict()
+        self.data_labels = set()
+        self.lines = list()
 
     def get_qualified_name(self, name: str, namespace: str | None = None):
         assert self.namespace
@@ -73,6 +84,10 @@ class FPP:
         self.label_dict[qlabelname] = self.offset
         lg.debug(f'Label {qlabelname} @ 0x{self.offset:X}')
 
+    def on_data_label(self, labelname: str):
+        self.on_label(labelname)
+        self.data_labels.add(self.get_qualified_name(labelname))
+
     def on_reg(self, val: int):
         self.issue_usigned(val)
 
@@ -84,5 +99,13 @@ class FPP:
         self.cmd_list.append(('ref', (self.offset, labelname)))
         self.offset += WORD_SIZE  # placeholder-bytes
 
+    def on_line(self, location: Tuple[int, str]):
+        (lineno, text) = location
+        last = self.lines[-1] if self.lines else None
+
+        # Several statements may share a line
+        if last is None or (last.namespace, last.lineno) != (self.namespace, lineno):
+            self.lines.append(SourceLine(self.offset, self.namespace, lineno, text))
+
     def on_fail(self, rest: str):
         raise Exception(f'Unknown command {rest}')
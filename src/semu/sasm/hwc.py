@@ -17,6 +17,14 @@ def generate_compilation_item() -> CompilationItem:
         configure_param('LOOPBACK_LINE'),
         configure_param('SYSTIMER_LINE'),
         configure_param('SERIAL_LINE'),
+        configure_param('PERF_LINE'),
+        configure_param('PERF_MM_BASE'),
+        configure_param('PERF_CONTROL'),
+        configure_param('PERF_RETIRED'),
+        configure_param('PERF_CYCLES'),
+        configure_param('PERF_INTERRUPTS'),
+        configure_param('PERF_SNAPSHOT'),
+        configure_param('PERF_RESET'),
     ])
 
     return item
@@ -0,0 +1,82 @@
+''' Listing: every ROM address next to its instruction and the source line it came from '''
+
+import struct
+from typing import List
+
+import semu.common.ops as ops
+from semu.common.hwconf import ROM_BASE, WORD_SIZE
+from semu.common.symbols import DATA
+from semu.sasm.asm import Program
+
+
+REGISTERS = 'abcdefgh'
+
+
+def instructions(words: List[int]) -> List[List[int]]:
+    ''' Splits words into instructions, anything that is not an opcode is a word of its own '''
+    result = []
+    i = 0
+
+    while i < len(words):
+        op = words[i]
+        length = 1 + len(ops.OPERANDS[op]) if op in ops.MNEMONICS else 1
+        result.append(words[i:i + length])
+        i += length
+
+    return result
+
+
+def format_operand(kind: str, word: int, addr: int) -> str:
+    if kind == 'r':
+        return REGISTERS[word] if word < len(REGISTERS) else f'?{word}'
+
+    if kind == 'u':
+        return str(word)
+
+    value = word - (1 << 32) if word & 0x80000000 else word
+
+    if kind == 'o':
+        return f'&0x{addr + value:X}'   # Relative to the operand itself
+
+    return str(value)
+
+
+def format_instruction(words: List[int], addr: int) -> str:
+    (op, *operands) = words
+
+    if op in ops.MNEMONICS and len(operands) == len(ops.OPERANDS[op]):
+        kinds = ops.OPERANDS[op]
+        formatted = [
+            format_operand(kind, word, addr + (1 + i) * WORD_SIZE)
+            for (i, (kind, word)) in enumerate(zip(kinds, operands))
+        ]
+
+        return ' '.join([ops.MNEMONICS[op]] + formatted)
+
+    return ' '.join(['.word'] + [f'0x{w:08X}' for w in words])
+
+
+def format_listing(program: Program) -> str:
+    binary = program.binary
+    data = {s.address for s in program.symbols.symbols if s.kind == DATA}
+    lines = []
+
+    for (i, line) in enumerate(program.lines):
+        end = program.lines[i + 1].offset if i + 1 < len(program.lines) else len(binary)
+        source = f'{line.namespace}:{line.lineno}  {line.text}'
+        address = ROM_BASE + line.offset
+        count = (end - line.offset) // WORD_SIZE
+        words = list(struct.unpack(f'>{count}I', binary[line.offset:end]))
+
+        if not words:
+            lines.append(f'0x{address:08X}  {"":32}  {source}')
+        elif address in data:
+            lines.append(f'0x{address:08X}  {f".data {count} words":32}  {source}')
+        else:
+            for instruction in instructions(words):
+                text = format_instruction(instruction, address)
+                lines.append(f'0x{address:08X}  {text:32}  {source}')
+                address += len(instruction) * WORD_SIZE
+                source = ''
+
+    return '\n'.join(line.rstrip() for line in lines) + '\n'
@@ -5,7 +5,8 @@ import tomllib
 
 import click
 
-from semu.sasm.asm import CompilationItem, compile_items
+from semu.sasm.asm import CompilationItem, assemble
+from semu.sasm.listing import format_listing
 import semu.sasm.hwc as hwc
 
 
@@ -42,9 +43,14 @@ def collect_library(lib_dir: Path):
 @click.option('-v', '--verbose', is_flag=True, help='Sets logging level to debug')
 @click.option('--hw', is_flag=True, help='Add hardware definitions', default=True)
 @click.option('-l', '--library', type=click.Path())
+@click.option('-m', '--map', 'symbol_map', type=Path, help='Write a symbol map file')
+@click.option('--listing', type=Path, help='Write addresses, instructions and source lines')
 @click.argument('sources', nargs=-1, type=Path)
 @click.argument('binary', type=Path)
-def compile(verbose: bool, hw: bool, library: Path, sources: Tuple[Path], binary: Path):
+def compile(
+    verbose: bool, hw: bool, library: Path, symbol_map: Path | None, listing: Path | None,
+    sources: Tuple[Path], binary: Path
+):
     lg.basicConfig(level=lg.DEBUG if verbose else lg.INFO)
     lg.info("SEMU ASM")
 
@@ -58,9 +64,16 @@ def compile(verbose: bool, hw: bool, library: Path, sources: Tuple[Path], binary
         items.extend(collect_library(library))
 
     items.extend(collect_files(list(sources)))
-    bytestr = compile_items(items)
+    program = assemble(items)
     binary.parent.mkdir(parents=True, exist_ok=True)
-    binary.write_bytes(bytestr)
+    binary.write_bytes(program.binary)
+
+    if symbol_map:
+        program.symbols.save(symbol_map)
+
+    if listing:
+        listing.parent.mkdir(parents=True, exist_ok=True)
+        listing.write_text(format_listing(program))
 
 
 if __name__ == "__main__":
@@ -60,7 +60,7 @@ class MacroFPP(FPP):
 
     # Macros
     def issue_dw(self, tokens: Tokens):
-        self.on_label(tokens[0])
+        self.on_data_label(tokens[0])
 
         if len(tokens) == 2:
             multipicity = int(tokens[1])
@@ -261,7 +261,7 @@ class MacroFPP(FPP):
             multipicity = 1
 
         words = s.size * multipicity
-        self.on_label(name)
+        self.on_data_label(name)
 
         # Issue placeholder-bytes
         for _ in range(words):
@@ -320,7 +320,7 @@ class MacroFPP(FPP):
 
     # DT <text-name> "<string>"
     def issue_dt(self, tokens: Tokens):
-        self.on_label(tokens[0])
+        self.on_data_label(tokens[0])
         text = tokens[1]
         self.issue_usigned(len(text))
 
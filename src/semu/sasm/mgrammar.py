@@ -3,6 +3,7 @@
 
 import pyparsing as pp
 
+from semu.sasm.fpp import FPP
 from semu.sasm.mfpp import MacroFPP as MFPP
 
 from semu.sasm.grammar import (
@@ -16,6 +17,14 @@ from semu.sasm.grammar import (
 )
 
 
+# Source line ahead of the statement, for listings
+def located(expr):
+    def action(s, loc, r):
+        return [(FPP.on_line, (pp.lineno(loc, s), pp.line(loc, s).strip()))] + r.as_list()
+
+    return expr.add_parse_action(action)
+
+
 # Simple macros
 multi = pp.Optional(pp.Suppress('*') + pp.Regex('[1-9][0-9]*'))
 dw = (pp.Suppress('DW') + id + multi).setParseAction(lambda r: (MFPP.issue_dw, r))
@@ -79,20 +88,23 @@ cmd = asm_cmd \
     ^ const_def \
     ^ const_load
 
-statement = cmd + pp.ZeroOrMore(comment)
+statement = located(cmd + pp.ZeroOrMore(comment))
 
-func_decl = (pp.Suppress('FUNC') + id).setParseAction(lambda r: (MFPP.begin_func, r)) \
+func_decl = located(
+    (pp.Suppress('FUNC') + id).setParseAction(lambda r: (MFPP.begin_func, r))
     + pp.Optional(comment)
+)
 
 func_var_def = pp.Suppress('DW') + id + reg_ref + pp.Suppress(pp.Optional(comment))
 
-func_var = func_var_def.setParseAction(
+func_var = located(func_var_def.setParseAction(
     lambda r: (MFPP.func_var, [r[0], reg_indices[r[1]]])
-)
+))
 func_prologue = func_decl + pp.ZeroOrMore(func_var) + pp.Suppress('BEGIN')
 
-func_epilogue = pp.Suppress('END').setParseAction(lambda r: (MFPP.end_func, r)) \
-    + pp.Optional(comment)
+func_epilogue = located(
+    pp.Suppress('END').setParseAction(lambda r: (MFPP.end_func, r)) + pp.Optional(comment)
+)
 
 func = func_prologue + pp.ZeroOrMore(statement) + func_epilogue
 
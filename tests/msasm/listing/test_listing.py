@@ -0,0 +1,41 @@
+import semu.sasm.asm as asm
+from semu.common.hwconf import ROM_BASE
+from semu.sasm.listing import format_listing
+
+
+SOURCE = '''// Listing
+ldc 10 a
+CALL func
+hlt
+
+FUNC func
+    DW x a
+BEGIN
+    ldr &data b
+    RETURN
+END
+
+DW data*2
+'''
+
+
+def test_listing():
+    item = asm.CompilationItem()
+    item.modulename = 'listing'
+    item.contents = SOURCE
+    program = asm.assemble([item])
+
+    lines = {line.lineno: line for line in program.lines}
+    assert lines[2].offset == 0
+    assert lines[3].text == 'CALL func'
+    assert lines[3].offset == 12
+
+    (func, data) = (program.symbols.find('listing::func'), program.symbols.find('listing::data'))
+    assert func is not None and data is not None
+
+    listing = format_listing(program).splitlines()
+    assert listing[1] == f'0x{ROM_BASE:08X}  {"ldc 10 a":32}  listing:2  ldc 10 a'
+    assert listing[2].startswith(f'0x{ROM_BASE + 12:08X}  ldr &0x{func.address:X} h')
+    assert listing[3].rstrip() == f'0x{ROM_BASE + 24:08X}  cll h'
+    assert f'ldr &0x{data.address:X} b' in '\n'.join(listing)
+    assert listing[-1].startswith(f'0x{data.address:08X}  .data 2 words')
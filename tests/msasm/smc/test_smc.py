@@ -0,0 +1,17 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+
+import unit_utils
+
+
+def test_smc():
+    item = asm.CompilationItem()
+    item.modulename = 'smc'
+    item.contents = unit_utils.load_file('msasm/smc/smc.sasm')
+    binary = asm.compile_items([item])
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary)
@@ -113,3 +113,7 @@ def test_boundmethodcall():
 
 def test_unboundmethodcall():
     simple_test('unboundmethodcall')
+
+
+def test_perfcounters():
+    simple_test('perfcounters')
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def aot_cache(tmp_path, monkeypatch):
+    # Keep ahead-of-time translations away from the user's cache
+    monkeypatch.setenv('SEMU_CACHE', str(tmp_path / 'aot'))
+    yield tmp_path / 'aot'
@@ -0,0 +1,70 @@
+import pytest
+
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+import semu.runtime.aot as aot
+from semu.common.symbols import SymbolMap
+
+from unit_utils import compile_mutex, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+def test_symbol_map(with_kernel, tmp_path):  # noqa: F811
+    (_, symbols) = compile_mutex(with_kernel)
+    path = tmp_path / 'kernel.map'
+    symbols.save(path)
+    loaded = SymbolMap.load(path)
+
+    assert loaded.symbols == symbols.symbols
+    startup = [s for s in loaded.symbols if s.qname() == 'kernel.kernel::Startup'][0]
+    assert startup.kind == 'code'
+    assert loaded.resolve(startup.address + 4) == 'kernel.kernel::Startup+0x4'
+
+    stack = [s for s in loaded.symbols if s.qname() == 'kernel.startup::startstack'][0]
+    assert stack.kind == 'data'
+    assert stack.size == 400
+
+
+def test_cached_translation(with_kernel, aot_cache, capsys):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+
+    assert aot.load(binary, aot_cache, symbols) is None
+    path = aot.store(binary, symbols, aot_cache)
+    assert path.exists()
+
+    # Translated with other roots
+    assert aot.load(binary, aot_cache) is None
+
+    module = aot.load(binary, aot_cache, symbols)
+    assert module is not None
+    assert module.ROM_HASH == aot.rom_hash(binary)
+    handler = [s for s in symbols.symbols if s.qname() == 'kernel.kernel::HLoopback'][0]
+    assert handler.address in module.BLOCKS
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, 'aot', aot_cache, instruments=emulator.Instruments(symbols))
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log')
+
+    # The cached module is reused
+    assert list(aot_cache.glob('*.py')) == [path]
+
+
+def test_layout_change(with_kernel, aot_cache, monkeypatch):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    path = aot.store(binary, cache_dir=aot_cache)
+
+    # Translated for another memory layout
+    path.write_text(path.read_text().replace(f"LAYOUT = '{aot.layout()}'", "LAYOUT = '0'"))
+    aot.LOADED.pop(path, None)
+    assert aot.load(binary, aot_cache) is None
+
+    # ROM moved elsewhere, the old translation is not even looked up
+    monkeypatch.setattr(aot, 'ROM_BASE', aot.ROM_BASE + 4)
+    assert aot.cache_path(aot_cache, binary) != path
+    monkeypatch.undo()
+
+    # Generated by another translator
+    monkeypatch.setattr(aot, 'TRANSLATOR_VERSION', aot.TRANSLATOR_VERSION + 1)
+    assert aot.cache_path(aot_cache, binary) != path
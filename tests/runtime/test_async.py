@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+
+import semu.runtime.machine as machine
+from semu.common.hwconf import SERIAL_LINE
+from semu.runtime.clock import AsyncClock
+
+from unit_utils import compile_mutex, compile_ticks, kernel_clock
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+MACHINES = 20
+
+
+async def run_all(binary: bytes, clocks, **options):
+    # Peripherals must not start any threads
+    threads = threading.active_count()
+    machines = [machine.Machine(quantum=100, clock=clock, **options) for clock in clocks]
+
+    for m in machines:
+        m.load(binary)
+        m.cpu.pp[SERIAL_LINE].captured = []     # type: ignore
+
+    assert threading.active_count() == threads
+
+    try:
+        stops = await asyncio.gather(*[machine.run_async(m, quantum=500) for m in machines])
+    finally:
+        for m in machines:
+            m.close()
+
+    return (machines, stops)
+
+
+def test_shared_loop(with_kernel, capsys):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    clocks = [kernel_clock() for _ in range(MACHINES)]
+
+    (machines, stops) = asyncio.run(run_all(binary, clocks, engine='fused'))
+
+    assert all(stop.reason == machine.HALT for stop in stops)
+    assert all(stop.retired == stops[0].retired for stop in stops)
+
+    for m in machines:
+        serial = ''.join(m.cpu.pp[SERIAL_LINE].captured)   # type: ignore
+        assert serial.startswith('Kernel thread started')
+
+
+@pytest.mark.parametrize('idle', ['', 'nop'])
+def test_timer_on_loop(idle: str):
+    binary = compile_ticks(idle)
+    clocks = [AsyncClock(timer_period=0.01) for _ in range(MACHINES)]
+
+    (_, stops) = asyncio.run(asyncio.wait_for(run_all(binary, clocks, skip_idle=True), 5.0))
+
+    assert all(stop.reason == machine.HALT for stop in stops)
+
+
+def test_load_outside_loop():
+    m = machine.Machine(clock=AsyncClock(timer_period=0.01), skip_idle=True)
+    m.load(compile_ticks(''))
+    assert isinstance(m.cpu.pp[SERIAL_LINE].out_event, asyncio.Event)
+
+    with m:
+        # The timer starts once the machine runs on the loop
+        stop = asyncio.run(asyncio.wait_for(machine.run_async(m, quantum=500), 5.0))
+
+    assert stop.reason == machine.HALT
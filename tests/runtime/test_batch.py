@@ -0,0 +1,77 @@
+import json
+
+import semu.sasm.asm as asm
+import semu.runtime.batch as batch
+import semu.runtime.machine as machine
+
+from unit_utils import compile_mutex, compile_single_pp_source, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+SPIN = '''
+loop:
+    ldr &loop a
+    jmp a
+'''
+
+FAILING = '''
+ldc 1 a
+%assert a 2
+hlt
+'''
+
+
+def compile_sasm(contents: str) -> bytes:
+    item = asm.CompilationItem()
+    item.modulename = 'batch'
+    item.contents = contents
+    return asm.compile_items([item])
+
+
+def test_batch(with_kernel, tmp_path):  # noqa: F811
+    (tmp_path / 'whileloop.bin').write_bytes(
+        compile_single_pp_source('testdata/pseudopython/whileloop.py')
+    )
+
+    (tmp_path / 'mutex.bin').write_bytes(compile_mutex(with_kernel)[0])
+    (tmp_path / 'spin.bin').write_bytes(compile_sasm(SPIN))
+    (tmp_path / 'failing.bin').write_bytes(compile_sasm(FAILING))
+
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps([
+        'whileloop.bin',
+        'mutex.bin',
+        {'rom': 'spin.bin', 'max_instructions': 1000},
+        {'rom': 'spin.bin', 'timeout': 0.1},
+        'failing.bin'
+    ]))
+
+    jobs = batch.read_manifest(manifest, batch.Job(tmp_path, max_instructions=10 ** 6))
+    report = batch.run_batch(jobs, batch.Settings(engine='fused'), processes=2)
+    (whileloop, mutex, budget, timeout, failing) = report['jobs']
+
+    assert whileloop['reason'] == machine.HALT
+    assert whileloop['stdout'] == load_file('testdata/pseudopython/whileloop.log')
+
+    assert mutex['reason'] == machine.HALT
+    assert mutex['stdout'] == load_file('msasm/mutex/output.log')
+    assert mutex['serial'].startswith('Kernel thread started')
+
+    assert budget['reason'] == machine.BUDGET
+    assert budget['retired'] == 1000
+
+    # Long before the default budget
+    assert timeout['reason'] == batch.TIMEOUT
+
+    assert failing['reason'] == machine.ASSERT
+    assert failing['retired'] == 2
+
+    assert report['summary']['total'] == 5
+    assert report['summary']['reasons'] == {'halt': 2, 'budget': 1, 'timeout': 1, 'assert': 1}
+
+
+def test_next_chunk():
+    assert batch.next_chunk(1000, 0.01, batch.CHECK_PERIOD) == 5000
+    assert batch.next_chunk(10 ** 9, 0.01, batch.CHECK_PERIOD) == batch.CHUNK
+    assert batch.next_chunk(1, 10.0, batch.CHECK_PERIOD) == 1
+    assert batch.next_chunk(1000, 0.0, batch.CHECK_PERIOD) == batch.CHUNK
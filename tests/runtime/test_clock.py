@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+from semu.runtime.clock import VirtualClock
+
+from unit_utils import compile_mutex, kernel_clock, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+def test_events_in_order():
+    clock = VirtualClock()
+    fired = []
+    clock.schedule(10, lambda: fired.append('b'))
+    clock.schedule(5, lambda: fired.append('a'))
+    clock.schedule(10, lambda: fired.append('c'))
+    clock.advance(4)
+    assert fired == []
+    clock.advance(6)
+    assert fired == ['a', 'b', 'c']
+    assert clock.next_event() is None
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_mutex(engine: str, with_kernel, capsys):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    ends = []
+
+    for _ in range(2):
+        clock = kernel_clock()
+        start = time.time()
+
+        with pytest.raises(cpu.Halt):
+            emulator.execute(binary, engine, clock=clock)
+
+        # No host sleeps on the way
+        assert time.time() - start < 1.0
+        ends.append(clock.now)
+
+    # The same interleaving every time
+    assert ends[0] == ends[1]
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log') * 2
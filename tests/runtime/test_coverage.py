@@ -0,0 +1,75 @@
+import semu.sasm.asm as asm
+import semu.runtime.batch as batch
+import semu.runtime.coverage as coverage
+import semu.runtime.machine as machine
+from semu.common.hwconf import ROM_BASE, WORD_SIZE
+from semu.runtime.clock import VirtualClock
+
+
+BRANCH = '''
+ldc {value} a
+ldr &skip b
+jgt a b
+never:
+    ldc 2 a
+skip:
+    hlt
+'''
+
+
+def compile_branch(value: int):
+    item = asm.CompilationItem()
+    item.modulename = 'branch'
+    item.contents = BRANCH.format(value=value)
+    return asm.compile_program([item])
+
+
+def collect(binary: bytes) -> bytes:
+    with machine.Machine('blocks', clock=VirtualClock(), coverage=True) as m:
+        m.load(binary)
+        assert m.run().reason == machine.HALT
+        assert m.coverage is not None
+        return m.coverage.bitmap(binary)
+
+
+def test_report():
+    (binary, symbols) = compile_branch(1)
+    bitmap = collect(binary)
+    never = symbols.find('branch::never')
+    assert never is not None
+
+    assert coverage.covered(bitmap, 0)
+    assert not coverage.covered(bitmap, 1)     # Operand of ldc
+    assert not coverage.covered(bitmap, (never.address - ROM_BASE) // WORD_SIZE)
+
+    report = coverage.report(binary, bitmap, symbols).splitlines()
+    assert report[0].split() == ['3/3', '100.0%', f'0x{ROM_BASE:X}']
+    assert report[1].split() == ['0/1', '0.0%', 'branch::never']
+    assert report[-1].split() == ['4/5', '80.0%', 'total']
+
+
+def test_merge(tmp_path):
+    (taken, symbols) = compile_branch(1)
+    (not_taken, _) = compile_branch(0)
+
+    # Same code, different constants
+    merged = coverage.merge([collect(taken), collect(not_taken)])
+    assert coverage.report(taken, merged, symbols).splitlines()[-1].split()[0] == '5/5'
+
+    path = tmp_path / 'branch.cov'
+    coverage.save(path, taken, merged)
+    assert coverage.load(path)[1] == merged
+
+
+def test_batch(tmp_path):
+    (binary, _) = compile_branch(1)
+    (tmp_path / 'branch.bin').write_bytes(binary)
+    jobs = [batch.Job(tmp_path / 'branch.bin')] * 2
+    settings = batch.Settings(coverage_dir=tmp_path / 'coverage')
+
+    report = batch.run_batch(jobs, settings, processes=2)
+    paths = {job['coverage'] for job in report['jobs']}
+    assert len(paths) == 1
+
+    (_, bitmap) = coverage.load(tmp_path / 'coverage' / paths.pop())
+    assert bitmap == collect(binary)
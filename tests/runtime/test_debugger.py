@@ -0,0 +1,131 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.common.hwconf import SYSTIMER_LINE, WORD_SIZE
+from semu.runtime.clock import VirtualClock
+from semu.runtime.debugger import Break, Watchpoint
+
+from unit_utils import compile_countdown, create
+
+
+STORE = '''
+ldr &data a
+ldc 5 b
+mrm b a
+mmr a c
+push c
+hlt
+DW data
+'''
+
+FRAMES = '''
+ldr &handler e
+ldc 4 f
+mrm e f         // system timer vector
+ldc 4096 a
+lsp a
+ldr &function b
+cll b
+opn
+loop:
+    ldr &loop d
+    jmp d
+function:
+    ret
+handler:
+    hlt
+'''
+
+STACK = 4096
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_breakpoint(engine: str):
+    (binary, loop) = compile_countdown()
+
+    with create(engine, binary) as m:
+        m.add_breakpoint(loop)
+
+        stop = m.run()
+        assert stop == machine.Stop(machine.BREAK, 3, loop)
+        assert m.get_register('a') == 10
+
+        # Resumes past the hit
+        assert m.run().reason == machine.BREAK
+        assert m.get_register('a') == 9
+
+        m.remove_breakpoint(loop)
+        assert m.run().reason == machine.HALT
+
+
+def test_watchpoints():
+    item = asm.CompilationItem()
+    item.modulename = 'store'
+    item.contents = STORE
+    (binary, symbols) = asm.compile_program([item])
+    data = symbols.find('store::data')
+    assert data is not None
+
+    with create('fused', binary) as m:
+        m.add_watchpoint(data.address, read=True)
+
+        stop = m.run()
+        assert (stop.reason, stop.address) == (machine.WATCH, data.address)
+        assert m.read_word(data.address) == 0     # Not written yet
+
+        stop = m.run()
+        assert (stop.reason, stop.retired) == (machine.WATCH, 1)
+        assert m.get_register('c') == 0
+
+        # Stack writes are watched too
+        m.remove_watchpoint(data.address)
+        m.set_register('sp', 0x1000)
+        m.add_watchpoint(0x1000, write=True)
+        assert m.run().reason == machine.WATCH
+        assert m.registers()['c'] == 5
+
+
+def test_stack_frames():
+    item = asm.CompilationItem()
+    item.modulename = 'frames'
+    item.contents = FRAMES
+    (binary, symbols) = asm.compile_program([item])
+    names = ['function', 'loop', 'handler']
+    (function, loop, handler) = [symbols.find(f'frames::{name}') for name in names]
+    assert function is not None and loop is not None and handler is not None
+
+    with create('interp', binary) as m:
+        m.add_watchpoint(STACK, write=True)
+        stop = m.run()
+        assert (stop.reason, stop.address) == (machine.WATCH, STACK)
+
+        # Saved FP read by ret
+        m.remove_watchpoint(STACK)
+        m.add_watchpoint(STACK + WORD_SIZE, read=True, write=False)
+        stop = m.run()
+        assert (stop.ip, stop.address) == (function.address, STACK + WORD_SIZE)
+
+        m.remove_watchpoint(STACK + WORD_SIZE)
+        assert m.run(until_ip=loop.address).reason == machine.UNTIL
+
+        # Saved FP of the interrupt frame, seen once the handler is entered
+        m.add_watchpoint(STACK + 9 * WORD_SIZE, write=True)
+        m.cpu.interrupts.request(SYSTIMER_LINE)
+        stop = m.run()
+        assert (stop.reason, stop.ip) == (machine.WATCH, handler.address)
+        assert stop.address == STACK + 9 * WORD_SIZE
+
+
+def test_execute():
+    (binary, loop) = compile_countdown()
+
+    with pytest.raises(Break) as e:
+        emulator.execute(
+            binary, 'aot', clock=VirtualClock(), instruments=emulator.Instruments(
+                watchpoints=[Watchpoint(0, 0x40, True, True)], breakpoints=[loop]
+            )
+        )
+
+    assert e.value.hit.ip == loop
@@ -0,0 +1,108 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+import semu.runtime.machine as machine
+
+from unit_utils import compile_mutex, execute_single_pp_source, find_file, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+# The reference interpreter is covered by the rest of the suite
+ENGINES = [engine for engine in emulator.ENGINES if engine != 'interp']
+
+PROGRAMS = [
+    'expressions',
+    'booleans',
+    'conditionals',
+    'whileloop',
+    'returns',
+    'localvars',
+    'basicclasses',
+    'localpointers',
+    'stackmembersderef',
+    'recussivemethods',
+    'funcpointer',
+    'boundmethodcall'
+]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', PROGRAMS)
+def test_pp_programs(name: str, engine: str, capsys):
+    with pytest.raises(cpu.Halt):
+        execute_single_pp_source(f'testdata/pseudopython/{name}.py', engine)
+
+    log = find_file(f'testdata/pseudopython/{name}.log')
+
+    with capsys.disabled():
+        output = capsys.readouterr().out
+
+        if log.exists():
+            assert output == log.read_text()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_smc(engine: str):
+    item = asm.CompilationItem()
+    item.modulename = 'smc'
+    item.contents = load_file('msasm/smc/smc.sasm')
+    binary = asm.compile_items([item])
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, engine)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mutex(engine: str, with_kernel, capsys):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, engine)
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log')
+
+
+SHARED = '''
+ldc 10 a
+ldc 1 b
+ldr &loop e
+loop:
+    sub a b a
+    jgt a e
+hlt
+'''
+
+
+def test_shared_code():
+    item = asm.CompilationItem()
+    item.modulename = 'shared'
+    item.contents = SHARED
+    (binary, symbols) = asm.compile_program([item])
+    loop = symbols.find('shared::loop')
+    assert loop is not None
+
+    (first, second) = (machine.Machine('blocks'), machine.Machine('blocks'))
+
+    with first, second:
+        for m in (first, second):
+            m.load(binary)
+            assert m.run().reason == machine.HALT
+
+        assert first.cpu.code.entries.keys() == second.cpu.code.entries.keys()
+
+        for (addr, entry) in first.cpu.code.entries.items():
+            assert second.cpu.code.entries[addr] is entry
+
+        assert first.blocks.blocks.entries[loop.address] is \
+            second.blocks.blocks.entries[loop.address]
+
+        # Writes only reach the machine's own cache
+        entry = second.cpu.code.entries[loop.address]
+        first.write_word(loop.address + 4, 3)
+        assert loop.address not in first.cpu.code.entries
+        assert first.cpu.decode(loop.address) is not entry
+        assert second.cpu.code.entries[loop.address] is entry
+        assert second.blocks.blocks.entries[loop.address] is not None
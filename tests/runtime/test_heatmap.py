@@ -0,0 +1,78 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.common.hwconf import WORD_SIZE, SERIAL_MM_BASE, SERIAL_MM_SIZE, PERF_MM_BASE, PERF_MM_SIZE
+from semu.runtime.clock import VirtualClock
+import semu.runtime.cpu as cpu
+
+np = pytest.importorskip('numpy')
+
+
+ACCESSES = '''
+ldr &stack a
+lsp a
+ldr &data b
+ldc 5 c
+mrm c b
+mmr b d
+mmr b d
+push d
+pop e
+hlt
+DW data
+DW stack*4
+'''
+
+
+def compile_accesses():
+    item = asm.CompilationItem()
+    item.modulename = 'accesses'
+    item.contents = ACCESSES
+    return asm.compile_program([item])
+
+
+def test_counts():
+    (binary, symbols) = compile_accesses()
+    data = symbols.find('accesses::data')
+    stack = symbols.find('accesses::stack')
+    assert data is not None and stack is not None
+
+    with machine.Machine('blocks', clock=VirtualClock(), heatmap=True) as m:
+        m.load(binary)
+        assert m.run().reason == machine.HALT
+        heatmap = m.heatmap
+
+    assert heatmap is not None
+    heatmap.flush()
+    (reads, writes) = (heatmap.reads.counts, heatmap.writes.counts)
+    assert (reads[data.address // WORD_SIZE], writes[data.address // WORD_SIZE]) == (2, 1)
+    assert (reads[stack.address // WORD_SIZE], writes[stack.address // WORD_SIZE]) == (1, 1)
+    assert heatmap.fetches.counts.sum() == len(binary) // WORD_SIZE - 5  # Data is not fetched
+
+    summary = heatmap.summary(symbols, len(binary))
+    rows = {line.split()[-1]: line.split() for line in summary.splitlines()}
+    assert rows['accesses::data'][:3] == ['2', '1', '0']
+    assert rows['accesses::stack'][3:5] == ['1/4', 'data']
+
+    # Each device has its own region
+    regions = {name: (start, end) for (start, end, _, name) in heatmap.regions(symbols, 0)}
+    assert regions['serial'] == (SERIAL_MM_BASE, SERIAL_MM_BASE + SERIAL_MM_SIZE)
+    assert regions['perf'] == (PERF_MM_BASE, PERF_MM_BASE + PERF_MM_SIZE)
+
+
+def test_save(tmp_path):
+    (binary, symbols) = compile_accesses()
+    path = tmp_path / 'heat.npz'
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, 'fused', instruments=emulator.Instruments(symbols=symbols, heatmap=path)
+        )
+
+    with np.load(path) as counts:
+        assert counts['writes'].sum() == 2
+        assert counts['reads'].sum() == 3
+
+    assert 'accesses::stack' in (tmp_path / 'heat.txt').read_text()
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+from semu.common.hwconf import ROM_BASE
+from semu.runtime.clock import VirtualClock
+from semu.runtime.memory import Memory
+
+from unit_utils import compile_mutex, compile_ticks, kernel_clock, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+PERIOD = 10 ** 7
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+@pytest.mark.parametrize('idle', ['', 'nop'])
+def test_skip_to_tick(engine: str, idle: str):
+    binary = compile_ticks(idle)
+    clock = VirtualClock(timer_period=PERIOD)
+    start = time.time()
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, engine, clock=clock, skip_idle=True)
+
+    # Millions of spinning instructions are never executed
+    assert time.time() - start < 1.0
+    assert 3 * PERIOD <= clock.now < 3 * PERIOD + 100
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_mutex(engine: str, with_kernel, capsys):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    clock = kernel_clock()
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, engine, clock=clock, skip_idle=True)
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log')
+
+
+def test_rewritten_loop():
+    memory = Memory()
+    proc = emulator.boot(memory)
+    emulator.init_memory(memory, compile_ticks(''))
+    proc.decoded(ROM_BASE)
+    proc.idle_detector.busy.add(ROM_BASE)
+
+    # Data writes keep what was learned
+    proc.code.invalidate(0x8000)
+    assert proc.idle_detector.busy == {ROM_BASE}
+
+    # Rewritten code is probed again
+    proc.code.invalidate(ROM_BASE)
+    assert not proc.idle_detector.busy
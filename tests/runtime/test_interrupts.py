@@ -0,0 +1,96 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+from semu.common.hwconf import SYSTIMER_LINE, SERIAL_LINE, WORD_SIZE
+from semu.runtime.memory import Memory
+from semu.runtime.interrupts import Interrupts
+
+
+COUNTER = '''
+ldr &handler e
+ldc 4 f
+mrm e f         // system timer vector
+ldc 4096 a
+lsp a
+opn
+loop:
+    ldc 1 b
+    add c b c
+    ldr &loop d
+    jmp d
+handler:
+    hlt
+'''
+
+# The fused loop runs the first three as one superinstruction
+PTR_COUNTER = COUNTER.replace(
+    '    ldc 1 b\n    add c b c\n', '    mrr c a\n    ldc 1 b\n    add a b c\n'
+)
+
+SETUP = 6   # instructions up to and including opn
+
+
+def boot(quantum: int, contents: str = COUNTER) -> cpu.CPU:
+    item = asm.CompilationItem()
+    item.modulename = 'counter'
+    item.contents = contents
+    memory = Memory()
+    emulator.init_memory(memory, asm.compile_items([item]))
+    return cpu.CPU(memory, {}, Interrupts(), quantum)
+
+
+def saved_ip(proc: cpu.CPU) -> int:
+    # ip, 8 registers, fp
+    return proc.memory.read_word(proc.fp - 10 * WORD_SIZE)
+
+
+def test_lowest_line_first():
+    interrupts = Interrupts()
+    interrupts.request(SERIAL_LINE)
+    interrupts.request(SYSTIMER_LINE)
+    assert interrupts.take() == SYSTIMER_LINE
+    assert interrupts.take() == SERIAL_LINE
+    assert interrupts.take() is None
+    assert interrupts.mask == 0
+
+
+@pytest.mark.parametrize('contents', [COUNTER, PTR_COUNTER], ids=['plain', 'ptr'])
+@pytest.mark.parametrize('fused', [False, True])
+@pytest.mark.parametrize('quantum', [1, 8, 13])
+def test_quantum(quantum: int, fused: bool, contents: str):
+    proc = boot(quantum, contents)
+
+    for _ in range(SETUP):
+        proc.exec_next()
+        proc.tick(1)
+
+    # Delivered at the first poll after the request
+    delay = quantum - SETUP % quantum
+    reference = boot(quantum, contents)
+
+    for _ in range(SETUP + delay):
+        reference.exec_next()
+
+    proc.interrupts.request(SYSTIMER_LINE)
+
+    with pytest.raises(cpu.Halt):
+        if fused:
+            proc.run(100)
+        else:
+            while True:
+                proc.exec_next()
+                proc.tick(1)
+
+    assert saved_ip(proc) == reference.ip
+    assert proc.interrupts.mask == 0
+
+
+def test_inhibited_drops():
+    proc = boot(1)
+    proc.interrupts.request(SYSTIMER_LINE)
+    proc.exec_next()
+    proc.tick(1)
+    assert proc.interrupts.mask == 0
+    assert proc.ii == 1
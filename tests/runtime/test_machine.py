@@ -0,0 +1,75 @@
+import pytest
+
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+
+from unit_utils import compile_countdown, create
+
+
+def test_state():
+    (binary, _) = compile_countdown()
+
+    with create('interp', binary) as m:
+        m.set_register('c', 5)
+        assert m.get_register('c') == 5
+        assert m.registers()['ip'] == m.get_register('ip')
+
+        m.write_word(0x1000, 0xCAFE)
+        assert m.read_word(0x1000) == 0xCAFE
+
+        with pytest.raises(KeyError):
+            m.get_register('x')
+
+
+def test_load_once():
+    (binary, _) = compile_countdown()
+
+    with create('interp', binary) as m:
+        with pytest.raises(Exception, match='Already loaded'):
+            m.load(binary)
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_stops(engine: str):
+    (binary, loop) = compile_countdown()
+
+    with create('interp', binary) as reference:
+        total = reference.run()
+        assert total.reason == machine.HALT
+
+    with create(engine, binary) as m:
+        stop = m.step()
+        assert stop == machine.Stop(machine.BUDGET, 1, m.get_register('ip'))
+
+        stop = m.run(max_instructions=7)
+        assert stop.reason == machine.BUDGET
+        assert stop.retired == 7
+
+        with create('interp', binary) as stepped:
+            for _ in range(8):
+                stepped.step()
+
+            assert m.registers() == stepped.registers()
+
+        stop = m.run(until_ip=loop)
+        assert stop.reason == machine.UNTIL
+        assert stop.ip == loop
+        assert m.get_register('a') == 8
+
+        stop = m.run()
+        assert stop.reason == machine.HALT
+        assert m.retired == total.retired
+        assert m.registers() == reference.registers()
+
+        # Nothing runs after the guest has stopped
+        assert m.run() == stop._replace(retired=0)
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_assert(engine: str):
+    (binary, _) = compile_countdown(expected=11)
+
+    with create(engine, binary) as m:
+        stop = m.run(max_instructions=1000)
+        assert stop.reason == machine.ASSERT
+        assert stop.final()
@@ -0,0 +1,41 @@
+import struct
+
+import pytest
+
+from semu.runtime.memory import Memory
+
+
+def test_words():
+    memory = Memory()
+    memory.write_word(0x100, 0xDEADBEEF)
+    assert memory.read_block(0x100, 4) == b'\xDE\xAD\xBE\xEF'
+    assert memory.read_word(0x100) == 0xDEADBEEF
+    assert memory.read_signed(0x100) == -559038737
+
+    memory.write_signed(0x104, -1)
+    assert memory.read_word(0x104) == 0xFFFFFFFF
+
+    with pytest.raises(struct.error):
+        memory.write_word(0x108, -1)
+
+
+def test_ranges():
+    memory = Memory()
+    memory.write_words(0x200, [1, 2, 3])
+    assert memory.read_words(0x200, 3) == (1, 2, 3)
+
+    with pytest.raises(IndexError):
+        memory.write_block(len(memory) - 2, b'1234')
+
+    assert len(memory) == len(memory.data)
+
+
+def test_code_invalidation():
+    memory = Memory()
+    memory.code.add(0x300, 12, 'entry')
+
+    memory.write_word(0x310, 0)
+    assert 0x300 in memory.code.entries
+
+    memory.write_block(0x308, b'\x00')
+    assert 0x300 not in memory.code.entries
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import semu.runtime.cpu as cpu
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.common.hwconf import SERIAL_LINE, SYSTIMER_LINE
+from semu.runtime.metrics import Exporter
+
+from unit_utils import compile_mutex, kernel_clock
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+def run_mutex(engine: str, binary: bytes, cache_dir):
+    with machine.Machine(engine, clock=kernel_clock(), cache_dir=cache_dir) as m:
+        m.load(binary)
+        m.cpu.pp[SERIAL_LINE].captured = []     # type: ignore
+        assert m.run().reason == machine.HALT
+        return m
+
+
+@pytest.mark.parametrize('engine', ['fused', 'blocks', 'aot'])
+def test_counters(engine: str, with_kernel, tmp_path):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    expected = run_mutex('interp', binary, tmp_path).cpu
+    proc = run_mutex(engine, binary, tmp_path).cpu
+
+    # Start-up, then the scheduler on every tick and Suspend
+    assert proc.switches == expected.switches > 2 + proc.delivered[SYSTIMER_LINE]
+
+    serial = proc.pp[SERIAL_LINE]
+    assert serial.transfers == len(serial.captured) > 0   # type: ignore
+
+
+def test_exporter(with_kernel, tmp_path):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+
+    with machine.Machine('fused', clock=kernel_clock()) as m:
+        m.load(binary)
+        exporter = Exporter(m.cpu, tmp_path / 'semu.prom', tmp_path / 'semu.jsonl', 0.1)
+        exporter.start()
+        stop = m.run()
+        exporter.stop()
+
+    metrics = dict(
+        line.rsplit(' ', 1) for line in (tmp_path / 'semu.prom').read_text().splitlines()
+        if not line.startswith('#')
+    )
+
+    assert metrics['semu_instructions_retired_total'] == str(stop.retired)
+    assert metrics['semu_context_switches_total'] == str(m.cpu.switches)
+    assert metrics[f'semu_interrupts_total{{line="{SYSTIMER_LINE}"}}'] != '0'
+    assert metrics['semu_ip'] == str(stop.ip)
+
+    samples = [json.loads(line) for line in (tmp_path / 'semu.jsonl').read_text().splitlines()]
+    assert samples[-1]['retired'] == stop.retired
+    assert samples[-1]['serial'] > 0
+
+
+def test_execute(with_kernel, tmp_path):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    path = tmp_path / 'semu.jsonl'
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, 'blocks', clock=kernel_clock(),
+            instruments=emulator.Instruments(metrics_json=path)
+        )
+
+    assert json.loads(path.read_text().splitlines()[-1])['switches'] > 0
@@ -0,0 +1,81 @@
+import pytest
+
+import semu.sasm.asm as asm
+import semu.sasm.masm as masm
+import semu.common.hwconf as hw
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.runtime.clock import VirtualClock
+from semu.runtime.memory import Memory
+
+from tests.msasm.fixtures import with_hardware  # noqa: F401
+
+
+MEASURE = '''
+CLOAD hw::PERF_CONTROL b
+CLOAD hw::PERF_LINE c
+CLOAD hw::PERF_RESET a
+mrm a b
+out c
+ldc 1 d
+add d d d
+add d d d
+snapshot:
+CLOAD hw::PERF_SNAPSHOT a
+mrm a b
+out c
+hlt
+'''
+
+MEASURED = 6    # From the out resetting the counters up to the one taking the snapshot
+
+
+def compile_measure(with_hardware):  # noqa: F811
+    item = masm.CompilationItem()
+    item.modulename = 'measure'
+    item.contents = MEASURE
+    return asm.compile_program([with_hardware, item])
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+@pytest.mark.parametrize('quantum', [1, 4])
+def test_snapshot(engine: str, quantum: int, with_hardware, tmp_path):  # noqa: F811
+    (binary, _) = compile_measure(with_hardware)
+    with machine.Machine(engine, quantum, VirtualClock(), cache_dir=tmp_path) as m:
+        m.load(binary)
+        assert m.run().reason == machine.HALT
+
+        assert m.read_word(hw.PERF_CONTROL) == 0    # Acknowledged
+        assert m.read_word(hw.PERF_RETIRED) == MEASURED
+        cycles = m.read_word(hw.PERF_CYCLES)
+
+        # Virtual time advances by retired instructions at polls
+        if engine in ['interp', 'fused']:
+            assert abs(cycles - MEASURED) < quantum
+        else:
+            # Straight-line code is a single block, time advances after it
+            assert cycles == 0
+
+
+def test_interrupts(with_hardware):  # noqa: F811
+    (binary, symbols) = compile_measure(with_hardware)
+    snapshot = symbols.find('measure::snapshot')
+    assert snapshot is not None
+
+    with machine.Machine('fused', clock=VirtualClock()) as m:
+        m.load(binary)
+        m.cpu.delivered[hw.SYSTIMER_LINE] = 3   # Before the reset
+        assert m.run(until_ip=snapshot.address).reason == machine.UNTIL
+
+        m.cpu.delivered[hw.SYSTIMER_LINE] += 2
+        assert m.run().reason == machine.HALT
+        assert m.read_word(hw.PERF_INTERRUPTS + hw.SYSTIMER_LINE * hw.WORD_SIZE) == 2
+
+
+def test_layout():
+    # ROMs built before the counters load where they did
+    assert hw.ROM_BASE == hw.SERIAL_MM_BASE + hw.SERIAL_MM_SIZE
+    assert hw.PERF_MM_BASE + hw.PERF_MM_SIZE <= hw.MEMORY_SIZE
+
+    with pytest.raises(Exception, match='overlaps'):
+        emulator.init_memory(Memory(), bytes(hw.PERF_MM_BASE - hw.ROM_BASE + hw.WORD_SIZE))
@@ -0,0 +1,107 @@
+import pytest
+from click.testing import CliRunner
+
+import semu.common.ops as ops
+import semu.runtime.cpu as cpu
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+import semu.runtime.profiler as profiler
+from semu.common.hwconf import SYSTIMER_LINE, WORD_SIZE
+from semu.runtime.clock import VirtualClock
+
+from unit_utils import compile_countdown, compile_mutex, kernel_clock
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+def test_counters():
+    (binary, loop) = compile_countdown()
+
+    with machine.Machine('fused', clock=VirtualClock(), profile=True) as m:
+        m.load(binary)
+        stop = m.run()
+        assert stop.reason == machine.HALT
+
+        profile = m.profile
+        assert profile is not None
+        assert sum(profile.by_opcode) == stop.retired
+        assert profile.by_opcode[ops.SUB] == 10
+        assert profile.by_ip[loop] == 10
+        assert profile.hot_addresses()[0] == (loop, 10)
+
+
+def test_exclusive(tmp_path):
+    (binary, _) = compile_countdown()
+    instruments = emulator.Instruments(profile=tmp_path / 'profile.txt', trace=tmp_path / 'trace')
+
+    with pytest.raises(Exception, match='exclusive'):
+        emulator.execute(binary, instruments=instruments)
+
+    rom = tmp_path / 'countdown.bin'
+    rom.write_bytes(binary)
+    result = CliRunner().invoke(
+        emulator.run, ['--profile', str(instruments.profile), '--trace', 'trace', str(rom)]
+    )
+    assert result.exit_code == 2    # Usage error
+    assert not instruments.profile.exists()
+
+
+def test_report(with_kernel, tmp_path, capsys):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+    path = tmp_path / 'profile.txt'
+    clock = kernel_clock()
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, 'blocks', clock=clock,
+            instruments=emulator.Instruments(symbols=symbols, profile=path)
+        )
+
+    report = path.read_text()
+    assert f'Cycles: {clock.now}' in report
+    assert 'Labels:' in report
+    assert 'app::' in report
+
+    interrupts = report.split('Interrupts per line:\n')[1].split('\n\n')[0]
+    lines = [int(row.split()[0]) for row in interrupts.splitlines()]
+    assert SYSTIMER_LINE in lines
+
+
+@pytest.mark.parametrize('engine', ['interp', 'fused'])
+def test_flamegraph(engine: str, with_kernel, tmp_path, capsys):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+    path = tmp_path / 'stacks.folded'
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, engine, clock=kernel_clock(),
+            instruments=emulator.Instruments(symbols=symbols, flamegraph=path, sample_period=10)
+        )
+
+    stacks = dict(line.rsplit(' ', 1) for line in path.read_text().splitlines())
+    assert sum(int(n) for n in stacks.values()) > 100
+
+    # Through the timer interrupt frame into the interrupted thread
+    assert any(
+        stack.startswith('kernel.threads::TUserThread;app::TF;')
+        and 'kernel.threads::HScheduler' in stack
+        for stack in stacks
+    )
+
+
+def test_walk_bounds():
+    (binary, _) = compile_countdown()
+
+    with machine.Machine('fused', clock=VirtualClock()) as m:
+        m.load(binary)
+        proc = m.cpu
+        sampler = profiler.Sampler(proc)
+
+        # Return address past the end of memory
+        proc.fp = 0x8000
+        proc.memory.write_word(proc.fp - profiler.CALL_RETURN, 0xFFFFFFF0)
+        proc.memory.write_word(proc.fp - WORD_SIZE, 0)
+        assert sampler.walk() == (proc.ip,)
+
+        # Frame pointer past the end of memory
+        proc.fp = 0xFFFFFFF0
+        assert sampler.walk() == (proc.ip,)
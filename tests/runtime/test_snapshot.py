@@ -0,0 +1,80 @@
+import pytest
+
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+import semu.runtime.snapshot as snapshots
+import semu.runtime.machine as machine
+
+from unit_utils import compile_mutex, kernel_clock, load_file
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+@pytest.fixture
+def mutex(with_kernel):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+    start = symbols.find('app::Start')
+    assert start is not None
+    yield (binary, start.address)
+
+
+def test_round_trip(mutex, tmp_path):
+    (binary, start) = mutex
+    path = tmp_path / 'mutex.snap'
+    emulator.take_snapshot(binary, start, path, clock=kernel_clock())
+    (state, memory) = snapshots.load(path)
+
+    assert state['ip'] == start
+    assert state['ii'] == 0
+    assert state['peripherals']['1']['gen_signal']  # The kernel has started the timer
+
+    proc = emulator.boot(memory, clock=kernel_clock())
+    snapshots.restore(proc, state)
+    assert snapshots.capture(proc) == state
+
+    # Open interrupt frames and loops known not to spin
+    state.update(frames=[0x1000], busy_loops=[start])
+    snapshots.restore(proc, state)
+    assert snapshots.capture(proc) == state
+
+    # Writes stay private to the machine
+    memory.write_word(start, 0)
+    assert snapshots.load(path)[1].read_word(start) != 0
+
+
+@pytest.mark.parametrize('engine', emulator.ENGINES)
+def test_resume(engine: str, mutex, tmp_path, capsys):
+    (binary, start) = mutex
+    path = tmp_path / 'mutex.snap'
+    emulator.take_snapshot(binary, start, path, clock=kernel_clock())
+
+    reference = kernel_clock()
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(binary, engine, clock=reference)
+
+    for _ in range(2):
+        clock = kernel_clock()
+
+        with pytest.raises(cpu.Halt):
+            emulator.execute(binary, engine, clock=clock, snapshot=path)
+
+        if engine == 'interp':
+            # Booting is part of the same deterministic run
+            assert clock.now == reference.now
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log') * 3
+
+
+def test_machine(mutex, tmp_path, capsys):
+    (binary, start) = mutex
+    path = tmp_path / 'mutex.snap'
+    emulator.take_snapshot(binary, start, path, clock=kernel_clock())
+
+    with machine.Machine('fused', clock=kernel_clock()) as m:
+        m.load(binary, snapshot=path)
+        assert m.get_register('ip') == start
+        assert m.run().reason == machine.HALT
+
+    with capsys.disabled():
+        assert capsys.readouterr().out == load_file('msasm/mutex/output.log')
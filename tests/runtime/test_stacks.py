@@ -0,0 +1,51 @@
+import pytest
+
+import semu.runtime.cpu as cpu
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+
+from unit_utils import compile_countdown, compile_mutex, create, kernel_clock
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+STACKS = ['kernel.startup::startstack', 'kernel.threads::idlestack', 'app::fs', 'app::ss']
+
+
+def test_marks(with_kernel):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+    with machine.Machine('blocks', clock=kernel_clock(), stacks=True) as m:
+        m.load(binary)
+        assert m.run().reason == machine.HALT
+        marks = m.stack_marks()
+
+    assert len(marks) == len(STACKS)
+
+    for name in STACKS:
+        stack = symbols.find(name)
+        assert stack is not None
+
+        # Threads start at the bottom of their stacks
+        (region,) = [r for r in marks if r.low == stack.address]
+        assert 0 < region.used() < stack.size
+
+
+def test_report(with_kernel, tmp_path, capsys):  # noqa: F811
+    (binary, symbols) = compile_mutex(with_kernel)
+    path = tmp_path / 'stacks.txt'
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, 'fused', clock=kernel_clock(),
+            instruments=emulator.Instruments(symbols=symbols, stacks=path)
+        )
+
+    names = [line.split()[-1] for line in path.read_text().splitlines()]
+    assert names == STACKS
+
+
+def test_untracked():
+    (binary, _) = compile_countdown()
+
+    with create('interp', binary) as m:
+        with pytest.raises(Exception, match='not tracked'):
+            m.stack_marks()
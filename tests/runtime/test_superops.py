@@ -0,0 +1,104 @@
+import pytest
+
+import semu.sasm.asm as asm
+from semu.common.hwconf import ROM_BASE, WORD_SIZE
+import semu.runtime.emulator as emulator
+import semu.runtime.cpu as cpu
+import semu.runtime.superops as superops
+from semu.runtime.memory import Memory
+
+from unit_utils import load_file
+
+
+POINTERS = '''
+STRUCT Pair
+    DW first
+    DW second
+END
+
+ldr &pair a
+ldc 5 b
+PTR a second#Pair c
+mrm b c
+PTR a second#Pair d
+mmr d e
+%assert e 5
+hlt
+
+DS Pair pair
+'''
+
+
+def boot(contents: str) -> cpu.CPU:
+    item = asm.CompilationItem()
+    item.modulename = 'superops'
+    item.contents = contents
+    memory = Memory()
+    emulator.init_memory(memory, asm.compile_items([item]))
+    return cpu.CPU(memory, {})
+
+
+def state(proc: cpu.CPU):
+    return (proc.ip, proc.sp, proc.fp, proc.gp, bytes(proc.memory.data))
+
+
+@pytest.mark.parametrize('contents', [POINTERS, load_file('msasm/locals/locals.sasm')])
+def test_same_results(contents: str):
+    reference = boot(contents)
+
+    with pytest.raises(cpu.Halt):
+        while True:
+            reference.exec_next()
+
+    fused = boot(contents)
+
+    with pytest.raises(cpu.Halt):
+        while True:
+            fused.run(100)
+
+    assert state(fused) == state(reference)
+
+
+def test_recognised():
+    used = set()
+
+    for contents in [POINTERS, load_file('msasm/locals/locals.sasm')]:
+        proc = boot(contents)
+
+        with pytest.raises(cpu.Halt):
+            while True:
+                proc.run(100)
+
+        used.update(op for (_, _, _, op) in proc.predecoded.entries.values())
+
+    assert {superops.LLOAD, superops.LSTORE, superops.PTR, superops.CALL} <= used
+
+
+def test_step_limit():
+    reference = boot(POINTERS)
+    fused = boot(POINTERS)
+
+    with pytest.raises(cpu.Halt):
+        while True:
+            reference.exec_next()
+            assert fused.run(1) == 1
+            assert state(fused) == state(reference)
+
+
+def test_lookahead():
+    # Whatever follows hlt is not cached by a failed match
+    proc = boot('ldc 5 a\nhlt\n')
+    proc.predecode(ROM_BASE)
+    assert list(proc.code.entries) == [ROM_BASE]
+
+    # A matched sequence is, writes to its last instruction drop the fused entry
+    proc = boot(POINTERS)
+
+    with pytest.raises(cpu.Halt):
+        while True:
+            proc.run(100)
+
+    fused = [(a, e) for (a, e) in proc.predecoded.entries.items() if e[3] >= superops.FIRST]
+    (addr, entry) = fused[0]
+    proc.code.invalidate(addr + entry[2] - WORD_SIZE)
+    assert addr not in proc.predecoded.entries
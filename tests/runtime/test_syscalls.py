@@ -0,0 +1,44 @@
+import pytest
+
+import semu.runtime.cpu as cpu
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.common.hwconf import SERIAL_LINE
+
+from unit_utils import compile_mutex, kernel_clock
+from tests.msasm.fixtures import with_kernel, with_hardware  # noqa: F401
+
+
+@pytest.mark.parametrize('engine', ['fused', 'blocks'])
+def test_services(engine: str, with_kernel):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+
+    with machine.Machine(engine, clock=kernel_clock(), syscalls=True) as m:
+        m.load(binary)
+        m.cpu.pp[SERIAL_LINE].captured = []     # type: ignore
+        assert m.run().reason == machine.HALT
+        serial = ''.join(m.cpu.pp[SERIAL_LINE].captured)   # type: ignore
+
+    assert m.syscalls is not None
+    counts = dict(m.syscalls.counts())
+    assert counts['WriteSerial'] == len(serial)
+    assert counts['LockMutex'] == counts['UnlockMutex'] > 0
+    assert counts['Suspend'] >= counts['LockMutex']     # Locking always yields
+
+    for stats in m.syscalls.services.values():
+        assert stats.low is not None and stats.low > 2     # int, a handler and irx
+        assert sum(stats.histogram.values()) == stats.calls
+
+
+def test_report(with_kernel, tmp_path, capsys):  # noqa: F811
+    (binary, _) = compile_mutex(with_kernel)
+    path = tmp_path / 'syscalls.txt'
+
+    with pytest.raises(cpu.Halt):
+        emulator.execute(
+            binary, 'fused', clock=kernel_clock(), instruments=emulator.Instruments(syscalls=path)
+        )
+
+    report = path.read_text()
+    assert 'CreateThread: ' in report
+    assert 'LockMutex: ' in report
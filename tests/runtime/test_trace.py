@@ -0,0 +1,47 @@
+import pytest
+
+import semu.common.ops as ops
+import semu.runtime.cpu as cpu
+import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+import semu.runtime.trace as trace
+from semu.runtime.clock import VirtualClock
+
+from unit_utils import compile_countdown
+
+
+def test_trace(tmp_path):
+    (binary, loop) = compile_countdown()
+    traces = {}
+
+    for stream in [True, False]:
+        path = tmp_path / f'trace{int(stream)}.bin'
+
+        with pytest.raises(cpu.Halt):
+            emulator.execute(
+                binary, 'blocks', clock=VirtualClock(),
+                instruments=emulator.Instruments(trace=path, trace_size=16, trace_stream=stream)
+            )
+
+        traces[stream] = list(trace.read(path))
+
+    (full, ring) = (traces[True], traces[False])
+    assert full[-1].op == ops.HLT
+    assert len([r for r in full if r.ip == loop]) == 10
+    assert trace.format_record(full[3]) == f'0x{loop:08X}  {"sub a b a":24}  sp=0x00000000'
+
+    # The ring keeps the last records, oldest first
+    assert ring == full[-16:]
+
+
+def test_machine(tmp_path):
+    (binary, _) = compile_countdown()
+    path = tmp_path / 'trace.bin'
+
+    with machine.Machine('fused', clock=VirtualClock(), trace=path) as m:
+        m.load(binary)
+        stop = m.run()
+
+    records = list(trace.read(path))
+    assert len(records) == stop.retired
+    assert records[0] == trace.Record(records[0].ip, ops.LDC, (10, 0), 0)
@@ -0,0 +1,13 @@
+# type: ignore
+
+first: int
+second: int
+later: bool
+
+first = perf_counter(0)
+second = perf_counter(0)
+later = second > first
+assert_eq(later, True)
+
+first = perf_counter(4)
+assert_eq(first, 0)
@@ -1,10 +1,59 @@
 from pathlib import Path
+from typing import List, Tuple
 
 import semu.pseudopython.helpers as h
 import semu.pseudopython.compiler as compiler
 
 import semu.sasm.asm as asm
+import semu.sasm.masm as masm
 import semu.runtime.emulator as emulator
+import semu.runtime.machine as machine
+from semu.runtime.clock import VirtualClock
+from semu.common.symbols import SymbolMap
+
+
+COUNTDOWN = '''
+ldc 10 a
+ldc 1 b
+ldr &loop e
+loop:
+    sub a b a
+    add c b c
+    jgt a e
+%assert c {expected}
+hlt
+'''
+
+# Counts three system timer ticks, idling in between
+TICKS = '''
+ldr &handler e
+ldc 4 f
+mrm e f         // system timer vector
+ldc 4096 a
+lsp a
+ldc 1 a
+out a           // enable timer
+opn
+loop:
+    {idle}
+    ldr &loop c
+    jmp c
+handler:
+    ldr &ticks a
+    mmr a b
+    ldc 1 d
+    add b d b
+    mrm b a
+    ldc 2 d
+    sub b d d
+    ldr &done e
+    jgt d e     // the third tick
+    irx
+done:
+    hlt
+
+DW ticks
+'''
 
 
 def find_file(filename: str) -> Path:
@@ -15,7 +64,7 @@ def load_file(filename: str) -> str:
     return find_file(filename).read_text()
 
 
-def execute_single_pp_source(filename):
+def compile_single_pp_source(filename) -> bytes:
     settings = h.CompileSettings().update(verbose=True)
     pypath = find_file(filename)
     pysource = pypath.read_text()
@@ -24,5 +73,44 @@ def execute_single_pp_source(filename):
     item = asm.CompilationItem()
     item.modulename = namespace
     item.contents = sasm
-    binary = asm.compile_items([item])
-    emulator.execute(binary)
+    return asm.compile_items([item])
+
+
+def execute_single_pp_source(filename, engine: str = 'interp'):
+    binary = compile_single_pp_source(filename)
+    emulator.execute(binary, engine)
+
+
+def compile_countdown(expected: int = 10) -> Tuple[bytes, int]:
+    ''' Binary and the address of its loop '''
+    item = asm.CompilationItem()
+    item.modulename = 'countdown'
+    item.contents = COUNTDOWN.format(expected=expected)
+    (binary, symbols) = asm.compile_program([item])
+    loop = symbols.find('countdown::loop')
+    assert loop is not None
+    return (binary, loop.address)
+
+
+def compile_ticks(idle: str) -> bytes:
+    item = asm.CompilationItem()
+    item.modulename = 'ticks'
+    item.contents = TICKS.format(idle=idle)
+    return asm.compile_items([item])
+
+
+def compile_mutex(kernel: List[asm.CompilationItem]) -> Tuple[bytes, SymbolMap]:
+    ''' The mutex application on the items of the with_kernel fixture '''
+    item = masm.collect_file(find_file('msasm/mutex/app.sasm'))
+    return asm.compile_program(kernel + [item])
+
+
+def kernel_clock() -> VirtualClock:
+    ''' Virtual time with timer ticks often enough for the kernel to switch threads '''
+    return VirtualClock(timer_period=2000, nop_cycles=100, serial_cycles=10)
+
+
+def create(engine: str, binary: bytes) -> machine.Machine:
+    m = machine.Machine(engine, clock=VirtualClock())
+    m.load(binary)
+    return m